@@ -0,0 +1,140 @@
+import os
+import json
+import hashlib
+import threading
+
+from almacen_chunks import AlmacenChunks
+
+# ============================
+#  ALMACÉN DE ACTIVOS (PROCESO)
+# ============================
+#
+# Mantiene en memoria los archivos que el pipeline lee en cada poema
+# (perfil estilístico, chunks y prompts). Cada acceso hace un os.stat():
+# si mtime/tamaño no cambian se devuelve la copia en memoria; si cambian,
+# se compara el hash del contenido y solo se vuelve a parsear si difiere.
+#
+# Los valores devueltos se comparten entre sesiones: no deben mutarse.
+
+ACTIVOS_PIPELINE = {
+    "perfil_estilistico": "./estilo/perfil_estilistico_final.md",
+    "chunks_obra": "./data/chunks/chunks_obra.chunks",
+    "chunks_influencias": "./data/chunks/chunks_influencias.chunks",
+    "prompt_maestro": "./prompts/prompt_maestro.txt",
+    "prompt_evaluacion": "./prompts/prompt_evaluacion.txt",
+    "prompt_reescritura": "./prompts/prompt_reescritura.txt",
+    "prompt_pulido": "./prompts/prompt_pulido_final.txt",
+    "prompt_clasificador": "./prompts/prompt_clasificador_tema.txt",
+}
+
+_lock = threading.Lock()
+_activos = {}
+_estadisticas = {"aciertos": 0, "fallos": 0, "recargas": 0}
+
+
+def _firma(ruta):
+    try:
+        st = os.stat(ruta)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _obtener(ruta, tipo, parsear, por_defecto):
+    clave = (os.path.abspath(ruta), tipo)
+    firma = _firma(ruta)
+
+    with _lock:
+        entrada = _activos.get(clave)
+        if entrada is not None and entrada["firma"] == firma:
+            _estadisticas["aciertos"] += 1
+            return entrada["valor"]
+
+    if firma is None:
+        valor, digest = por_defecto, None
+    else:
+        with open(ruta, "rb") as f:
+            crudo = f.read()
+        digest = hashlib.sha1(crudo).hexdigest()
+        if entrada is not None and entrada["hash"] == digest:
+            # Solo ha cambiado el mtime (p. ej. un touch): no se re-parsea.
+            valor = entrada["valor"]
+        else:
+            valor = parsear(crudo.decode("utf-8"))
+
+    with _lock:
+        if entrada is None:
+            _estadisticas["fallos"] += 1
+        else:
+            _estadisticas["recargas"] += 1
+        _activos[clave] = {"firma": firma, "hash": digest, "valor": valor}
+    return valor
+
+
+def obtener_texto(ruta):
+    return _obtener(ruta, "texto", lambda s: s.strip(), "")
+
+
+def obtener_prompt(ruta):
+    return obtener_texto(ruta)
+
+
+def obtener_json(ruta):
+    return _obtener(ruta, "json", json.loads, [])
+
+
+def obtener_chunks(ruta):
+    """Almacén de chunks mapeado (secuencia de str), o la lista del JSON antiguo."""
+    clave = (os.path.abspath(ruta), "chunks")
+    firma = _firma(ruta)
+    if firma is None:
+        return obtener_json(os.path.splitext(ruta)[0] + ".json")
+
+    with _lock:
+        entrada = _activos.get(clave)
+        if entrada is not None and entrada["firma"] == firma:
+            _estadisticas["aciertos"] += 1
+            return entrada["valor"]
+
+    # El almacén anterior no se cierra: puede haber poemas muestreándolo
+    valor = AlmacenChunks(ruta)
+    with _lock:
+        _estadisticas["fallos" if entrada is None else "recargas"] += 1
+        _activos[clave] = {"firma": firma, "hash": None, "valor": valor}
+    return valor
+
+
+def obtener_activos_pipeline():
+    """
+    Devuelve un diccionario con todos los activos que usa el pipeline poético.
+    """
+    activos = {}
+    for nombre, ruta in ACTIVOS_PIPELINE.items():
+        if ruta.endswith(".chunks"):
+            activos[nombre] = obtener_chunks(ruta)
+        elif ruta.endswith(".json"):
+            activos[nombre] = obtener_json(ruta)
+        else:
+            activos[nombre] = obtener_texto(ruta)
+    return activos
+
+
+def precargar():
+    obtener_activos_pipeline()
+    return estadisticas()
+
+
+def estadisticas():
+    with _lock:
+        datos = dict(_estadisticas)
+        datos["entradas"] = len(_activos)
+    total = datos["aciertos"] + datos["fallos"] + datos["recargas"]
+    datos["ratio_aciertos"] = round(datos["aciertos"] / total, 3) if total else 0.0
+    return datos
+
+
+def limpiar():
+    with _lock:
+        _activos.clear()
+        for k in _estadisticas:
+            _estadisticas[k] = 0
@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import mmap
+import struct
+from array import array
+from collections.abc import Sequence
+
+# ============================
+#  ALMACÉN BINARIO DE CHUNKS
+# ============================
+#
+# Los chunks de obra e influencias en un único archivo de solo lectura:
+#
+#   [textos UTF-8 concatenados][offsets uint64 × (n + 1)][n uint64][MAGIA]
+#
+# El índice va al final para poder escribir el archivo de una pasada, sin
+# conocer n de antemano. Al leer se mapea en memoria: abrirlo no parsea ni
+# copia nada, el chunk i se decodifica solo cuando se pide (O(1) por id) y el
+# muestreo aleatorio solo toca los k chunks elegidos. Varios procesos que lo
+# abren comparten las mismas páginas a través de la caché del sistema.
+#
+# El archivo se escribe en un temporal y se sustituye con os.replace: quien
+# tenga mapeada la versión anterior sigue leyéndola sin errores.
+
+MAGIA = b"GULAGCH1"
+_PIE = struct.Struct("<Q8s")
+
+if sys.byteorder != "little":
+    raise ImportError("almacen_chunks asume una plataforma little-endian")
+
+
+class AlmacenChunks(Sequence):
+    """Secuencia de solo lectura de chunks sobre un archivo mapeado en memoria."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with open(ruta, "rb") as f:
+            self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mapa) < _PIE.size:
+            raise ValueError(f"Almacén de chunks truncado: {ruta}")
+        n, magia = _PIE.unpack_from(self._mapa, len(self._mapa) - _PIE.size)
+        inicio_indice = len(self._mapa) - _PIE.size - 8 * (n + 1)
+        if magia != MAGIA or inicio_indice < 0:
+            raise ValueError(f"No es un almacén de chunks: {ruta}")
+
+        vista = memoryview(self._mapa)
+        self._offsets = vista[inicio_indice:len(self._mapa) - _PIE.size].cast("Q")
+        self._datos = vista[:inicio_indice]
+        self._n = n
+
+    def __len__(self):
+        return self._n
+
+    def crudo(self, i):
+        """Bytes UTF-8 del chunk `i` sin copiarlos (memoryview sobre el mapa)."""
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        return self._datos[self._offsets[i]:self._offsets[i + 1]]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._n))]
+        return str(self.crudo(i), "utf-8")
+
+    def __repr__(self):
+        return f"AlmacenChunks({self.ruta!r}, n={self._n})"
+
+
+class EscritorChunks:
+    """
+    Escribe un almacén chunk a chunk. Uso:
+
+        with EscritorChunks(ruta) as escritor:
+            escritor.agregar(texto)
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._temporal = f"{ruta}.tmp"
+        self._offsets = array("Q", [0])
+        self._f = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        self._f = open(self._temporal, "wb")
+        return self
+
+    def agregar(self, texto):
+        datos = texto.encode("utf-8")
+        self._f.write(datos)
+        self._offsets.append(self._offsets[-1] + len(datos))
+
+    def __exit__(self, tipo, valor, traza):
+        try:
+            if tipo is None:
+                self._offsets.tofile(self._f)
+                self._f.write(_PIE.pack(len(self._offsets) - 1, MAGIA))
+                self._f.flush()
+                os.fsync(self._f.fileno())
+        finally:
+            self._f.close()
+        if tipo is None:
+            os.replace(self._temporal, self.ruta)
+        else:
+            os.remove(self._temporal)
+        return False
+
+
+def escribir(textos, ruta):
+    with EscritorChunks(ruta) as escritor:
+        for texto in textos:
+            escritor.agregar(texto)
+
+
+if __name__ == "__main__":
+    # Conversión de un chunks_*.json antiguo: python almacen_chunks.py origen.json destino.chunks
+    if len(sys.argv) != 3:
+        sys.exit("uso: python almacen_chunks.py origen.json destino.chunks")
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        escribir(json.load(f), sys.argv[2])
+    print(AlmacenChunks(sys.argv[2]))
@@ -1,6 +1,7 @@
 import streamlit as st
 import sys
 import os
+import uuid
 
 # Configuración de página debe ser el primer comando de Streamlit para evitar errores
 st.set_page_config(page_title="Generador de Poesía V2", page_icon="✒️", layout="centered")
@@ -8,7 +9,72 @@ st.set_page_config(page_title="Generador de Poesía V2", page_icon="✒️", lay
 # Aseguramos que se pueda importar desde el directorio actual
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from generar_poema import ejecutar_pipeline_poetico
+# Cliente fino: con SERVICIO_URL el pipeline vive en el servicio residente;
+# si no, se carga y calienta una sola vez en este proceso. Los poemas no se
+# ejecutan en el hilo del script: se encolan en la cola compartida del proceso
+from cliente_servicio import estadisticas
+from cola_trabajos import obtener_cola, TrabajoRechazado, TERMINADOS, EN_COLA, COMPLETADO, CANCELADO
+
+INTERVALO_SONDEO_S = 1.0
+
+ETAPAS_UI = {
+    "preparacion": "🔎 Clasificando la intención y recuperando contexto...",
+    "generacion": "✍️ Escribiendo el borrador (Gemini + RAG)...",
+    "reescritura": "🛠️ Reescribiendo según la crítica (Groq)...",
+    "pulido": "✨ Puliendo el poema final (Gemini)...",
+    "imagen": "🎨 Generando imagen...",
+}
+
+def identidad_usuario():
+    """
+    Clave del límite por usuario de la cola: el usuario autenticado si lo hay,
+    si no la IP del cliente (la primera de X-Forwarded-For detrás de un proxy).
+    La sesión solo se usa como último recurso: abrir otra pestaña la renueva.
+    """
+    usuario = getattr(st, "user", None)
+    if usuario is not None and usuario.get("is_logged_in"):
+        clave = usuario.get("email") or usuario.get("sub")
+        if clave:
+            return f"usuario:{clave}"
+
+    contexto = getattr(st, "context", None)
+    cabeceras = getattr(contexto, "headers", None) or {}
+    ip = (cabeceras.get("X-Forwarded-For") or "").split(",")[0].strip()
+    ip = ip or cabeceras.get("X-Real-Ip") or getattr(contexto, "ip_address", None)
+    if ip:
+        return f"ip:{ip}"
+
+    return f"sesion:{st.session_state.setdefault('usuario', uuid.uuid4().hex)}"
+
+@st.fragment(run_every=INTERVALO_SONDEO_S)
+def mostrar_progreso(cola, id_trabajo):
+    """
+    Una consulta por ejecución: pinta el borrador, la crítica y el pulido con
+    los eventos recibidos hasta ahora y, al terminar el trabajo, relanza la
+    página entera para mostrar el resultado.
+    """
+    eventos, estado = cola.esperar(id_trabajo, 0, timeout=0)
+    if estado is None or estado in TERMINADOS:
+        st.rerun()
+
+    if estado == EN_COLA:
+        st.info(f"🕰️ En cola: {cola.posicion(id_trabajo) or 0} trabajo(s) por delante...")
+
+    textos, etapa, critica = {}, None, None
+    for evento in eventos:
+        if evento["tipo"] == "etapa" and evento["estado"] == "inicio":
+            etapa = evento["etapa"]
+            textos[etapa] = ""
+        elif evento["tipo"] == "token":
+            textos[evento["etapa"]] += evento["texto"]
+        elif evento["tipo"] == "critica":
+            critica = evento["critica"]
+
+    if etapa is not None:
+        st.info(ETAPAS_UI.get(etapa, etapa))
+        st.text(textos[etapa])
+    if critica is not None:
+        st.json(critica)
 
 def main():
     st.title("Generador de Poesía V2: Sindar")
@@ -28,6 +94,26 @@ def main():
             index=0
         )
 
+        modo_recuperacion = st.selectbox(
+            "Selección de fragmentos",
+            ["mmr", "semantico", "aleatorio"],
+            index=0
+        )
+
+        stats = estadisticas()
+
+        with st.expander("📦 Caché de activos"):
+            st.json(stats["activos"])
+
+        with st.expander("🧠 Caché de contexto (Gemini)"):
+            st.json(stats["cache_contexto"])
+
+        with st.expander("🔀 Proveedores"):
+            st.json(stats["enrutador"])
+
+        with st.expander("🧵 Cola de trabajos"):
+            st.json(obtener_cola().estadisticas())
+
     # --- Configuración de Parámetros ---
     with st.container():
         col1, col2 = st.columns(2)
@@ -46,6 +132,9 @@ def main():
 
     # --- Botón de Generación ---
     st.markdown("---")
+    cola = obtener_cola()
+    usuario = identidad_usuario()
+
     if st.button("Generar Poema", type="primary", use_container_width=True):
         if not tema:
             st.warning("⚠️ Por favor, escribe un tema para el poema.")
@@ -58,36 +147,58 @@ def main():
                 "extension": extension,
                 "groq_model": groq_model,
                 "google_model": google_model,
+                "modo_recuperacion": modo_recuperacion,
                 "crear_imagen": crear_imagen
             }
+            try:
+                st.session_state["trabajo"] = cola.enviar(params, usuario)
+            except TrabajoRechazado as e:
+                st.warning(f"⏳ No se puede generar ahora: {e}.")
+
+    # El trabajo sobrevive a los reruns de la sesión: se vuelve a pintar desde
+    # sus eventos. Mientras no termine lo consulta un fragmento que se
+    # re-ejecuta solo, sin retener el hilo del script durante todo el poema
+    id_trabajo = st.session_state.get("trabajo")
+    trabajo = cola.obtener(id_trabajo) if id_trabajo else None
+    if trabajo is None:
+        return
+
+    if not trabajo.terminado:
+        if st.button("Cancelar", use_container_width=True):
+            cola.cancelar(id_trabajo)
+        mostrar_progreso(cola, id_trabajo)
+        return
+
+    estado = trabajo.estado
+    if estado == CANCELADO:
+        st.info("🚫 Generación cancelada.")
+        return
+    if estado != COMPLETADO or trabajo.resultado is None:
+        st.error(f"❌ Ocurrió un error: {trabajo.error}")
+        return
+
+    resultado = trabajo.resultado
+    st.success("¡Poema generado con éxito!")
+
+    st.subheader("Poema Final")
+    st.text_area("Resultado", value=resultado["poema_final"], height=500)
+
+    if resultado.get("imagen"):
+        st.subheader("Imagen Generada")
+        st.image(resultado["imagen"], caption="Imagen generada a partir del poema.")
+
+    with st.expander("Ver detalles del proceso"):
+        st.markdown("**1. Poema Inicial (Gemini + RAG):**")
+        st.text(resultado.get("poema_inicial", ""))
+
+        st.markdown("**2. Crítica (Groq):**")
+        st.json(resultado.get("critica_final", {}))
+
+        st.markdown("**3. Poema Corregido:**")
+        st.text(resultado.get("poema_corregido", ""))
 
-            # --- Proceso de Generación ---
-            with st.spinner("🤖 El agente está consultando la obra, escribiendo y puliendo..."):
-                
-                try:
-                    resultado = ejecutar_pipeline_poetico(params)
-                    
-                    st.success("¡Poema generado con éxito!")
-                    
-                    st.subheader("Poema Final")
-                    st.text_area("Resultado", value=resultado["poema_final"], height=500)
-
-                    if resultado.get("imagen"):
-                        st.subheader("Imagen Generada")
-                        st.image(resultado["imagen"], caption="Imagen generada a partir del poema.")
-
-                    with st.expander("Ver detalles del proceso"):
-                        st.markdown("**1. Poema Inicial (Gemini + RAG):**")
-                        st.text(resultado.get("poema_inicial", ""))
-                        
-                        st.markdown("**2. Crítica (Groq):**")
-                        st.json(resultado.get("critica_final", {}))
-                        
-                        st.markdown("**3. Poema Corregido:**")
-                        st.text(resultado.get("poema_corregido", ""))
-                    
-                except Exception as e:
-                    st.error(f"❌ Ocurrió un error: {e}")
+        st.markdown("**4. Métricas (tiempos, tokens, reintentos):**")
+        st.json(resultado.get("metricas", {}))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
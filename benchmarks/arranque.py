@@ -0,0 +1,88 @@
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+# ============================
+#  BENCHMARK DE ARRANQUE
+# ============================
+#
+# Mide con `python -X importtime` lo que cuesta importar cada punto de entrada
+# (CLI, trabajadores por lotes, cliente del servicio) en un proceso limpio y lo
+# compara con su presupuesto. Además comprueba que ninguno arrastra SDKs
+# pesados que solo deben cargarse en el primer uso.
+#
+#   python benchmarks/arranque.py [-n REPETICIONES] [--factor F]
+#
+# Sale con código 1 si algún módulo supera su presupuesto o importa un SDK
+# prohibido.
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milisegundos de importación acumulada (mínimo de las repeticiones)
+PRESUPUESTOS_MS = {
+    "config": 50,
+    "cliente_servicio": 120,
+    "main": 150,
+    "utils_llamadas": 300,
+    "generar_poema": 350,
+    "lote": 350,
+    "generar_datos_iniciales": 350,
+}
+
+# SDKs que ningún punto de entrada debe importar al arrancar
+PROHIBIDOS = ("streamlit", "google.genai", "chromadb", "pypdf", "numpy", "onnxruntime")
+
+
+def medir(modulo):
+    """(ms de importación acumulada, SDKs prohibidos cargados) en un proceso nuevo."""
+    codigo = (
+        f"import sys, json; import {modulo}; "
+        f"print(json.dumps([m for m in {PROHIBIDOS!r} if m in sys.modules]))"
+    )
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo],
+        cwd=RAIZ, capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": RAIZ},
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(f"no se pudo importar {modulo}:\n{proceso.stderr[-2000:]}")
+
+    acumulado = None
+    for linea in proceso.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|\s?(\S+)$", linea)
+        if m and m.group(2) == modulo:
+            acumulado = int(m.group(1)) / 1000
+    return acumulado, json.loads(proceso.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comprueba el presupuesto de tiempo de arranque.")
+    parser.add_argument("-n", "--repeticiones", type=int, default=3)
+    parser.add_argument("--factor", type=float, default=1.0,
+                        help="multiplica los presupuestos (máquinas lentas, CI)")
+    args = parser.parse_args()
+
+    fallos = 0
+    print(f"{'módulo':<26}{'ms':>9}{'presupuesto':>13}  estado")
+    for modulo, presupuesto in PRESUPUESTOS_MS.items():
+        medidas = [medir(modulo) for _ in range(args.repeticiones)]
+        ms = min(m for m, _ in medidas)
+        cargados = medidas[-1][1]
+        limite = presupuesto * args.factor
+
+        estado = "ok"
+        if ms > limite:
+            estado = "LENTO"
+        if cargados:
+            estado = f"IMPORTA {', '.join(cargados)}"
+        fallos += estado != "ok"
+        print(f"{modulo:<26}{ms:>9.1f}{limite:>13.0f}  {estado}")
+
+    sys.exit(1 if fallos else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from calcular_pesos import calcular_pesos
+from tabla_pesos import calcular_pesos_lote, activa_busqueda, obtener_tabla, rejilla
+
+# ============================
+#  RENDIMIENTO DE LOS PESOS
+# ============================
+#
+# Mide perfiles/s de calcular_pesos (la referencia), del lote a partir de
+# diccionarios y de la puntuación de perfiles ya codificados (exploración
+# offline), sobre perfiles muestreados de la rejilla de tabla_pesos, y resume
+# qué fracción de perfiles activaría Brave (γ por encima del umbral) por
+# categoría. La equivalencia con la referencia la comprueba
+# tests/test_tabla_pesos.py.
+#
+#   python benchmarks/pesos.py [-n PERFILES] [--semilla S]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rendimiento de calcular_pesos vectorizado.")
+    parser.add_argument("-n", "--perfiles", type=int, default=100_000)
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    todas = list(rejilla())
+    random.seed(args.semilla)
+    perfiles = random.choices(todas, k=args.perfiles)
+
+    t0 = time.perf_counter()
+    for perfil in perfiles:
+        calcular_pesos(perfil)
+    referencia_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    matriz = calcular_pesos_lote(perfiles)
+    lote_s = time.perf_counter() - t0
+
+    tabla = obtener_tabla()
+    codigos = tabla.codificar(perfiles)
+    t0 = time.perf_counter()
+    tabla.puntuar(codigos)
+    codificados_s = time.perf_counter() - t0
+
+    print(f"referencia:    {args.perfiles / referencia_s:>12,.0f} perfiles/s")
+    print(f"lote:          {args.perfiles / lote_s:>12,.0f} perfiles/s  (x{referencia_s / lote_s:.1f})")
+    print(f"ya codificados:{args.perfiles / codificados_s:>12,.0f} perfiles/s  (x{referencia_s / codificados_s:.1f})")
+
+    mascara = activa_busqueda(matriz)
+    categorias = np.array([str(p.get("categoria")) for p in perfiles])
+    print(f"activan Brave: {mascara.mean():.1%}")
+    for categoria in sorted(set(categorias)):
+        en_categoria = categorias == categoria
+        print(f"  {categoria:<14}{mascara[en_categoria].mean():>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from simulador import Simulador
+
+# ============================
+#  BENCHMARK DEL PIPELINE
+# ============================
+#
+# Ejecuta el pipeline completo contra el simulador local (sin red ni claves) y
+# mide, bajo carga concurrente:
+#   - poemas por minuto
+#   - latencia por poema (p50, p95, máx.)
+#   - llamadas por poema (total y por proveedor), reintentos, espera por 429 y
+#     tiempo en la cola del limitador
+#   - memoria: pico de RSS del proceso y pico de tracemalloc
+#
+#   python benchmarks/pipeline.py -n 40 -c 8 [--perfil perfil.json] [--limites-reales]
+#                                 [--tasa-factual 0.25]
+#                                 [--salida resultado.json] [--comparar base.json]
+#
+# Por defecto los LIMITE_RPM_*/LIMITE_RAFAGA_* se suben muy por encima de la
+# carga (igual que se apaga CACHE_LLM_ACTIVA) para medir el pipeline y no el
+# cupo de los proveedores. Con --limites-reales se mantienen los de limitador;
+# el resultado lo indica en "limites" y --comparar solo compara ejecuciones
+# del mismo tipo.
+#
+# Con --comparar sale con código 1 si poemas/min o el p95 empeoran más que
+# --tolerancia respecto a una ejecución anterior guardada con --salida.
+
+TEMAS = [
+    "La emoción del básquet",
+    "El mar en invierno",
+    "Una ciudad que despierta",
+    "La memoria de una casa vacía",
+]
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return None
+    return ordenados[min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados))) - 1))]
+
+
+def _params(i):
+    return {
+        "estilo": "Estilo libre pero lírico",
+        "tema": TEMAS[i % len(TEMAS)],
+        "tono_extra": "Épico y apasionado",
+        "restricciones": "Sin rima consonante forzada, sin referencias tecnológicas",
+        "extension": "media",
+    }
+
+
+SIN_LIMITE_RPM = "1000000"
+
+
+def ejecutar(n, concurrencia, perfiles=None, semilla=None, limites_reales=False, tasa_factual=0.25):
+    if semilla is not None:
+        random.seed(semilla)
+
+    with Simulador(perfiles, tasa_factual=tasa_factual) as sim:
+        os.environ.update(sim.entorno())
+        # Se mide el pipeline, no la caché de respuestas en disco
+        os.environ.setdefault("CACHE_LLM_ACTIVA", "0")
+        os.environ.setdefault("LOG_NIVEL", "ERROR")
+        if not limites_reales:
+            # Ni el cupo de los proveedores (a no ser que se pida)
+            from limitador import LIMITES
+            for proveedor in LIMITES:
+                os.environ.setdefault(f"LIMITE_RPM_{proveedor.upper()}", SIN_LIMITE_RPM)
+                os.environ.setdefault(f"LIMITE_RAFAGA_{proveedor.upper()}", SIN_LIMITE_RPM)
+
+        # Importar después de apuntar las URLs al simulador
+        from generar_poema import ejecutar_pipeline_poetico
+        import almacen_activos
+        import recuperacion
+
+        almacen_activos.precargar()
+        recuperacion.calentar()
+        ejecutar_pipeline_poetico(_params(0))  # calentamiento, no cuenta
+
+        def uno(i):
+            t0 = time.perf_counter()
+            try:
+                resultado = ejecutar_pipeline_poetico(_params(i))
+                return time.perf_counter() - t0, resultado["metricas"], None
+            except Exception as e:
+                return time.perf_counter() - t0, None, f"{type(e).__name__}: {e}"
+
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+            resultados = list(pool.map(uno, range(n)))
+        duracion = time.perf_counter() - inicio
+        _, pico_tracemalloc = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        latencias = [r[0] for r in resultados if r[2] is None]
+        metricas = [r[1] for r in resultados if r[2] is None]
+        errores = [r[2] for r in resultados if r[2] is not None]
+        llamadas = [l for m in metricas for l in m["llamadas"]]
+        por_proveedor = Counter(l.get("proveedor") or l["nombre"].split(".")[-1] for l in llamadas)
+        ok = len(metricas)
+
+        return {
+            "poemas": n,
+            "concurrencia": concurrencia,
+            "limites": "reales" if limites_reales else "sin limite",
+            "ok": ok,
+            "errores": len(errores),
+            "ejemplos_error": errores[:3],
+            "duracion_s": round(duracion, 3),
+            "poemas_por_minuto": round(ok / duracion * 60, 2) if duracion else None,
+            "latencia_p50_s": round(percentil(latencias, 50), 3) if latencias else None,
+            "latencia_p95_s": round(percentil(latencias, 95), 3) if latencias else None,
+            "latencia_max_s": round(max(latencias), 3) if latencias else None,
+            "llamadas_por_poema": round(len(llamadas) / ok, 2) if ok else None,
+            "llamadas_por_proveedor": {p: round(c / ok, 2) for p, c in por_proveedor.items()} if ok else {},
+            "reintentos_por_poema": round(sum(m["reintentos"] for m in metricas) / ok, 2) if ok else None,
+            "espera_429_s_por_poema": round(sum(m["espera_429_s"] for m in metricas) / ok, 3) if ok else None,
+            "cola_limitador_s_por_poema": round(sum(l.get("cola_s", 0.0) for l in llamadas) / ok, 3) if ok else None,
+            "fallos_formato": sum(m.get("fallos_formato", 0) for m in metricas),
+            "rss_pico_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "tracemalloc_pico_mb": round(pico_tracemalloc / 1024 / 1024, 1),
+            "simulador": sim.stats,
+        }
+
+
+def comparar(actual, base, tolerancia):
+    """Lista de regresiones respecto a `base` (más lento o menos poemas/min)."""
+    regresiones = []
+    if base.get("limites", "reales") != actual["limites"]:
+        print(f"AVISO: no se compara una ejecución con límites {actual['limites']!r} "
+              f"con otra con límites {base.get('limites', 'reales')!r}")
+        return regresiones
+    if base.get("poemas_por_minuto") and actual["poemas_por_minuto"] < base["poemas_por_minuto"] * (1 - tolerancia):
+        regresiones.append(f"poemas/min {base['poemas_por_minuto']} -> {actual['poemas_por_minuto']}")
+    if base.get("latencia_p95_s") and actual["latencia_p95_s"] > base["latencia_p95_s"] * (1 + tolerancia):
+        regresiones.append(f"p95 {base['latencia_p95_s']}s -> {actual['latencia_p95_s']}s")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline poético contra el simulador local.")
+    parser.add_argument("-n", "--poemas", type=int, default=20)
+    parser.add_argument("-c", "--concurrencia", type=int, default=4)
+    parser.add_argument("--perfil", help="JSON con perfiles de proveedor para el simulador")
+    parser.add_argument("--semilla", type=int, default=None)
+    parser.add_argument("--tasa-factual", type=float, default=0.25,
+                        help="fracción de clasificaciones simuladas que activan Brave")
+    parser.add_argument("--limites-reales", action="store_true",
+                        help="mantiene los límites RPM de limitador (resultado acotado por el cupo)")
+    parser.add_argument("--salida", help="guarda el resultado en este JSON")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.10)
+    args = parser.parse_args()
+
+    perfiles = None
+    if args.perfil:
+        with open(args.perfil, "r", encoding="utf-8") as f:
+            perfiles = json.load(f)
+
+    resultado = ejecutar(args.poemas, args.concurrencia, perfiles, args.semilla, args.limites_reales,
+                         args.tasa_factual)
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        regresiones = comparar(resultado, base, args.tolerancia)
+        for r in regresiones:
+            print(f"REGRESIÓN: {r}")
+        sys.exit(1 if regresiones else 0)
+
+
+if __name__ == "__main__":
+    main()
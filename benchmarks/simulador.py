@@ -0,0 +1,354 @@
+import re
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# ============================
+#  SIMULADOR DE PROVEEDORES
+# ============================
+#
+# Servidor HTTP local que imita las APIs que usa el pipeline, para medir sin
+# red ni claves:
+#
+#   /groq/chat/completions        OpenAI-compatible, con y sin stream (SSE)
+#   /deepseek/chat/completions    ídem
+#   /gemini/v1beta/models/{m}:generateContent
+#   /gemini/v1beta/models/{m}:streamGenerateContent?alt=sse
+#   /gemini/v1beta/cachedContents (crear, listar, renovar)
+#   /brave/web/search
+#
+# Cada proveedor tiene un perfil: latencia log-normal (mediana y sigma),
+# tasa de 429 con su retry-after, tasa de JSON inválido y el retardo entre
+# tokens del streaming. Las respuestas son fijas (RESPUESTAS) salvo la
+# puntuación del crítico y la clasificación, que se sortean: con probabilidad
+# `tasa_factual` el clasificador devuelve un perfil factual cuya γ supera
+# UMBRAL_BUSQUEDA, así que parte de los poemas pasan por busqueda/Brave.
+#
+#   with Simulador(perfiles, tasa_factual=0.25) as sim:
+#       os.environ.update(sim.entorno())
+#       ...
+
+PERFIL_POR_DEFECTO = {
+    "groq": {"latencia_mediana_s": 0.35, "latencia_sigma": 0.4, "tasa_429": 0.02,
+             "retry_after_s": 1, "tasa_json_invalido": 0.05, "retardo_token_s": 0.005},
+    "deepseek": {"latencia_mediana_s": 0.8, "latencia_sigma": 0.5, "tasa_429": 0.0,
+                 "retry_after_s": 1, "tasa_json_invalido": 0.02, "retardo_token_s": 0.01},
+    "gemini": {"latencia_mediana_s": 0.6, "latencia_sigma": 0.4, "tasa_429": 0.01,
+               "retry_after_s": 1, "tasa_json_invalido": 0.0, "retardo_token_s": 0.01},
+    "brave": {"latencia_mediana_s": 0.25, "latencia_sigma": 0.3, "tasa_429": 0.0,
+              "retry_after_s": 1},
+}
+
+RESPUESTAS = {
+    "poema": (
+        "La pelota sube como una luna breve\n"
+        "y el tablero guarda el eco de las manos;\n"
+        "en el parqué, la respiración de todos\n"
+        "se vuelve un solo latido que no cae.\n\n"
+        "Queda el aro temblando, quieto el tiempo,\n"
+        "y en la red, un pájaro de cuerda\n"
+        "que canta lo que el marcador no sabe."
+    ),
+    "clasificacion": {
+        "categoria": "conceptual",
+        "tono_emocional": "épico",
+        "nivel_abstraccion": "media",
+        "grado_factualidad": "alta",
+        "densidad_metaforica": "alta",
+        "intencion_poetica": "evocativa",
+    },
+    # Categoría sin base propia + factualidad alta: γ ≈ 0.17 > UMBRAL_BUSQUEDA
+    "clasificacion_factual": {
+        "categoria": "narrativa",
+        "tono_emocional": "épico",
+        "nivel_abstraccion": "baja",
+        "grado_factualidad": "alta",
+        "densidad_metaforica": "media",
+        "intencion_poetica": "descriptiva",
+    },
+    "critica": {
+        "problemas": ["Imagen final algo previsible"],
+        "sugerencias": ["Condensar la segunda estrofa"],
+    },
+    "busqueda": [
+        "El baloncesto fue inventado por James Naismith en 1891.",
+        "Un partido profesional se divide en cuatro cuartos.",
+        "El aro se sitúa a 3,05 metros de altura.",
+    ],
+}
+
+
+def _latencia(perfil):
+    return perfil["latencia_mediana_s"] * math.exp(random.gauss(0, perfil["latencia_sigma"]))
+
+
+def _tokens(texto):
+    return max(1, len(texto) // 4)
+
+
+def _respuesta_json(sistema, prompt, perfil, tasa_factual):
+    if random.random() < perfil.get("tasa_json_invalido", 0.0):
+        return '{"ok": false, "problemas": ['
+    if "crítico" in sistema or "ok (bool" in prompt:
+        puntuacion = round(random.uniform(5.0, 10.0), 1)
+        return json.dumps({"ok": puntuacion >= 9.0, "puntuacion": puntuacion, **RESPUESTAS["critica"]},
+                          ensure_ascii=False)
+    clave = "clasificacion_factual" if random.random() < tasa_factual else "clasificacion"
+    return json.dumps(RESPUESTAS[clave], ensure_ascii=False)
+
+
+def _trozos(texto, n=12):
+    palabras = re.findall(r"\S+\s*", texto)
+    paso = max(1, len(palabras) // n)
+    return ["".join(palabras[i:i + paso]) for i in range(0, len(palabras), paso)]
+
+
+class _Servidor(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # El cliente corta la conexión (stream cerrado a medias, fin del
+        # benchmark): no es un error del simulador y ensuciaría la salida
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class Simulador:
+    def __init__(self, perfiles=None, host="127.0.0.1", puerto=0, tasa_factual=0.25):
+        self.perfiles = {p: {**PERFIL_POR_DEFECTO[p], **(perfiles or {}).get(p, {})} for p in PERFIL_POR_DEFECTO}
+        self.tasa_factual = tasa_factual
+        self.stats = {p: {"peticiones": 0, "errores_429": 0, "json_invalido": 0} for p in PERFIL_POR_DEFECTO}
+        self.caches = {}
+        self._lock = threading.Lock()
+        self.servidor = _Servidor((host, puerto), self._manejador())
+        self._hilo = None
+
+    @property
+    def url(self):
+        host, puerto = self.servidor.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    def entorno(self):
+        """Variables de entorno que apuntan el pipeline al simulador."""
+        return {
+            "GROQ_API_KEY": "simulada", "GOOGLE_API_KEY": "simulada",
+            "DEEPSEEK_API_KEY": "simulada", "BRAVE_API_KEY": "simulada",
+            "GROQ_BASE_URL": f"{self.url}/groq",
+            "DEEPSEEK_BASE_URL": f"{self.url}/deepseek",
+            "GOOGLE_BASE_URL": f"{self.url}/gemini",
+            "BRAVE_BASE_URL": f"{self.url}/brave",
+        }
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self.servidor.serve_forever, daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.detener()
+
+    def _contar(self, proveedor, clave):
+        with self._lock:
+            self.stats[proveedor][clave] += 1
+
+    def _manejador(self):
+        sim = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, formato, *args):
+                pass
+
+            # --- utilidades ---
+            def _cuerpo(self):
+                longitud = int(self.headers.get("Content-Length", 0))
+                return json.loads(self.rfile.read(longitud) or b"{}")
+
+            def _json(self, codigo, datos, cabeceras=None):
+                cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+                self.send_response(codigo)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(cuerpo)))
+                for k, v in (cabeceras or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def _sse(self, eventos, retardo, terminar=None):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for evento in eventos:
+                    time.sleep(retardo)
+                    self.wfile.write(f"data: {json.dumps(evento, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                if terminar:
+                    self.wfile.write(f"data: {terminar}\n\n".encode("utf-8"))
+                self.close_connection = True
+
+            def _esperar(self, proveedor):
+                """Latencia y 429 simulados; devuelve False si ya se respondió 429."""
+                perfil = sim.perfiles[proveedor]
+                sim._contar(proveedor, "peticiones")
+                if random.random() < perfil["tasa_429"]:
+                    sim._contar(proveedor, "errores_429")
+                    self._json(429, {"error": {"message": "rate limit (simulado)"}},
+                               {"retry-after": str(perfil["retry_after_s"])})
+                    return False
+                time.sleep(_latencia(perfil))
+                return True
+
+            # --- rutas ---
+            def do_POST(self):
+                ruta = urlparse(self.path)
+                if ruta.path in ("/groq/chat/completions", "/deepseek/chat/completions"):
+                    return self._chat(ruta.path.split("/")[1])
+                m = re.match(r"^/gemini/v1beta/(models/[^:]+):(generateContent|streamGenerateContent)$", ruta.path)
+                if m:
+                    return self._gemini(m.group(1), m.group(2) == "streamGenerateContent")
+                if ruta.path == "/gemini/v1beta/cachedContents":
+                    return self._crear_cache()
+                self._json(404, {"error": {"message": f"ruta desconocida: {ruta.path}"}})
+
+            def do_GET(self):
+                ruta = urlparse(self.path)
+                if ruta.path == "/brave/web/search":
+                    return self._brave(parse_qs(ruta.query))
+                if ruta.path == "/gemini/v1beta/cachedContents":
+                    with sim._lock:
+                        return self._json(200, {"cachedContents": list(sim.caches.values())})
+                if ruta.path == "/_stats":
+                    return self._json(200, sim.stats)
+                self._json(404, {"error": {"message": f"ruta desconocida: {ruta.path}"}})
+
+            def do_PATCH(self):
+                nombre = urlparse(self.path).path[len("/gemini/v1beta/"):]
+                self._cuerpo()
+                with sim._lock:
+                    cache = sim.caches.get(nombre)
+                    if cache:
+                        cache["expireTime"] = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+                if cache is None:
+                    return self._json(404, {"error": {"message": "caché inexistente"}})
+                self._json(200, cache)
+
+            def _chat(self, proveedor):
+                cuerpo = self._cuerpo()
+                if not self._esperar(proveedor):
+                    return
+                mensajes = cuerpo.get("messages", [])
+                sistema = next((m["content"] for m in mensajes if m["role"] == "system"), "")
+                prompt = mensajes[-1]["content"] if mensajes else ""
+                if cuerpo.get("response_format", {}).get("type") == "json_object":
+                    texto = _respuesta_json(sistema, prompt, sim.perfiles[proveedor], sim.tasa_factual)
+                    if texto.endswith("["):
+                        sim._contar(proveedor, "json_invalido")
+                else:
+                    texto = RESPUESTAS["poema"]
+                uso = {"prompt_tokens": _tokens(sistema + prompt), "completion_tokens": _tokens(texto)}
+
+                if not cuerpo.get("stream"):
+                    return self._json(200, {
+                        "id": uuid.uuid4().hex, "object": "chat.completion", "model": cuerpo.get("model"),
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": texto},
+                                     "finish_reason": "stop"}],
+                        "usage": uso,
+                    })
+                eventos = [{"choices": [{"index": 0, "delta": {"content": t}}]} for t in _trozos(texto)]
+                eventos.append({"choices": [], "usage": uso})
+                self._sse(eventos, sim.perfiles[proveedor]["retardo_token_s"], terminar="[DONE]")
+
+            def _gemini(self, modelo, stream):
+                cuerpo = self._cuerpo()
+                if not self._esperar("gemini"):
+                    return
+                prompt = "".join(p.get("text", "") for c in cuerpo.get("contents", []) for p in c.get("parts", []))
+                config = cuerpo.get("generationConfig", {})
+                if config.get("responseMimeType") == "application/json":
+                    texto = _respuesta_json("", prompt, sim.perfiles["gemini"], sim.tasa_factual)
+                else:
+                    texto = RESPUESTAS["poema"]
+
+                cacheados = 0
+                with sim._lock:
+                    cache = sim.caches.get(cuerpo.get("cachedContent"))
+                    if cache:
+                        cacheados = cache["usageMetadata"]["totalTokenCount"]
+                uso = {"promptTokenCount": _tokens(prompt) + cacheados, "candidatesTokenCount": _tokens(texto),
+                       "cachedContentTokenCount": cacheados}
+
+                def respuesta(parte, con_uso):
+                    datos = {"candidates": [{"content": {"role": "model", "parts": [{"text": parte}]}}],
+                             "modelVersion": modelo.split("/")[-1]}
+                    if con_uso:
+                        datos["usageMetadata"] = uso
+                    return datos
+
+                if not stream:
+                    return self._json(200, respuesta(texto, True))
+                trozos = _trozos(texto)
+                self._sse([respuesta(t, i == len(trozos) - 1) for i, t in enumerate(trozos)],
+                          sim.perfiles["gemini"]["retardo_token_s"])
+
+            def _crear_cache(self):
+                cuerpo = self._cuerpo()
+                texto = "".join(p.get("text", "") for c in cuerpo.get("contents", []) for p in c.get("parts", []))
+                cache = {
+                    "name": f"cachedContents/{uuid.uuid4().hex[:12]}",
+                    "model": cuerpo.get("model"),
+                    "displayName": cuerpo.get("displayName"),
+                    "expireTime": (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat(),
+                    "usageMetadata": {"totalTokenCount": _tokens(texto)},
+                }
+                with sim._lock:
+                    sim.caches[cache["name"]] = cache
+                self._json(200, cache)
+
+            def _brave(self, consulta):
+                if not self._esperar("brave"):
+                    return
+                k = int(consulta.get("count", ["5"])[0])
+                self._json(200, {"web": {"results": [{"description": d} for d in RESPUESTAS["busqueda"][:k]]}})
+
+        return Manejador
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulador local de Groq, Gemini, DeepSeek y Brave.")
+    parser.add_argument("--puerto", type=int, default=8790)
+    parser.add_argument("--perfil", help="JSON con perfiles por proveedor (se mezclan con los de por defecto)")
+    parser.add_argument("--tasa-factual", type=float, default=0.25,
+                        help="fracción de clasificaciones que activan la búsqueda en Brave")
+    args = parser.parse_args()
+
+    perfiles = None
+    if args.perfil:
+        with open(args.perfil, "r", encoding="utf-8") as f:
+            perfiles = json.load(f)
+    sim = Simulador(perfiles, puerto=args.puerto, tasa_factual=args.tasa_factual)
+    print("=== Simulador en marcha. Variables de entorno: ===")
+    for k, v in sim.entorno().items():
+        print(f"{k}={v}")
+    try:
+        sim.servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,15 +1,22 @@
-import requests
+import limitador
+import trazas
 import os
+from config import BRAVE_BASE_URL
 
 BRAVE_API_KEY = os.getenv("BRAVE_API_KEY")
 
 def brave_search(query, k=5):
-    url = "https://api.search.brave.com/res/v1/web/search"
-    headers = {"X-Subscription-Token": BRAVE_API_KEY}
+    url = f"{BRAVE_BASE_URL}/web/search"
+    headers = {"X-Subscription-Token": BRAVE_API_KEY or os.getenv("BRAVE_API_KEY")}
     params = {"q": query, "count": k}
 
-    resp = requests.get(url, headers=headers, params=params)
-    data = resp.json()
+    with trazas.span("http.brave", proveedor="brave") as span:
+        resp = limitador.solicitar("brave", "GET", url, headers=headers, params=params)
+        trazas.registrar_http(span, getattr(resp, "metricas_llamada", None))
+        # Un 4xx (clave inválida, cuota) o un 5xx tras los reintentos también trae
+        # JSON: sin comprobar el estado se leería como "sin resultados"
+        resp.raise_for_status()
+        data = resp.json()
 
     resultados = []
     for item in data.get("web", {}).get("results", []):
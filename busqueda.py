@@ -0,0 +1,155 @@
+import time
+import threading
+import contextvars
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as TiempoAgotado
+
+import trazas
+from brave_search import brave_search
+from config import get_config
+from registro import obtener_logger
+
+# ============================
+#  CACHÉ DE BÚSQUEDA (BRAVE)
+# ============================
+#
+# Capa delante de brave_search para el contexto factual del pipeline. Los temas
+# populares se repiten, así que los resultados se indexan por la consulta
+# normalizada (NFKD sin diacríticos, casefold y espacios colapsados): "El Mar",
+# "el mar " y "él már" comparten entrada.
+#
+#   BUSQUEDA_FRESCA_S       durante este tiempo se sirve sin más (6 h)
+#   BUSQUEDA_TTL            pasado BUSQUEDA_FRESCA_S y hasta el TTL se sirve el
+#                           resultado viejo y se refresca en segundo plano;
+#                           después se expulsa (24 h)
+#   BUSQUEDA_MAX_ENTRADAS   tamaño máximo, se expulsa la menos usada (512)
+#   BUSQUEDA_PRESUPUESTO_S  espera máxima del pipeline por una búsqueda sin
+#                           caché (3 s)
+#
+# Si el presupuesto se agota, `buscar` devuelve [] y el pipeline sigue sin
+# contexto factual; la petición continúa en segundo plano y deja el resultado
+# en la caché para el siguiente poema. Un error de Brave tampoco detiene el
+# poema (se registra y se devuelve []) y nunca entra en la caché. Peticiones
+# simultáneas de la misma consulta comparten una sola llamada a Brave.
+
+BUSQUEDA_FRESCA_S = float(get_config("BUSQUEDA_FRESCA_S", str(6 * 3600)))
+BUSQUEDA_TTL = float(get_config("BUSQUEDA_TTL", str(24 * 3600)))
+BUSQUEDA_MAX_ENTRADAS = int(get_config("BUSQUEDA_MAX_ENTRADAS", "512"))
+BUSQUEDA_PRESUPUESTO_S = float(get_config("BUSQUEDA_PRESUPUESTO_S", "3"))
+
+log = obtener_logger("busqueda")
+
+_lock = threading.Lock()
+_entradas = OrderedDict()   # clave -> (resultados, creado)
+_en_vuelo = {}              # clave -> Future
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="busqueda")
+_estadisticas = {"aciertos": 0, "obsoletos": 0, "fallos": 0, "agotadas": 0, "refrescos": 0, "errores": 0, "expulsiones": 0}
+
+
+def normalizar_consulta(consulta):
+    texto = unicodedata.normalize("NFKD", consulta)
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.casefold().split())
+
+
+def _guardar(clave, resultados):
+    with _lock:
+        _entradas[clave] = (resultados, time.time())
+        _entradas.move_to_end(clave)
+        while len(_entradas) > BUSQUEDA_MAX_ENTRADAS:
+            _entradas.popitem(last=False)
+            _estadisticas["expulsiones"] += 1
+
+
+def _consultar(clave, consulta, k):
+    try:
+        resultados = brave_search(consulta, k=k)
+    except Exception:
+        with _lock:
+            _estadisticas["errores"] += 1
+        raise
+    else:
+        _guardar(clave, resultados)
+        return resultados
+    finally:
+        with _lock:
+            _en_vuelo.pop(clave, None)
+
+
+def _lanzar(clave, consulta, k):
+    """Future de la búsqueda de `clave`, reutilizando la que ya esté en vuelo."""
+    with _lock:
+        futuro = _en_vuelo.get(clave)
+        if futuro is None:
+            futuro = _pool.submit(contextvars.copy_context().run, _consultar, clave, consulta, k)
+            _en_vuelo[clave] = futuro
+        return futuro
+
+
+def _refrescar(clave, consulta, k):
+    def registrar_error(futuro):
+        if futuro.exception() is not None:
+            log.warning("no se pudo refrescar la búsqueda",
+                        extra={"datos": {"consulta": consulta, "error": str(futuro.exception())}})
+
+    with _lock:
+        _estadisticas["refrescos"] += 1
+    _lanzar(clave, consulta, k).add_done_callback(registrar_error)
+
+
+def buscar(consulta, k=5, presupuesto_s=None):
+    """
+    Hasta `k` descripciones de Brave para `consulta`, de la caché si es posible.
+    Devuelve [] si no hay caché y la búsqueda falla o no termina en `presupuesto_s`.
+    """
+    presupuesto_s = BUSQUEDA_PRESUPUESTO_S if presupuesto_s is None else presupuesto_s
+    clave = f"{k}:{normalizar_consulta(consulta)}"
+    ahora = time.time()
+
+    with trazas.span("busqueda.cache") as span:
+        with _lock:
+            entrada = _entradas.get(clave)
+            if entrada is not None and ahora - entrada[1] > BUSQUEDA_TTL:
+                del _entradas[clave]
+                entrada = None
+            if entrada is not None:
+                _entradas.move_to_end(clave)
+                fresca = ahora - entrada[1] <= BUSQUEDA_FRESCA_S
+                _estadisticas["aciertos" if fresca else "obsoletos"] += 1
+            else:
+                _estadisticas["fallos"] += 1
+
+        if entrada is not None:
+            span.fijar(estado="acierto" if fresca else "obsoleto")
+            if not fresca:
+                _refrescar(clave, consulta, k)
+            return entrada[0]
+
+        try:
+            resultados = _lanzar(clave, consulta, k).result(timeout=presupuesto_s)
+        except TiempoAgotado:
+            with _lock:
+                _estadisticas["agotadas"] += 1
+            span.fijar(estado="agotada")
+            log.warning("búsqueda fuera de presupuesto, se sigue sin contexto factual",
+                        extra={"datos": {"consulta": consulta, "presupuesto_s": presupuesto_s}})
+            return []
+        except Exception as e:
+            # Ya contado en "errores" por _consultar
+            span.fijar(estado="error")
+            log.warning("búsqueda fallida, se sigue sin contexto factual",
+                        extra={"datos": {"consulta": consulta, "error": f"{type(e).__name__}: {e}"}})
+            return []
+        span.fijar(estado="fallo")
+        return resultados
+
+
+def invalidar():
+    with _lock:
+        _entradas.clear()
+
+
+def estadisticas():
+    with _lock:
+        return {**_estadisticas, "entradas": len(_entradas), "en_vuelo": len(_en_vuelo)}
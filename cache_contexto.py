@@ -0,0 +1,208 @@
+import time
+import hashlib
+import threading
+from concurrent.futures import Future
+
+from config import get_config
+from registro import obtener_logger
+
+# ============================
+#  CACHÉ DE CONTEXTO (GEMINI)
+# ============================
+#
+# El perfil estilístico es un prefijo idéntico en todas las llamadas de
+# generación y pulido. Con la API `caches` de google-genai se sube una vez por
+# versión del perfil (hash del texto + modelo) y las llamadas siguientes solo
+# envían la parte variable, referenciando la caché por su nombre. El TTL se
+# renueva cuando queda menos de la mitad, y el display_name permite reutilizar
+# la caché entre sesiones (se busca con caches.list antes de crear otra).
+#
+#   GEMINI_CACHE_CONTEXTO   google | local | no   (por defecto google)
+#   GEMINI_CACHE_TTL        segundos de vida de cada caché (por defecto 3600)
+#
+# El backend local registra los prefijos en memoria y se usa en pruebas, sin
+# clave de Google o si se pide explícitamente: quien llama envía entonces el
+# prefijo completo. Si el proveedor rechaza la caché (modelo sin soporte,
+# prefijo por debajo del mínimo de tokens...), se recuerda durante un TTL y se
+# envía el prefijo completo sin reintentar en cada petición.
+
+GEMINI_CACHE_CONTEXTO = str(get_config("GEMINI_CACHE_CONTEXTO", "google")).lower()
+GEMINI_CACHE_TTL = int(get_config("GEMINI_CACHE_TTL", "3600"))
+PREFIJO_NOMBRE = "gulag-contexto-"
+PREFIJO_LOCAL = "local/"
+
+log = obtener_logger("cache_contexto")
+
+_lock = threading.Lock()
+_registro = None
+
+
+def clave(prefijo, modelo):
+    return hashlib.sha256(f"{modelo}\n{prefijo}".encode("utf-8")).hexdigest()
+
+
+class BackendGoogle:
+    def __init__(self, cliente):
+        from google.genai import types
+        self.cliente = cliente
+        self.types = types
+
+    def buscar(self, etiqueta, modelo):
+        """Caché creada en otra sesión con la misma etiqueta: (nombre, expira)."""
+        for cache in self.cliente.caches.list():
+            if cache.display_name == etiqueta and (cache.model or "").endswith(modelo):
+                expira = cache.expire_time.timestamp() if cache.expire_time else time.time()
+                return cache.name, expira
+        return None
+
+    def crear(self, etiqueta, modelo, prefijo, ttl):
+        cache = self.cliente.caches.create(
+            model=modelo,
+            config=self.types.CreateCachedContentConfig(
+                display_name=etiqueta, contents=[prefijo], ttl=f"{ttl}s"
+            )
+        )
+        return cache.name
+
+    def renovar(self, nombre, ttl):
+        self.cliente.caches.update(
+            name=nombre, config=self.types.UpdateCachedContentConfig(ttl=f"{ttl}s")
+        )
+
+
+class BackendLocal:
+    def __init__(self):
+        self.prefijos = {}
+
+    def buscar(self, etiqueta, modelo):
+        return None
+
+    def crear(self, etiqueta, modelo, prefijo, ttl):
+        nombre = PREFIJO_LOCAL + etiqueta
+        self.prefijos[nombre] = prefijo
+        return nombre
+
+    def renovar(self, nombre, ttl):
+        pass
+
+
+class RegistroCaches:
+    """Cachés por (modelo, prefijo) con renovación de TTL; seguro entre hilos."""
+
+    def __init__(self, backend, ttl=GEMINI_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._entradas = {}   # clave -> (nombre o None, expira)
+        self._en_vuelo = {}   # clave -> Future con el nombre
+        self._lock = threading.Lock()
+        self._stats = {"creadas": 0, "reutilizadas": 0, "renovadas": 0, "recuperadas": 0, "fallos": 0}
+
+    def obtener(self, prefijo, modelo):
+        """Nombre de la caché para el prefijo, o None si hay que enviarlo entero."""
+        k = clave(prefijo, modelo)
+        etiqueta = PREFIJO_NOMBRE + k[:32]
+        # Se decide con el lock tomado; las llamadas al proveedor van fuera. Una
+        # sola petición en vuelo por clave: el resto espera su resultado o, si
+        # solo se está renovando, usa el nombre vigente sin esperar.
+        with self._lock:
+            ahora = time.time()
+            nombre, expira = self._entradas.get(k, (None, 0.0))
+            en_vuelo = self._en_vuelo.get(k)
+
+            if expira > ahora:
+                if nombre is None:
+                    # Rechazada hace poco por el proveedor
+                    return None
+                self._stats["reutilizadas"] += 1
+                if expira - ahora >= self.ttl / 2 or en_vuelo is not None:
+                    return nombre
+                futuro = self._en_vuelo[k] = Future()
+                tarea = lambda: self._renovar(k, nombre)
+            elif en_vuelo is not None:
+                futuro, tarea = en_vuelo, None
+            else:
+                futuro = self._en_vuelo[k] = Future()
+                tarea = lambda: self._resolver(k, etiqueta, prefijo, modelo)
+
+        if tarea is None:
+            return futuro.result()
+
+        resultado = None
+        try:
+            resultado = tarea()
+        finally:
+            with self._lock:
+                self._en_vuelo.pop(k, None)
+            futuro.set_result(resultado)
+        return resultado
+
+    def _renovar(self, k, nombre):
+        try:
+            self.backend.renovar(nombre, self.ttl)
+        except Exception as e:
+            log.warning("no se pudo renovar la caché de contexto",
+                        extra={"datos": {"cache": nombre, "error": str(e)}})
+            with self._lock:
+                self._entradas.pop(k, None)
+            return None
+        with self._lock:
+            self._entradas[k] = (nombre, time.time() + self.ttl)
+            self._stats["renovadas"] += 1
+        return nombre
+
+    def _resolver(self, k, etiqueta, prefijo, modelo):
+        ahora = time.time()
+        try:
+            encontrada = self.backend.buscar(etiqueta, modelo)
+            if encontrada and encontrada[1] > ahora:
+                nombre, expira = encontrada
+                estadistica = "recuperadas"
+            else:
+                nombre, expira = self.backend.crear(etiqueta, modelo, prefijo, self.ttl), ahora + self.ttl
+                estadistica = "creadas"
+                log.info("caché de contexto creada", extra={"datos": {
+                    "cache": nombre, "modelo": modelo, "longitud": len(prefijo),
+                }})
+        except Exception as e:
+            estadistica = "fallos"
+            log.warning("caché de contexto no disponible, se envía el prefijo completo",
+                        extra={"datos": {"modelo": modelo, "error": str(e)}})
+            nombre, expira = None, ahora + self.ttl
+
+        with self._lock:
+            self._stats[estadistica] += 1
+            self._entradas[k] = (nombre, expira)
+        return nombre
+
+    def invalidar(self, prefijo, modelo):
+        """Olvida la caché (p. ej. expiró en el servidor antes de lo previsto)."""
+        with self._lock:
+            self._entradas.pop(clave(prefijo, modelo), None)
+
+    def estadisticas(self):
+        with self._lock:
+            return {**self._stats, "entradas": len(self._entradas),
+                    "backend": type(self.backend).__name__}
+
+
+def es_local(nombre):
+    return bool(nombre) and nombre.startswith(PREFIJO_LOCAL)
+
+
+def obtener_registro(cliente=None):
+    """Registro compartido del proceso; None si la caché está desactivada."""
+    global _registro
+    if GEMINI_CACHE_CONTEXTO == "no":
+        return None
+    with _lock:
+        if _registro is None:
+            if GEMINI_CACHE_CONTEXTO == "google" and cliente is not None:
+                backend = BackendGoogle(cliente)
+            else:
+                backend = BackendLocal()
+            _registro = RegistroCaches(backend)
+        return _registro
+
+
+def estadisticas():
+    return _registro.estadisticas() if _registro else {}
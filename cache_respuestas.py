@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from config import get_config
+
+# ============================
+#  CACHÉ DE RESPUESTAS LLM
+# ============================
+#
+# Caché en disco (SQLite) para etapas deterministas: mismo proveedor, modelo,
+# prompts y temperatura => misma respuesta sin gastar round-trip ni cupo.
+# Es opt-in por llamada (`cache="<etapa>"`), solo a temperatura 0 (con
+# muestreo se congelaría una sola muestra durante el TTL) y las etapas
+# creativas nunca se cachean aunque se pida.
+
+CACHE_LLM_RUTA = get_config("CACHE_LLM_RUTA", "./data/cache/respuestas_llm.sqlite3")
+CACHE_LLM_TTL = float(get_config("CACHE_LLM_TTL", str(7 * 24 * 3600)))
+CACHE_LLM_MAX_MB = float(get_config("CACHE_LLM_MAX_MB", "50"))
+CACHE_LLM_ACTIVA = str(get_config("CACHE_LLM_ACTIVA", "1")).lower() in ("1", "true", "si", "sí")
+
+ETAPAS_SIN_CACHE = {"generacion", "reescritura", "pulido", "imagen"}
+
+_lock = threading.Lock()
+_conexion = None
+_estadisticas = {"aciertos": 0, "fallos": 0, "expulsiones": 0}
+
+
+def _conectar():
+    global _conexion
+    if _conexion is None:
+        os.makedirs(os.path.dirname(CACHE_LLM_RUTA) or ".", exist_ok=True)
+        _conexion = sqlite3.connect(CACHE_LLM_RUTA, check_same_thread=False)
+        _conexion.execute("PRAGMA journal_mode=WAL")
+        _conexion.execute(
+            "CREATE TABLE IF NOT EXISTS respuestas ("
+            " clave TEXT PRIMARY KEY, valor TEXT NOT NULL,"
+            " creado REAL NOT NULL, accedido REAL NOT NULL, tamano INTEGER NOT NULL)"
+        )
+        _conexion.execute("CREATE INDEX IF NOT EXISTS idx_accedido ON respuestas(accedido)")
+        _conexion.commit()
+    return _conexion
+
+
+def habilitada(etapa, temperatura):
+    return bool(etapa) and CACHE_LLM_ACTIVA and etapa not in ETAPAS_SIN_CACHE and temperatura == 0
+
+
+def clave(proveedor, modelo, system_prompt, prompt, temperatura):
+    crudo = json.dumps([proveedor, modelo, system_prompt or "", prompt, temperatura], ensure_ascii=False)
+    return hashlib.sha256(crudo.encode("utf-8")).hexdigest()
+
+
+def obtener(k):
+    ahora = time.time()
+    with _lock:
+        con = _conectar()
+        fila = con.execute("SELECT valor, creado FROM respuestas WHERE clave = ?", (k,)).fetchone()
+        if fila is None or ahora - fila[1] > CACHE_LLM_TTL:
+            if fila is not None:
+                con.execute("DELETE FROM respuestas WHERE clave = ?", (k,))
+                con.commit()
+            _estadisticas["fallos"] += 1
+            return None
+        con.execute("UPDATE respuestas SET accedido = ? WHERE clave = ?", (ahora, k))
+        con.commit()
+        _estadisticas["aciertos"] += 1
+        return fila[0]
+
+
+def guardar(k, valor):
+    ahora = time.time()
+    tamano = len(valor.encode("utf-8"))
+    with _lock:
+        con = _conectar()
+        con.execute(
+            "INSERT OR REPLACE INTO respuestas (clave, valor, creado, accedido, tamano) VALUES (?, ?, ?, ?, ?)",
+            (k, valor, ahora, ahora, tamano)
+        )
+        _expulsar(con, ahora)
+        con.commit()
+
+
+def _expulsar(con, ahora):
+    """Borra lo caducado y, si se supera el tamaño máximo, lo menos usado (LRU)."""
+    cur = con.execute("DELETE FROM respuestas WHERE creado < ?", (ahora - CACHE_LLM_TTL,))
+    _estadisticas["expulsiones"] += cur.rowcount
+
+    limite = CACHE_LLM_MAX_MB * 1024 * 1024
+    total = con.execute("SELECT COALESCE(SUM(tamano), 0) FROM respuestas").fetchone()[0]
+    if total <= limite:
+        return
+    for k, tamano in con.execute("SELECT clave, tamano FROM respuestas ORDER BY accedido ASC").fetchall():
+        con.execute("DELETE FROM respuestas WHERE clave = ?", (k,))
+        _estadisticas["expulsiones"] += 1
+        total -= tamano
+        if total <= limite:
+            break
+
+
+def estadisticas():
+    with _lock:
+        datos = dict(_estadisticas)
+        if _conexion is not None:
+            datos["entradas"] = _conexion.execute("SELECT COUNT(*) FROM respuestas").fetchone()[0]
+    return datos
+
+
+def vaciar():
+    with _lock:
+        con = _conectar()
+        con.execute("DELETE FROM respuestas")
+        con.commit()
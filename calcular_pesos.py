@@ -1,3 +1,6 @@
+# γ por encima de este valor activa la búsqueda factual (Brave)
+UMBRAL_BUSQUEDA = 0.15
+
 def normalizar(pesos):
     total = sum(pesos.values())
     if total == 0:
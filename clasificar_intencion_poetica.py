@@ -1,5 +1,5 @@
-import json
-from utils_llamadas import llamar_groq, cargar_prompt
+from salida_estructurada import llamar_json, SalidaInvalida, ESQUEMA_CLASIFICACION
+from almacen_activos import ACTIVOS_PIPELINE, obtener_prompt
 
 def clasificar_intencion_poetica(tema, estilo_extra, tono_extra, restricciones, extension):
     """
@@ -7,7 +7,7 @@ def clasificar_intencion_poetica(tema, estilo_extra, tono_extra, restricciones,
     Devuelve un diccionario con la clasificación completa.
     """
 
-    prompt_base = cargar_prompt("./prompts/prompt_clasificador_tema.txt")
+    prompt_base = obtener_prompt(ACTIVOS_PIPELINE["prompt_clasificador"])
 
     prompt = prompt_base.replace("{tema}", tema)\
                         .replace("{estilo_extra}", estilo_extra)\
@@ -16,18 +16,12 @@ def clasificar_intencion_poetica(tema, estilo_extra, tono_extra, restricciones,
                         .replace("{extension}", extension)
 
     # Puedes elegir Groq o Google. Aquí uso Groq por consistencia.
-    respuesta = llamar_groq(
-        prompt,
-        system_prompt="Eres un analista literario experto. Responde estrictamente en JSON."
-    )
-
-    # Extraer JSON de la respuesta
     try:
-        start = respuesta.find("{")
-        end = respuesta.rfind("}") + 1
-        if start != -1 and end != 0:
-            return json.loads(respuesta[start:end])
-    except:
+        return llamar_json(
+            prompt, ESQUEMA_CLASIFICACION, "clasificacion",
+            system_prompt="Eres un analista literario experto. Responde estrictamente en JSON."
+        )
+    except SalidaInvalida:
         pass
 
     # Fallback seguro
@@ -0,0 +1,72 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import get_config
+
+# ============================
+#  SESIONES HTTP COMPARTIDAS
+# ============================
+#
+# Una requests.Session por proveedor, con pool de conexiones keep-alive,
+# para no pagar un handshake TCP+TLS en cada llamada. Todas las peticiones
+# llevan timeout explícito (conexión, lectura).
+
+PROVEEDORES = {
+    # proveedor: (tamaño del pool, timeout de conexión, timeout de lectura)
+    "groq": (10, 5.0, 120.0),
+    "deepseek": (4, 5.0, 180.0),
+    "brave": (4, 3.0, 10.0),
+}
+
+_lock = threading.Lock()
+_sesiones = {}
+
+
+def _ajustes(proveedor):
+    pool, conexion, lectura = PROVEEDORES.get(proveedor, (4, 5.0, 60.0))
+    clave = proveedor.upper()
+    return (
+        int(get_config(f"HTTP_POOL_{clave}", pool)),
+        float(get_config(f"HTTP_TIMEOUT_CONEXION_{clave}", conexion)),
+        float(get_config(f"HTTP_TIMEOUT_LECTURA_{clave}", lectura)),
+    )
+
+
+def obtener_sesion(proveedor):
+    with _lock:
+        sesion = _sesiones.get(proveedor)
+        if sesion is None:
+            pool, _, _ = _ajustes(proveedor)
+            sesion = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=pool)
+            sesion.mount("https://", adaptador)
+            sesion.mount("http://", adaptador)
+            _sesiones[proveedor] = sesion
+        return sesion
+
+
+def timeout_de(proveedor):
+    _, conexion, lectura = _ajustes(proveedor)
+    return (conexion, lectura)
+
+
+def solicitar(proveedor, metodo, url, **kwargs):
+    kwargs.setdefault("timeout", timeout_de(proveedor))
+    return obtener_sesion(proveedor).request(metodo, url, **kwargs)
+
+
+def post(proveedor, url, **kwargs):
+    return solicitar(proveedor, "POST", url, **kwargs)
+
+
+def get(proveedor, url, **kwargs):
+    return solicitar(proveedor, "GET", url, **kwargs)
+
+
+def cerrar():
+    with _lock:
+        for sesion in _sesiones.values():
+            sesion.close()
+        _sesiones.clear()
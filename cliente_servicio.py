@@ -0,0 +1,127 @@
+import json
+import base64
+import urllib.error
+import urllib.request
+
+from config import get_config
+from registro import obtener_logger
+
+SERVICIO_URL = (get_config("SERVICIO_URL") or "").rstrip("/")
+SERVICIO_TIMEOUT_S = float(get_config("SERVICIO_TIMEOUT_S", "600"))
+
+# ============================
+#  CLIENTE DEL SERVICIO
+# ============================
+#
+# Punto de entrada de app.py y main.py. Si SERVICIO_URL está definida, los
+# poemas se piden al servicio residente (servicio.py) y este módulo solo usa
+# la biblioteca estándar, así que el cliente arranca sin importar SDKs. Si no
+# está definida o el servicio no responde, el pipeline se ejecuta en este
+# mismo proceso, importándolo y calentándolo en la primera llamada.
+
+log = obtener_logger("cliente_servicio")
+
+_local_caliente = False
+
+
+class ServicioNoDisponible(Exception):
+    pass
+
+
+def _pipeline_local():
+    global _local_caliente
+    import almacen_activos
+    import recuperacion
+    from generar_poema import ejecutar_pipeline_poetico_eventos
+
+    if not _local_caliente:
+        almacen_activos.precargar()
+        recuperacion.calentar()
+        _local_caliente = True
+    return ejecutar_pipeline_poetico_eventos
+
+
+def _abrir(ruta, datos=None):
+    peticion = urllib.request.Request(
+        f"{SERVICIO_URL}{ruta}",
+        data=json.dumps(datos).encode("utf-8") if datos is not None else None,
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        return urllib.request.urlopen(peticion, timeout=SERVICIO_TIMEOUT_S)
+    except urllib.error.HTTPError as e:
+        try:
+            detalle = json.loads(e.read()).get("error", "")
+        except ValueError:
+            detalle = ""
+        raise Exception(f"El servicio respondió {e.code}: {detalle}")
+    except (urllib.error.URLError, ConnectionError, TimeoutError) as e:
+        raise ServicioNoDisponible(str(e))
+
+
+def eventos_remotos(params):
+    with _abrir("/poema", params) as respuesta:
+        for linea in respuesta:
+            if not linea.strip():
+                continue
+            evento = json.loads(linea)
+            if evento["tipo"] == "error":
+                raise Exception(evento["error"])
+            if evento["tipo"] == "resultado" and isinstance(evento["resultado"].get("imagen"), str):
+                evento["resultado"]["imagen"] = base64.b64decode(evento["resultado"]["imagen"])
+            yield evento
+
+
+def ejecutar_pipeline_poetico_eventos(params):
+    """Eventos del pipeline, del servicio residente o, en su defecto, locales."""
+    if SERVICIO_URL:
+        remotos = eventos_remotos(params)
+        try:
+            primero = next(remotos)
+        except ServicioNoDisponible as e:
+            log.warning("servicio no disponible, se ejecuta en local",
+                        extra={"datos": {"url": SERVICIO_URL, "error": str(e)}})
+        else:
+            yield primero
+            yield from remotos
+            return
+
+    yield from _pipeline_local()(params)
+
+
+def ejecutar_pipeline_poetico(params):
+    resultado = None
+    for evento in ejecutar_pipeline_poetico_eventos(params):
+        if evento["tipo"] == "resultado":
+            resultado = evento["resultado"]
+    return resultado
+
+
+def estadisticas_locales():
+    import almacen_activos
+    import busqueda
+    import cache_contexto
+    import cache_respuestas
+    import enrutador
+    import limitador
+    import salida_estructurada
+
+    return {
+        "activos": almacen_activos.estadisticas(),
+        "busqueda": busqueda.estadisticas(),
+        "cache_contexto": cache_contexto.estadisticas(),
+        "cache_respuestas": cache_respuestas.estadisticas(),
+        "enrutador": enrutador.estadisticas(),
+        "limitador": limitador.estadisticas(),
+        "salida_estructurada": salida_estructurada.estadisticas(),
+    }
+
+
+def estadisticas():
+    if SERVICIO_URL:
+        try:
+            with _abrir("/estadisticas") as respuesta:
+                return json.loads(respuesta.read())
+        except ServicioNoDisponible:
+            pass
+    return estadisticas_locales()
@@ -0,0 +1,263 @@
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import get_config
+from orquestador import cancelacion, Cancelado
+from registro import obtener_logger
+
+COLA_TRABAJADORES = int(get_config("COLA_TRABAJADORES", "3"))
+COLA_MAX_EN_COLA = int(get_config("COLA_MAX_EN_COLA", "20"))
+COLA_MAX_POR_USUARIO = int(get_config("COLA_MAX_POR_USUARIO", "1"))
+COLA_RETENCION_S = float(get_config("COLA_RETENCION_S", "900"))
+COLA_ABANDONO_S = float(get_config("COLA_ABANDONO_S", "60"))
+
+# ============================
+#  COLA DE TRABAJOS (APP)
+# ============================
+#
+# Backend de app.py: cada "Generar Poema" es un trabajo con id que ejecuta un
+# pool acotado de COLA_TRABAJADORES hilos, compartido por todas las sesiones
+# del proceso. El script de Streamlit solo encola y consulta el progreso, así
+# que una sesión que se recarga vuelve a engancharse a su trabajo y una ráfaga
+# de usuarios espera turno en vez de lanzar pipelines sin límite contra los
+# proveedores.
+#
+#   COLA_MAX_EN_COLA       trabajos esperando como máximo; después se rechaza
+#   COLA_MAX_POR_USUARIO   trabajos activos (en cola o en curso) por usuario
+#   COLA_RETENCION_S       tiempo que se guarda un trabajo terminado
+#   COLA_ABANDONO_S        un trabajo sin terminar que nadie consulta en este
+#                          tiempo (sesión cerrada) se cancela; 0 lo desactiva
+#
+# Los eventos del pipeline (etapa, token, critica, resultado) se acumulan en el
+# trabajo y se leen por posición con `esperar`. Cancelar un trabajo en cola lo
+# retira; uno en curso se detiene en el siguiente evento del pipeline o, en la
+# preparación, en cuanto el DAG lo ve (orquestador.cancelacion).
+
+EN_COLA, EJECUTANDO = "en_cola", "ejecutando"
+COMPLETADO, ERROR, CANCELADO = "completado", "error", "cancelado"
+TERMINADOS = {COMPLETADO, ERROR, CANCELADO}
+
+log = obtener_logger("cola_trabajos")
+
+
+class TrabajoRechazado(Exception):
+    pass
+
+
+class Trabajo:
+    def __init__(self, usuario, params):
+        self.id = uuid.uuid4().hex
+        self.usuario = usuario
+        self.params = params
+        self.estado = EN_COLA
+        self.eventos = []
+        self.resultado = None
+        self.error = None
+        self.creado = time.time()
+        self.inicio = None
+        self.fin = None
+        self.ultimo_sondeo = self.creado
+        self.cancelacion = threading.Event()
+
+    @property
+    def terminado(self):
+        return self.estado in TERMINADOS
+
+
+def _pipeline():
+    from cliente_servicio import ejecutar_pipeline_poetico_eventos
+    return ejecutar_pipeline_poetico_eventos
+
+
+class ColaTrabajos:
+    def __init__(self, trabajadores=COLA_TRABAJADORES, max_en_cola=COLA_MAX_EN_COLA,
+                 max_por_usuario=COLA_MAX_POR_USUARIO, retencion_s=COLA_RETENCION_S,
+                 abandono_s=COLA_ABANDONO_S, pipeline=None):
+        self.trabajadores = trabajadores
+        self.max_en_cola = max_en_cola
+        self.max_por_usuario = max_por_usuario
+        self.retencion_s = retencion_s
+        self.abandono_s = abandono_s
+        self._pipeline = pipeline
+        self._pool = ThreadPoolExecutor(max_workers=trabajadores, thread_name_prefix="trabajo")
+        self._lock = threading.Lock()
+        self._cambios = threading.Condition(self._lock)
+        self._trabajos = {}
+        self._en_cola = []
+        self._contadores = {"enviados": 0, "rechazados": 0, "abandonados": 0,
+                            COMPLETADO: 0, ERROR: 0, CANCELADO: 0}
+        self._espera_total_s = 0.0
+        self._espera_max_s = 0.0
+        self._iniciados = 0
+        if abandono_s > 0:
+            threading.Thread(target=self._vigilar, name="cola-vigilante", daemon=True).start()
+
+    def enviar(self, params, usuario):
+        """Encola un poema y devuelve el id del trabajo; TrabajoRechazado si no cabe."""
+        with self._lock:
+            self._purgar()
+            activos = sum(1 for t in self._trabajos.values() if t.usuario == usuario and not t.terminado)
+            motivo = None
+            if activos >= self.max_por_usuario:
+                motivo = f"ya tienes {activos} poema(s) en marcha (máximo {self.max_por_usuario})"
+            elif len(self._en_cola) >= self.max_en_cola:
+                motivo = f"la cola está llena ({len(self._en_cola)} en espera)"
+            if motivo:
+                self._contadores["rechazados"] += 1
+                raise TrabajoRechazado(motivo)
+
+            trabajo = Trabajo(usuario, params)
+            self._trabajos[trabajo.id] = trabajo
+            self._en_cola.append(trabajo.id)
+            self._contadores["enviados"] += 1
+
+        self._pool.submit(self._ejecutar, trabajo)
+        log.info("trabajo encolado", extra={"datos": {"id": trabajo.id, "usuario": usuario, "tema": params.get("tema")}})
+        return trabajo.id
+
+    def _ejecutar(self, trabajo):
+        with self._lock:
+            if trabajo.estado == CANCELADO:
+                return
+            self._en_cola.remove(trabajo.id)
+            trabajo.estado = EJECUTANDO
+            trabajo.inicio = time.time()
+            espera = trabajo.inicio - trabajo.creado
+            self._iniciados += 1
+            self._espera_total_s += espera
+            self._espera_max_s = max(self._espera_max_s, espera)
+            self._cambios.notify_all()
+
+        estado, error, eventos = COMPLETADO, None, None
+        # Las etapas del pipeline (y sus hilos, que copian el contexto) ven el evento
+        token = cancelacion.set(trabajo.cancelacion)
+        try:
+            eventos = (self._pipeline or _pipeline())(trabajo.params)
+            for evento in eventos:
+                if trabajo.cancelacion.is_set():
+                    estado = CANCELADO
+                    break
+                with self._lock:
+                    trabajo.eventos.append(evento)
+                    if evento["tipo"] == "resultado":
+                        trabajo.resultado = evento["resultado"]
+                    self._cambios.notify_all()
+        except Cancelado:
+            estado = CANCELADO
+        except Exception as e:
+            estado, error = ERROR, f"{type(e).__name__}: {e}"
+            log.error("error en el trabajo", exc_info=True, extra={"datos": {"id": trabajo.id}})
+        finally:
+            if eventos is not None:
+                eventos.close()
+            cancelacion.reset(token)
+            with self._lock:
+                self._terminar(trabajo, estado, error)
+
+    def _terminar(self, trabajo, estado, error=None):
+        """Llamar con el lock tomado."""
+        trabajo.estado = estado
+        trabajo.error = error
+        trabajo.fin = time.time()
+        self._contadores[estado] += 1
+        self._cambios.notify_all()
+
+    def _cancelar(self, trabajo):
+        """Llamar con el lock tomado."""
+        trabajo.cancelacion.set()
+        if trabajo.estado == EN_COLA:
+            self._en_cola.remove(trabajo.id)
+            self._terminar(trabajo, CANCELADO)
+
+    def cancelar(self, id_trabajo):
+        """True si el trabajo estaba en cola o en curso y se ha pedido cancelarlo."""
+        with self._lock:
+            trabajo = self._trabajos.get(id_trabajo)
+            if trabajo is None or trabajo.terminado:
+                return False
+            self._cancelar(trabajo)
+        return True
+
+    def _sondear(self, id_trabajo):
+        """Llamar con el lock tomado: el trabajo sigue teniendo quien lo espere."""
+        trabajo = self._trabajos.get(id_trabajo)
+        if trabajo is not None:
+            trabajo.ultimo_sondeo = time.time()
+        return trabajo
+
+    def obtener(self, id_trabajo):
+        with self._lock:
+            return self._sondear(id_trabajo)
+
+    def posicion(self, id_trabajo):
+        """Trabajos por delante en la cola (0 = el siguiente), o None si no está en cola."""
+        with self._lock:
+            self._sondear(id_trabajo)
+            try:
+                return self._en_cola.index(id_trabajo)
+            except ValueError:
+                return None
+
+    def esperar(self, id_trabajo, desde=0, timeout=1.0):
+        """
+        Eventos del trabajo a partir de la posición `desde`, esperando hasta
+        `timeout` segundos a que llegue alguno o cambie el estado.
+        Devuelve (eventos, estado).
+        """
+        with self._cambios:
+            trabajo = self._sondear(id_trabajo)
+            if trabajo is None:
+                return [], None
+            estado = trabajo.estado
+            self._cambios.wait_for(
+                lambda: len(trabajo.eventos) > desde or trabajo.estado != estado or trabajo.terminado,
+                timeout=timeout,
+            )
+            return trabajo.eventos[desde:], trabajo.estado
+
+    def _vigilar(self):
+        """Hilo de fondo: cancela los trabajos abandonados y purga los viejos."""
+        while True:
+            time.sleep(min(5.0, self.abandono_s / 4))
+            limite = time.time() - self.abandono_s
+            with self._lock:
+                for trabajo in list(self._trabajos.values()):
+                    if not trabajo.terminado and not trabajo.cancelacion.is_set() and trabajo.ultimo_sondeo < limite:
+                        self._contadores["abandonados"] += 1
+                        log.info("trabajo abandonado, se cancela", extra={"datos": {"id": trabajo.id, "usuario": trabajo.usuario}})
+                        self._cancelar(trabajo)
+                self._purgar()
+
+    def _purgar(self):
+        limite = time.time() - self.retencion_s
+        for id_trabajo in [i for i, t in self._trabajos.items() if t.terminado and t.fin < limite]:
+            del self._trabajos[id_trabajo]
+
+    def estadisticas(self):
+        with self._lock:
+            ejecutando = sum(1 for t in self._trabajos.values() if t.estado == EJECUTANDO)
+            usuarios = {t.usuario for t in self._trabajos.values() if not t.terminado}
+            return {
+                "en_cola": len(self._en_cola),
+                "ejecutando": ejecutando,
+                "trabajadores": self.trabajadores,
+                "usuarios_activos": len(usuarios),
+                **self._contadores,
+                "espera_media_s": round(self._espera_total_s / self._iniciados, 2) if self._iniciados else 0.0,
+                "espera_max_s": round(self._espera_max_s, 2),
+            }
+
+
+_cola = None
+_cola_lock = threading.Lock()
+
+
+def obtener_cola():
+    """Cola única del proceso, compartida por todas las sesiones de Streamlit."""
+    global _cola
+    with _cola_lock:
+        if _cola is None:
+            _cola = ColaTrabajos()
+        return _cola
@@ -1,29 +1,54 @@
 # config.py
 
 import os
+import sys
+import threading
 from dotenv import load_dotenv
-try:
-    import streamlit as st
-except ImportError:
-    st = None
 
 load_dotenv()
 
+# Los valores se resuelven una vez y se memorizan. Streamlit solo se consulta
+# si ya está cargado (la app se ejecuta con `streamlit run`): importarlo desde
+# la CLI o los trabajadores por lotes costaba ~0,3 s de arranque sin aportar
+# nada, porque fuera de la app no hay st.secrets.
+_AUSENTE = object()
+_memo = {}
+_lock_memo = threading.Lock()
+
+
+def _secreto_streamlit(key):
+    st = sys.modules.get("streamlit")
+    if st is None:
+        return _AUSENTE
+    try:
+        if hasattr(st, "secrets") and key in st.secrets:
+            return st.secrets[key]
+    except Exception:
+        pass
+    return _AUSENTE
+
+
 def get_config(key, default=None):
-    # 1. Prioridad: Streamlit Secrets (Nube / App Mode)
-    if st is not None:
-        try:
-            if hasattr(st, "secrets") and key in st.secrets:
-                return st.secrets[key]
-        except Exception:
-            pass
-
-    # 2. Fallback: Variable de entorno (Local .env)
-    val = os.getenv(key)
-    if val is not None:
-        return val
-            
-    return default
+    with _lock_memo:
+        val = _memo.get(key, _AUSENTE)
+    if val is _AUSENTE:
+        # 1. Prioridad: Streamlit Secrets (Nube / App Mode)
+        val = _secreto_streamlit(key)
+
+        # 2. Fallback: Variable de entorno (Local .env)
+        if val is _AUSENTE:
+            val = os.getenv(key, _AUSENTE)
+
+        with _lock_memo:
+            _memo[key] = val
+
+    return default if val is _AUSENTE else val
+
+
+def olvidar_config():
+    """Vacía la memoria de valores (p. ej. tras cargar otro .env)."""
+    with _lock_memo:
+        _memo.clear()
 
 GROQ_API_KEY = get_config("GROQ_API_KEY")
 GROQ_MODEL = get_config("GROQ_MODEL", "qwen/qwen3-32b")
@@ -33,4 +58,32 @@ GOOGLE_API_KEY = get_config("GOOGLE_API_KEY")
 GOOGLE_MODEL = get_config("GOOGLE_MODEL", "gemma-3-4b-it")
 BRAVE_SEARCH_API_KEY = get_config("BRAVE_SEARCH_API_KEY")
 DEEPSEEK_API_KEY = get_config("DEEPSEEK_API_KEY")
-DEEPSEEK_MODEL = get_config("DEEPSEEK_MODEL", "deepseek-chat")
\ No newline at end of file
+DEEPSEEK_MODEL = get_config("DEEPSEEK_MODEL", "deepseek-chat")
+
+# URLs base de los proveedores (se cambian para usar el simulador de benchmarks/)
+GROQ_BASE_URL = get_config("GROQ_BASE_URL", "https://api.groq.com/openai/v1").rstrip("/")
+DEEPSEEK_BASE_URL = get_config("DEEPSEEK_BASE_URL", "https://api.deepseek.com").rstrip("/")
+GOOGLE_BASE_URL = get_config("GOOGLE_BASE_URL")
+BRAVE_BASE_URL = get_config("BRAVE_BASE_URL", "https://api.search.brave.com/res/v1").rstrip("/")
+
+# Recuperación de fragmentos: "aleatorio", "semantico" o "mmr"
+RECUPERACION_MODO = get_config("RECUPERACION_MODO", "mmr")
+RECUPERACION_K_OBRA = int(get_config("RECUPERACION_K_OBRA", "5"))
+RECUPERACION_K_INFLUENCIAS = int(get_config("RECUPERACION_K_INFLUENCIAS", "3"))
+RECUPERACION_MMR_LAMBDA = float(get_config("RECUPERACION_MMR_LAMBDA", "0.6"))
+CHROMA_OBRA = get_config("CHROMA_OBRA", "./data/chroma/obra/")
+CHROMA_INFLUENCIAS = get_config("CHROMA_INFLUENCIAS", "./data/chroma/influencias/")
+
+# Pipeline concurrente
+PIPELINE_HILOS = int(get_config("PIPELINE_HILOS", "4"))
+# Lanza Brave en paralelo a la clasificación; el resultado se descarta si γ <= 0.15.
+# Desactivada por defecto: γ supera el umbral en pocos perfiles (ver
+# benchmarks/pesos.py) y cada búsqueda descartada es una llamada de pago.
+BUSQUEDA_ESPECULATIVA = str(get_config("BUSQUEDA_ESPECULATIVA", "0")).lower() in ("1", "true", "si", "sí")
+
+# Refinamiento (evaluar/reescribir). REWORK_RETRIES queda para los reintentos HTTP
+REFINAMIENTO_RONDAS = int(get_config("REFINAMIENTO_RONDAS", "3"))
+REFINAMIENTO_CANDIDATOS = int(get_config("REFINAMIENTO_CANDIDATOS", "1"))
+REFINAMIENTO_UMBRAL = float(get_config("REFINAMIENTO_UMBRAL", "8.5"))
+REFINAMIENTO_MEJORA_MINIMA = float(get_config("REFINAMIENTO_MEJORA_MINIMA", "0.5"))
+REFINAMIENTO_PRESUPUESTO_S = float(get_config("REFINAMIENTO_PRESUPUESTO_S", "60"))
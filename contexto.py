@@ -0,0 +1,124 @@
+import math
+
+from config import get_config
+
+# ============================
+#  CONSTRUCCIÓN DEL CONTEXTO
+# ============================
+#
+# Ensambla CONTEXTO_EXTENDIDO a partir de secciones, cada una una sola vez.
+# prompt_maestro ya no repite estilo, obra ni influencias: remite a las
+# secciones de arriba. Se estiman los tokens de cada sección y, si el total
+# supera el presupuesto del modelo, se recortan primero los fragmentos menos
+# relevantes (los últimos de cada lista, que llega ordenada por relevancia) y
+# después el contexto factual.
+#
+# El perfil estilístico va siempre primero: es el prefijo estable que comparten
+# todas las peticiones, y dividir_prefijo() lo separa para la caché de contexto
+# de Gemini.
+
+CHARS_POR_TOKEN = float(get_config("CONTEXTO_CHARS_POR_TOKEN", "3.5"))
+PRESUPUESTO_POR_DEFECTO = int(get_config("CONTEXTO_PRESUPUESTO_TOKENS", "8000"))
+
+PRESUPUESTOS = {
+    # modelo: tokens de entrada que dedicamos al contexto
+    "gemma-3-4b-it": 6000,
+    "gemini-2.0-flash": 12000,
+    "gemini-2.0-pro": 12000,
+    "gemini-2.5-flash": 16000,
+    "gemini-2.5-pro": 16000,
+}
+
+REFERENCIAS = {
+    "estilo": "(ver PERFIL_ESTILISTICO al comienzo del contexto)",
+    "mezcla": "(ver CONTEXTO_OBRA al comienzo del contexto)",
+    "influencias": "(ver CONTEXTO_INFLUENCIAS al comienzo del contexto)",
+}
+
+
+def estimar_tokens(texto):
+    return math.ceil(len(texto or "") / CHARS_POR_TOKEN)
+
+
+def presupuesto_para(modelo):
+    return PRESUPUESTOS.get(modelo, PRESUPUESTO_POR_DEFECTO)
+
+
+def _sin_duplicados(fragmentos, vistos):
+    unicos = []
+    for f in fragmentos:
+        clave = " ".join(f.split())
+        if clave and clave not in vistos:
+            vistos.add(clave)
+            unicos.append(f)
+    return unicos
+
+
+def _render(secciones):
+    return "\n\n".join(f"{titulo}:\n{texto}" for _, titulo, texto in secciones if texto)
+
+
+def prefijo_estable(perfil_estilistico):
+    return _render([("perfil_estilistico", "PERFIL_ESTILISTICO", perfil_estilistico)])
+
+
+def dividir_prefijo(contexto, perfil_estilistico):
+    """Separa el contexto en (prefijo estable, resto); ("", contexto) si no empieza por él."""
+    prefijo = prefijo_estable(perfil_estilistico)
+    if prefijo and contexto.startswith(prefijo):
+        return prefijo, contexto[len(prefijo):].lstrip("\n")
+    return "", contexto
+
+
+def construir_contexto(perfil_estilistico, instrucciones, fragmentos_obra, fragmentos_influencias,
+                       contexto_factual="", modelo=None, presupuesto=None):
+    """
+    Devuelve (contexto, informe). `instrucciones` es prompt_maestro ya
+    formateado con REFERENCIAS. El informe detalla tokens por sección,
+    presupuesto y cuántos fragmentos se han recortado o deduplicado.
+    """
+    presupuesto = presupuesto or presupuesto_para(modelo)
+
+    vistos = set()
+    obra = _sin_duplicados(fragmentos_obra, vistos)
+    influencias = _sin_duplicados(fragmentos_influencias, vistos)
+    duplicados = len(fragmentos_obra) + len(fragmentos_influencias) - len(obra) - len(influencias)
+
+    fijos = estimar_tokens(perfil_estilistico) + estimar_tokens(instrucciones)
+    coste = {id(f): estimar_tokens(f) for f in obra + influencias}
+    factual = contexto_factual or ""
+
+    def total():
+        return (fijos + sum(coste[id(f)] for f in obra + influencias)
+                + estimar_tokens(factual))
+
+    recortados = 0
+    while total() > presupuesto and (obra or influencias):
+        # Se recorta de la lista más larga, empezando por lo menos relevante
+        lista = influencias if len(influencias) >= len(obra) else obra
+        lista.pop()
+        recortados += 1
+
+    if total() > presupuesto and factual:
+        sobrante = presupuesto - (total() - estimar_tokens(factual))
+        factual = factual[:max(0, int(sobrante * CHARS_POR_TOKEN))]
+
+    secciones = [
+        ("perfil_estilistico", "PERFIL_ESTILISTICO", perfil_estilistico),
+        ("obra", "CONTEXTO_OBRA", "\n\n".join(obra)),
+        ("influencias", "CONTEXTO_INFLUENCIAS", "\n\n".join(influencias)),
+        ("factual", "CONTEXTO_FACTUAL", factual),
+        ("instrucciones", "INSTRUCCIONES", instrucciones),
+    ]
+    tokens = {nombre: estimar_tokens(texto) for nombre, _, texto in secciones}
+
+    informe = {
+        "tokens": tokens,
+        "total_tokens": sum(tokens.values()),
+        "presupuesto": presupuesto,
+        "fragmentos_obra": len(obra),
+        "fragmentos_influencias": len(influencias),
+        "fragmentos_recortados": recortados,
+        "fragmentos_duplicados": duplicados,
+    }
+    return _render(secciones), informe
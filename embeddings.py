@@ -0,0 +1,173 @@
+import os
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from config import get_config
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# ============================
+#  EMBEDDINGS EN LOTES + CACHÉ
+# ============================
+#
+# Los vectores se guardan en un único archivo float32 (memory-mapped al leer)
+# y un índice JSON {hash del texto: fila}. Un texto ya embebido nunca se
+# vuelve a calcular al reingestar. Las consultas se embeben solo en memoria
+# (persistir=False): el tema de cada poema no debe crecer el almacén.
+#
+# Varios procesos (servicio, lote.py, ingesta) pueden añadir a la vez: cada
+# escritura toma un cerrojo de archivo y relee el índice antes de calcular
+# dónde escribir.
+
+EMBEDDINGS_RUTA = get_config("EMBEDDINGS_RUTA", "./data/embeddings/")
+EMBEDDINGS_LOTE = int(get_config("EMBEDDINGS_LOTE", "64"))
+
+_lock = threading.Lock()
+_funcion = None
+_almacenes = {}
+
+
+def funcion_embedding():
+    """Modelo por defecto de Chroma (all-MiniLM-L6-v2), cargado una vez por proceso."""
+    global _funcion
+    with _lock:
+        if _funcion is None:
+            from chromadb.utils import embedding_functions
+            _funcion = embedding_functions.DefaultEmbeddingFunction()
+        return _funcion
+
+
+@contextmanager
+def _bloqueo_archivo(ruta):
+    """Cerrojo exclusivo entre procesos sobre `ruta`."""
+    with open(ruta, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def hash_texto(texto):
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+
+class AlmacenEmbeddings:
+    def __init__(self, ruta):
+        os.makedirs(ruta, exist_ok=True)
+        self.ruta_vectores = os.path.join(ruta, "vectores.f32")
+        self.ruta_indice = os.path.join(ruta, "indice.json")
+        self.ruta_bloqueo = os.path.join(ruta, "escritura.lock")
+        self._lock = threading.Lock()
+        self._mapa = None
+        self.dim = None
+        self.indice = {}
+        self._recargar()
+
+    def _recargar(self):
+        """Relee el índice del disco (otro proceso puede haber añadido filas)."""
+        if os.path.exists(self.ruta_indice):
+            with open(self.ruta_indice, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+            self.dim = datos["dim"]
+            self.indice = datos["filas"]
+
+    def __len__(self):
+        return len(self.indice)
+
+    def __contains__(self, h):
+        return h in self.indice
+
+    def _vectores(self):
+        if self._mapa is None or self._mapa.shape[0] < len(self.indice):
+            self._mapa = np.memmap(
+                self.ruta_vectores, dtype=np.float32, mode="r",
+                shape=(len(self.indice), self.dim)
+            )
+        return self._mapa
+
+    def obtener(self, hashes):
+        with self._lock:
+            if not hashes:
+                return np.zeros((0, self.dim or 0), dtype=np.float32)
+            filas = [self.indice[h] for h in hashes]
+            return np.array(self._vectores()[filas])
+
+    def añadir(self, hashes, vectores):
+        vectores = np.asarray(vectores, dtype=np.float32)
+        with self._lock, _bloqueo_archivo(self.ruta_bloqueo):
+            self._recargar()
+            nuevos = {}
+            for h, v in zip(hashes, vectores):
+                if h not in self.indice and h not in nuevos:
+                    nuevos[h] = v
+            if not nuevos:
+                self._mapa = None
+                return
+            if self.dim is None:
+                self.dim = int(vectores.shape[1])
+            n = len(self.indice)
+            # Se escribe tras la última fila indexada: descarta restos de una escritura interrumpida
+            modo = "r+b" if os.path.exists(self.ruta_vectores) else "wb"
+            with open(self.ruta_vectores, modo) as f:
+                f.seek(n * self.dim * 4)
+                f.write(np.stack(list(nuevos.values())).tobytes())
+                f.truncate()
+            for i, h in enumerate(nuevos):
+                self.indice[h] = n + i
+            tmp = self.ruta_indice + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "filas": self.indice}, f)
+            os.replace(tmp, self.ruta_indice)
+            self._mapa = None
+
+
+def obtener_almacen(ruta=EMBEDDINGS_RUTA):
+    with _lock:
+        if ruta not in _almacenes:
+            _almacenes[ruta] = AlmacenEmbeddings(ruta)
+        return _almacenes[ruta]
+
+
+def embeber(textos, tamaño_lote=EMBEDDINGS_LOTE, almacen=None, progreso=False, persistir=True):
+    """
+    Devuelve un array (n, dim) float32 con los embeddings de `textos`.
+    Solo se calculan, por lotes, los textos que no estén ya en el almacén.
+    Con persistir=False (consultas) se calculan en memoria sin tocar el almacén.
+    """
+    if not persistir:
+        return np.asarray(funcion_embedding()(list(textos)), dtype=np.float32)
+    if almacen is None:
+        almacen = obtener_almacen()
+    hashes = [hash_texto(t) for t in textos]
+
+    faltan = {}
+    for h, t in zip(hashes, textos):
+        if h not in almacen and h not in faltan:
+            faltan[h] = t
+    faltan = list(faltan.items())
+
+    for i in range(0, len(faltan), tamaño_lote):
+        lote = faltan[i:i + tamaño_lote]
+        vectores = funcion_embedding()([t for _, t in lote])
+        almacen.añadir([h for h, _ in lote], vectores)
+        if progreso:
+            print(f"Embeddings: {min(i + tamaño_lote, len(faltan))}/{len(faltan)} nuevos")
+
+    return almacen.obtener(hashes)
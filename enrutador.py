@@ -0,0 +1,378 @@
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+
+import trazas
+import utils_llamadas
+from config import get_config, GROQ_API_KEY, GOOGLE_API_KEY, DEEPSEEK_API_KEY
+from registro import obtener_logger
+
+# ============================
+#  ENRUTADOR DE PROVEEDORES
+# ============================
+#
+# Groq, Google y DeepSeek detrás de una interfaz común. Cada etapa tiene una
+# lista de proveedores por preferencia (RUTAS); en cada llamada se ordenan por
+# coste observado en esa etapa:
+#
+#   coste = latencia EWMA * (1 + 4 * tasa de error EWMA) * (1 + PREFERENCIA * posición)
+#
+# Un proveedor sin datos hereda la latencia del preferido, así que solo se
+# adelanta a él cuando el preferido se degrada. Además:
+#   - cobertura (hedging): si la primera llamada no ha respondido al llegar al
+#     p95 de su latencia, se lanza la misma petición al siguiente proveedor y
+#     gana la primera respuesta
+#   - respaldo: si un proveedor falla se pasa al siguiente
+#   - cortacircuitos por proveedor: tras ENRUTADOR_FALLOS_APERTURA fallos
+#     seguidos se deja de usar durante ENRUTADOR_ENFRIAMIENTO_S; después pasa
+#     una sola llamada de prueba
+# En streaming no hay cobertura (duplicaría los tokens emitidos): solo
+# respaldo mientras no se haya emitido nada.
+#
+#   ENRUTADOR_ACTIVO=0 usa siempre el proveedor preferido, como antes.
+
+ENRUTADOR_ACTIVO = str(get_config("ENRUTADOR_ACTIVO", "1")).lower() in ("1", "true", "si", "sí")
+ENRUTADOR_COBERTURA = str(get_config("ENRUTADOR_COBERTURA", "1")).lower() in ("1", "true", "si", "sí")
+ENRUTADOR_COBERTURA_MIN_S = float(get_config("ENRUTADOR_COBERTURA_MIN_S", "1.0"))
+ENRUTADOR_LATENCIA_INICIAL_S = float(get_config("ENRUTADOR_LATENCIA_INICIAL_S", "10"))
+ENRUTADOR_ALFA = float(get_config("ENRUTADOR_ALFA", "0.2"))
+ENRUTADOR_PREFERENCIA = float(get_config("ENRUTADOR_PREFERENCIA", "0.5"))
+ENRUTADOR_FALLOS_APERTURA = int(get_config("ENRUTADOR_FALLOS_APERTURA", "3"))
+ENRUTADOR_ENFRIAMIENTO_S = float(get_config("ENRUTADOR_ENFRIAMIENTO_S", "30"))
+MUESTRAS_P95 = 50
+MUESTRAS_MINIMAS_P95 = 5
+
+RUTAS = {
+    "clasificacion": ("groq", "deepseek", "google"),
+    "evaluacion": ("groq", "deepseek", "google"),
+    "reescritura": ("groq", "deepseek", "google"),
+    "generacion": ("google", "groq", "deepseek"),
+    "pulido": ("google", "groq", "deepseek"),
+}
+
+CLAVES = {"groq": GROQ_API_KEY, "google": GOOGLE_API_KEY, "deepseek": DEEPSEEK_API_KEY}
+
+log = obtener_logger("enrutador")
+
+
+# ============================
+#  INTERFAZ COMÚN
+# ============================
+
+def _argumentos(proveedor, prompt, system_prompt, model, temperature, prefijo, **extra):
+    kwargs = {"model": model, **extra}
+    if system_prompt is not None:
+        kwargs["system_prompt"] = system_prompt
+    if temperature is not None:
+        kwargs["temperature"] = temperature
+    if proveedor == "google":
+        kwargs["prefijo"] = prefijo
+    elif prefijo:
+        prompt = f"{prefijo}\n\n{prompt}"
+    return prompt, kwargs
+
+
+def texto(proveedor, prompt, system_prompt=None, model=None, temperature=None, prefijo=None,
+          cache=None, formato_json=False, validar=None):
+    funcion = {"groq": utils_llamadas.llamar_groq, "google": utils_llamadas.llamar_google,
+               "deepseek": utils_llamadas.llamar_deepseek}[proveedor]
+    prompt, kwargs = _argumentos(proveedor, prompt, system_prompt, model, temperature, prefijo,
+                                 cache=cache, formato_json=formato_json, validar=validar)
+    return funcion(prompt, **kwargs)
+
+
+def texto_stream(proveedor, prompt, system_prompt=None, model=None, temperature=None, prefijo=None):
+    funcion = {"groq": utils_llamadas.llamar_groq_stream, "google": utils_llamadas.llamar_google_stream,
+               "deepseek": utils_llamadas.llamar_deepseek_stream}[proveedor]
+    prompt, kwargs = _argumentos(proveedor, prompt, system_prompt, model, temperature, prefijo)
+    return funcion(prompt, **kwargs)
+
+
+def _codigo_http(error):
+    """Código HTTP del error o de su causa encadenada (llamar_google envuelve los del SDK)."""
+    while error is not None:
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return error.response.status_code
+        codigo = getattr(error, "code", None)   # google.genai.errors.APIError
+        if isinstance(codigo, int):
+            return codigo
+        error = error.__cause__
+    return None
+
+
+def _culpa_del_proveedor(error):
+    """
+    Los 4xx son de la petición, no de la salud del proveedor: ni cuentan para
+    el cortacircuitos ni se reintentan en otro. Salvo 429 y los de
+    credenciales (401, 403), que sí son de ese proveedor.
+    """
+    codigo = _codigo_http(error)
+    if codigo is None:
+        return True
+    return codigo in (401, 403, 429) or codigo >= 500
+
+
+# ============================
+#  ESTADO POR PROVEEDOR
+# ============================
+
+class Cortacircuitos:
+    def __init__(self):
+        self.estado = "cerrado"
+        self.fallos_seguidos = 0
+        self.abierto_hasta = 0.0
+        self.sonda_en_curso = False
+
+    def disponible(self, ahora):
+        if self.estado == "cerrado":
+            return True
+        return ahora >= self.abierto_hasta and not self.sonda_en_curso
+
+    def iniciar(self, ahora):
+        if self.estado != "cerrado" and ahora >= self.abierto_hasta:
+            self.estado = "semiabierto"
+            self.sonda_en_curso = True
+
+    def exito(self):
+        self.estado = "cerrado"
+        self.fallos_seguidos = 0
+        self.sonda_en_curso = False
+
+    def fallo(self, ahora):
+        self.fallos_seguidos += 1
+        self.sonda_en_curso = False
+        if self.estado == "semiabierto" or self.fallos_seguidos >= ENRUTADOR_FALLOS_APERTURA:
+            self.estado = "abierto"
+            self.abierto_hasta = ahora + ENRUTADOR_ENFRIAMIENTO_S
+
+
+class Observacion:
+    """Latencia y tasa de error de un proveedor en una etapa."""
+
+    def __init__(self):
+        self.latencia = None
+        self.error = 0.0
+        self.muestras = deque(maxlen=MUESTRAS_P95)
+        self.llamadas = 0
+
+    def registrar(self, duracion, ok):
+        self.llamadas += 1
+        self.error = (1 - ENRUTADOR_ALFA) * self.error + ENRUTADOR_ALFA * (0.0 if ok else 1.0)
+        if ok:
+            self.muestras.append(duracion)
+            self.latencia = duracion if self.latencia is None else \
+                (1 - ENRUTADOR_ALFA) * self.latencia + ENRUTADOR_ALFA * duracion
+
+    def p95(self):
+        if len(self.muestras) < MUESTRAS_MINIMAS_P95:
+            return None
+        ordenadas = sorted(self.muestras)
+        return ordenadas[min(len(ordenadas) - 1, int(0.95 * len(ordenadas)))]
+
+
+# ============================
+#  ENRUTADOR
+# ============================
+
+class Enrutador:
+    def __init__(self, rutas=RUTAS, claves=CLAVES, activo=ENRUTADOR_ACTIVO, cobertura=ENRUTADOR_COBERTURA):
+        self.rutas = rutas
+        self.claves = claves
+        self.activo = activo
+        self.cobertura = cobertura
+        self._lock = threading.Lock()
+        self._circuitos = {p: Cortacircuitos() for p in claves}
+        self._observaciones = {}
+        self._stats = {"coberturas": 0, "coberturas_ganadas": 0, "respaldos": 0}
+        # Las llamadas perdedoras de una cobertura terminan en segundo plano
+        self._pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="enrutador")
+
+    def _observacion(self, etapa, proveedor):
+        return self._observaciones.setdefault((etapa, proveedor), Observacion())
+
+    def candidatos(self, etapa):
+        """Proveedores utilizables para la etapa, del más barato al más caro."""
+        preferidos = self.rutas[etapa]
+        if not self.activo:
+            return [preferidos[0]]
+
+        ahora = time.monotonic()
+        with self._lock:
+            previa = self._observacion(etapa, preferidos[0]).latencia or ENRUTADOR_LATENCIA_INICIAL_S
+            costes = []
+            for posicion, proveedor in enumerate(preferidos):
+                if not self.claves.get(proveedor) or not self._circuitos[proveedor].disponible(ahora):
+                    continue
+                obs = self._observacion(etapa, proveedor)
+                latencia = obs.latencia if obs.latencia is not None else previa
+                coste = latencia * (1 + 4 * obs.error) * (1 + ENRUTADOR_PREFERENCIA * posicion)
+                costes.append((coste, posicion, proveedor))
+        # Sin ninguno disponible se usa el preferido, para que falle con su propio error
+        return [p for _, _, p in sorted(costes)] or [preferidos[0]]
+
+    def retardo_cobertura(self, etapa, proveedor):
+        with self._lock:
+            p95 = self._observacion(etapa, proveedor).p95()
+        return max(ENRUTADOR_COBERTURA_MIN_S, p95 if p95 is not None else ENRUTADOR_LATENCIA_INICIAL_S)
+
+    def registrar(self, etapa, proveedor, duracion, error=None):
+        with self._lock:
+            circuito = self._circuitos[proveedor]
+            if error is None:
+                self._observacion(etapa, proveedor).registrar(duracion, True)
+                circuito.exito()
+            elif _culpa_del_proveedor(error):
+                self._observacion(etapa, proveedor).registrar(duracion, False)
+                circuito.fallo(time.monotonic())
+                if circuito.estado == "abierto":
+                    log.warning("cortacircuitos abierto", extra={"datos": {
+                        "proveedor": proveedor, "fallos_seguidos": circuito.fallos_seguidos,
+                    }})
+            else:
+                circuito.sonda_en_curso = False
+
+    def _ejecutar(self, etapa, proveedor, kwargs):
+        with self._lock:
+            self._circuitos[proveedor].iniciar(time.monotonic())
+        t0 = time.perf_counter()
+        try:
+            resultado = texto(proveedor, **kwargs)
+        except Exception as e:
+            self.registrar(etapa, proveedor, time.perf_counter() - t0, e)
+            raise
+        self.registrar(etapa, proveedor, time.perf_counter() - t0)
+        return resultado
+
+    def _kwargs(self, etapa, proveedor, model, kwargs):
+        # El modelo elegido por el usuario es del proveedor preferido; el resto usa el suyo
+        return {**kwargs, "model": model if proveedor == self.rutas[etapa][0] else None}
+
+    def llamar(self, etapa, prompt, system_prompt=None, model=None, **kwargs):
+        """
+        Llamada de texto completa para `etapa`, con cobertura y respaldo. Los
+        argumentos adicionales (temperature, prefijo, cache, formato_json,
+        validar) se pasan al proveedor.
+        """
+        kwargs = {"prompt": prompt, "system_prompt": system_prompt, **kwargs}
+        orden = iter(self.candidatos(etapa))
+        en_vuelo = {}
+        ultimo_error = None
+        cubierta = False
+
+        def lanzar():
+            proveedor = next(orden, None)
+            if proveedor is None:
+                return False
+            futuro = self._pool.submit(contextvars.copy_context().run, self._ejecutar,
+                                       etapa, proveedor, self._kwargs(etapa, proveedor, model, kwargs))
+            en_vuelo[futuro] = proveedor
+            return True
+
+        lanzar()
+        primero = next(iter(en_vuelo.values()))
+        while en_vuelo:
+            espera = None
+            if self.cobertura and not cubierta and len(en_vuelo) == 1:
+                espera = self.retardo_cobertura(etapa, primero)
+            hechos, _ = wait(en_vuelo, timeout=espera, return_when=FIRST_COMPLETED)
+
+            if not hechos:
+                cubierta = True
+                if lanzar():
+                    with self._lock:
+                        self._stats["coberturas"] += 1
+                    trazas.span_actual().fijar(cobertura=True)
+                continue
+
+            for futuro in hechos:
+                proveedor = en_vuelo.pop(futuro)
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    if not _culpa_del_proveedor(e):
+                        # La petición es la que falla (4xx): otro proveedor no lo arregla
+                        raise
+                    ultimo_error = e
+                    log.warning("proveedor fallido", extra={"datos": {
+                        "etapa": etapa, "proveedor": proveedor, "error": f"{type(e).__name__}: {e}",
+                    }})
+                    if not en_vuelo and lanzar():
+                        with self._lock:
+                            self._stats["respaldos"] += 1
+                    continue
+                if proveedor != primero and cubierta:
+                    with self._lock:
+                        self._stats["coberturas_ganadas"] += 1
+                trazas.span_actual().fijar(proveedor=proveedor)
+                return resultado
+
+        raise ultimo_error
+
+    def llamar_stream(self, etapa, prompt, system_prompt=None, model=None, **kwargs):
+        """Generador de fragmentos; cambia de proveedor solo antes del primer fragmento."""
+        ultimo_error = None
+        for proveedor in self.candidatos(etapa):
+            with self._lock:
+                self._circuitos[proveedor].iniciar(time.monotonic())
+            t0 = time.perf_counter()
+            emitidos = 0
+            try:
+                for fragmento in texto_stream(proveedor, prompt, system_prompt,
+                                              **self._kwargs(etapa, proveedor, model, kwargs)):
+                    emitidos += 1
+                    yield fragmento
+            except GeneratorExit:
+                # El consumidor cierra el stream a medias (presupuesto agotado,
+                # trabajo cancelado): el proveedor estaba respondiendo, así que
+                # cuenta como éxito y, sobre todo, libera la llamada de prueba
+                self.registrar(etapa, proveedor, time.perf_counter() - t0)
+                raise
+            except Exception as e:
+                self.registrar(etapa, proveedor, time.perf_counter() - t0, e)
+                if emitidos or not _culpa_del_proveedor(e):
+                    raise
+                ultimo_error = e
+                log.warning("proveedor fallido", extra={"datos": {
+                    "etapa": etapa, "proveedor": proveedor, "error": f"{type(e).__name__}: {e}",
+                }})
+                with self._lock:
+                    self._stats["respaldos"] += 1
+                continue
+            self.registrar(etapa, proveedor, time.perf_counter() - t0)
+            trazas.span_actual().fijar(proveedor=proveedor)
+            return
+        raise ultimo_error
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "circuitos": {p: c.estado for p, c in self._circuitos.items()},
+                "etapas": {
+                    f"{etapa}/{proveedor}": {
+                        "llamadas": o.llamadas,
+                        "latencia_ewma_s": round(o.latencia, 3) if o.latencia is not None else None,
+                        "p95_s": round(o.p95(), 3) if o.p95() is not None else None,
+                        "tasa_error": round(o.error, 3),
+                    } for (etapa, proveedor), o in self._observaciones.items() if o.llamadas
+                },
+            }
+
+
+enrutador = Enrutador()
+
+
+def llamar(etapa, prompt, **kwargs):
+    return enrutador.llamar(etapa, prompt, **kwargs)
+
+
+def llamar_stream(etapa, prompt, **kwargs):
+    return enrutador.llamar_stream(etapa, prompt, **kwargs)
+
+
+def estadisticas():
+    return enrutador.estadisticas()
@@ -1,23 +1,29 @@
 import os
 import glob
 import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import yaml
 import unicodedata
-import requests
-import pypdf
-import chromadb
-from chromadb.utils import embedding_functions
+from utils_llamadas import llamar_deepseek
+from almacen_chunks import EscritorChunks
 from dotenv import load_dotenv
 
 from config import (
     GROQ_API_KEY, GROQ_MODEL, REWORK_RETRIES,
     GOOGLE_MODEL, GOOGLE_API_KEY,
-    BRAVE_SEARCH_API_KEY, DEEPSEEK_API_KEY, DEEPSEEK_MODEL
+    BRAVE_SEARCH_API_KEY, DEEPSEEK_API_KEY, DEEPSEEK_MODEL,
+    olvidar_config
 )
 
+# pypdf, chromadb y el modelo de embeddings (numpy + onnxruntime) se importan
+# dentro de las funciones que los usan: los procesos de extracción de PDFs no
+# cargan Chroma y quien solo importa utilidades de este módulo no paga ninguno.
+
 def cargar_configuracion(env_path, modelos_path, pesos_path):
     if os.path.exists(env_path):
         load_dotenv(env_path)
+        olvidar_config()
     
     config = {"pesos_estilo": {"obra": 0.5, "influencias": 0.5}}
     
@@ -33,22 +39,165 @@ def cargar_configuracion(env_path, modelos_path, pesos_path):
             
     return config
 
-def extraer_texto_de_pdfs(ruta_carpeta):
-    texto_acumulado = []
-    patron = os.path.join(ruta_carpeta, "*.pdf")
-    archivos = glob.glob(patron)
-    
-    for archivo in archivos:
-        try:
-            print(f"Extrayendo texto de: {archivo}")
-            reader = pypdf.PdfReader(archivo)
-            for page in reader.pages:
-                t = page.extract_text()
-                if t: texto_acumulado.append(t)
-        except Exception as e:
-            print(f"Error al leer {archivo}: {e}")
-            
-    return "\n".join(texto_acumulado)
+def hash_archivo(ruta):
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+def paginas_pdf(archivo):
+    """Genera (número de página, texto normalizado) de un PDF, página a página."""
+    import pypdf
+    try:
+        reader = pypdf.PdfReader(archivo)
+        for num, page in enumerate(reader.pages, start=1):
+            t = page.extract_text()
+            if t:
+                yield num, limpiar_y_normalizar(t)
+    except Exception as e:
+        print(f"Error al leer {archivo}: {e}")
+
+def ventana_de_palabras(paginas, archivo, tamaño=400):
+    """
+    Trocea un flujo de páginas en chunks de `tamaño` palabras sin acumular el
+    documento: solo se retiene la ventana en curso. Cada chunk conserva su
+    archivo y rango de páginas de origen.
+    """
+    ventana = []
+    pagina_inicio = None
+    for num, texto in paginas:
+        for palabra in texto.split():
+            if not ventana:
+                pagina_inicio = num
+            ventana.append(palabra)
+            if len(ventana) == tamaño:
+                yield {"texto": " ".join(ventana), "archivo": os.path.basename(archivo),
+                       "pagina_inicio": pagina_inicio, "pagina_fin": num}
+                ventana = []
+        pagina_fin = num
+    if ventana:
+        yield {"texto": " ".join(ventana), "archivo": os.path.basename(archivo),
+               "pagina_inicio": pagina_inicio, "pagina_fin": pagina_fin}
+
+def procesar_pdf(archivo, destino, tamaño=400):
+    """
+    Extrae, normaliza y trocea un único PDF (en un proceso aparte), escribiendo
+    los chunks en `destino` (JSONL) a medida que se generan. Devuelve cuántos hay.
+    """
+    print(f"Extrayendo texto de: {archivo}")
+    n = 0
+    tmp = destino + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for chunk in ventana_de_palabras(paginas_pdf(archivo), archivo, tamaño=tamaño):
+            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+            n += 1
+    os.replace(tmp, destino)
+    return n
+
+def leer_chunks(ruta):
+    with open(ruta, 'r', encoding='utf-8') as f:
+        for linea in f:
+            yield json.loads(linea)
+
+def lotes(iterable, tamaño):
+    lote = []
+    for elemento in iterable:
+        lote.append(elemento)
+        if len(lote) == tamaño:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def cargar_manifiesto(ruta):
+    if os.path.exists(ruta):
+        with open(ruta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+def ingerir_corpus(ruta_carpeta, collection, manifiesto, ruta_cache_chunks,
+                   ruta_corpus, ruta_chunks, procesos=None):
+    """
+    Ingesta incremental y en streaming de una carpeta de PDFs.
+
+    Solo se extraen, trocean y embeben los PDFs nuevos o modificados (según su
+    hash); el resto se recupera de la caché de chunks por archivo (JSONL). Los
+    ids de Chroma son "<hash>-<n>", de modo que los chunks de PDFs borrados o
+    cambiados se eliminan y los nuevos se insertan con upsert. Si a un PDF le
+    falta alguno de sus ids en la colección (Chroma borrado o reconstruido),
+    se vuelve a insertar desde la caché de chunks sin re-extraerlo.
+
+    El corpus de texto, el almacén binario de chunks (almacen_chunks.py) y los
+    embeddings se escriben por partes, sin tener nunca el corpus completo en
+    memoria.
+    Devuelve True si hubo cambios respecto a la ingesta anterior.
+    """
+    from embeddings import EMBEDDINGS_LOTE
+
+    archivos = sorted(glob.glob(os.path.join(ruta_carpeta, "*.pdf")))
+    hashes = {a: hash_archivo(a) for a in archivos}
+    os.makedirs(ruta_cache_chunks, exist_ok=True)
+
+    def ruta_cache(h):
+        return os.path.join(ruta_cache_chunks, f"{h}.jsonl")
+
+    def ids_de(h, n):
+        return [f"{h[:16]}-{i}" for i in range(n)]
+
+    ids_en_chroma = set(collection.get(include=[])["ids"])
+
+    pendientes = [
+        a for a in archivos
+        if manifiesto.get(a, {}).get("hash") != hashes[a] or not os.path.exists(ruta_cache(hashes[a]))
+    ]
+    # Al día en el manifiesto pero sin todos sus chunks en la colección
+    sin_insertar = [
+        a for a in archivos
+        if a not in pendientes and (
+            "n_chunks" not in manifiesto[a]
+            or not ids_en_chroma.issuperset(ids_de(hashes[a], manifiesto[a]["n_chunks"]))
+        )
+    ]
+
+    if pendientes:
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            list(pool.map(procesar_pdf, pendientes, [ruta_cache(hashes[a]) for a in pendientes]))
+
+    ids_vigentes = set()
+    os.makedirs(os.path.dirname(ruta_corpus), exist_ok=True)
+    os.makedirs(os.path.dirname(ruta_chunks), exist_ok=True)
+    with open(ruta_corpus, 'w', encoding='utf-8') as corpus, EscritorChunks(ruta_chunks) as salida:
+        primero = True
+        for archivo in archivos:
+            h = hashes[archivo]
+            n = 0
+            for lote in lotes(leer_chunks(ruta_cache(h)), EMBEDDINGS_LOTE):
+                ids = [f"{h[:16]}-{n + i}" for i in range(len(lote))]
+                n += len(lote)
+                ids_vigentes.update(ids)
+                textos = [c["texto"] for c in lote]
+
+                for texto in textos:
+                    corpus.write(texto if primero else " " + texto)
+                    salida.agregar(texto)
+                    primero = False
+
+                if archivo in pendientes or archivo in sin_insertar:
+                    metadatos = [{k: v for k, v in c.items() if k != "texto"} for c in lote]
+                    insertar_en_chroma(collection, textos, generar_embeddings(textos), ids=ids, metadatos=metadatos)
+            manifiesto[archivo] = {"hash": h, "n_chunks": n}
+
+    # Entradas del manifiesto de PDFs que ya no existen
+    for archivo in [a for a in manifiesto if a not in hashes]:
+        del manifiesto[archivo]
+
+    # Ids obsoletos: PDFs borrados/modificados o ids "0".."n" de ingestas antiguas
+    obsoletos = [i for i in ids_en_chroma if i not in ids_vigentes]
+    if obsoletos:
+        collection.delete(ids=obsoletos)
+
+    return bool(pendientes or sin_insertar or obsoletos)
 
 def limpiar_y_normalizar(texto):
     texto = unicodedata.normalize("NFKD", texto)
@@ -61,35 +210,30 @@ def guardar_texto(texto, ruta):
     with open(ruta, 'w', encoding='utf-8') as f:
         f.write(texto)
 
-def trocear_texto(texto, tamaño=400):
-    palabras = texto.split()
-    chunks = []
-    for i in range(0, len(palabras), tamaño):
-        fragmento = " ".join(palabras[i:i+tamaño])
-        chunks.append(fragmento)
-    return chunks
-
 def guardar_json(data, ruta):
     os.makedirs(os.path.dirname(ruta), exist_ok=True)
     with open(ruta, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 def crear_chroma(ruta):
+    import chromadb
     os.makedirs(ruta, exist_ok=True)
     client = chromadb.PersistentClient(path=ruta)
     nombre_coleccion = os.path.basename(os.path.normpath(ruta))
     return client.get_or_create_collection(name=nombre_coleccion)
 
 def generar_embeddings(chunks):
-    # Usamos el modelo por defecto de Chroma (all-MiniLM-L6-v2)
-    ef = embedding_functions.DefaultEmbeddingFunction()
-    return ef(chunks)
-
-def insertar_en_chroma(collection, chunks, embeddings):
-    ids = [str(i) for i in range(len(chunks))]
-    collection.add(
+    # Modelo por defecto de Chroma (all-MiniLM-L6-v2), por lotes y con caché en disco
+    from embeddings import embeber
+    return embeber(chunks, progreso=True).tolist()
+
+def insertar_en_chroma(collection, chunks, embeddings, ids=None, metadatos=None):
+    if ids is None:
+        ids = [str(i) for i in range(len(chunks))]
+    collection.upsert(
         documents=chunks,
         embeddings=embeddings,
+        metadatas=metadatos,
         ids=ids
     )
 
@@ -103,22 +247,12 @@ def buscar_en_chroma(collection, query, k=30):
     return []
 
 def _llamar_deepseek(prompt):
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    if not api_key:
+    if not (DEEPSEEK_API_KEY or os.getenv("DEEPSEEK_API_KEY")):
         print("⚠️ DEEPSEEK_API_KEY no encontrada. Usando respuesta simulada.")
         return "Simulación: Análisis realizado."
-        
-    url = "https://api.deepseek.com/chat/completions"
-    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
-    payload = {
-        "model": "deepseek-chat",
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.7
-    }
+
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json()['choices'][0]['message']['content']
+        return llamar_deepseek(prompt)
     except Exception as e:
         return f"Error API DeepSeek: {e}"
 
@@ -153,10 +287,12 @@ def generar_datos_iniciales():
         "pdfs_influencias": "./data/pdfs/influencias/",
         "corpus_obra": "./data/corpus/obra.txt",
         "corpus_influencias": "./data/corpus/influencias.txt",
-        "chunks_obra": "./data/chunks/chunks_obra.json",
-        "chunks_influencias": "./data/chunks/chunks_influencias.json",
+        "chunks_obra": "./data/chunks/chunks_obra.chunks",
+        "chunks_influencias": "./data/chunks/chunks_influencias.chunks",
         "chroma_obra": "./data/chroma/obra/",
-        "chroma_influencias": "./data/chroma/influencias/"
+        "chroma_influencias": "./data/chroma/influencias/",
+        "chunks_por_archivo": "./data/chunks/por_archivo/",
+        "manifiesto": "./data/manifiesto_ingesta.json"
     }
 
     # Crear directorios necesarios si no existen
@@ -169,44 +305,25 @@ def generar_datos_iniciales():
 
 
     ###############################################
-    # 2. CARGA DE CORPUS (PDF → TEXTO)
+    # 2-4. INGESTA INCREMENTAL (PDF → CHUNKS → EMBEDDINGS + CHROMADB)
     ###############################################
 
-    texto_obra = extraer_texto_de_pdfs(rutas["pdfs_obra"])
-    texto_influencias = extraer_texto_de_pdfs(rutas["pdfs_influencias"])
-
-    texto_obra = limpiar_y_normalizar(texto_obra)
-    texto_influencias = limpiar_y_normalizar(texto_influencias)
-
-    guardar_texto(texto_obra, rutas["corpus_obra"])
-    guardar_texto(texto_influencias, rutas["corpus_influencias"])
-
-
-
-    ###############################################
-    # 3. TROCEO SEMÁNTICO
-    ###############################################
-
-    chunks_obra = trocear_texto(texto_obra, tamaño=400)
-    chunks_influencias = trocear_texto(texto_influencias, tamaño=400)
-
-    guardar_json(chunks_obra, rutas["chunks_obra"])
-    guardar_json(chunks_influencias, rutas["chunks_influencias"])
-
-
-
-    ###############################################
-    # 4. EMBEDDINGS + CHROMADB (DOBLE MEMORIA)
-    ###############################################
+    # Solo se procesan los PDFs nuevos o modificados desde la última ejecución
+    manifiesto = cargar_manifiesto(rutas["manifiesto"])
 
     chroma_obra = crear_chroma(rutas["chroma_obra"])
     chroma_influencias = crear_chroma(rutas["chroma_influencias"])
 
-    embeddings_obra = generar_embeddings(chunks_obra)
-    embeddings_influencias = generar_embeddings(chunks_influencias)
+    cambios_obra = ingerir_corpus(
+        rutas["pdfs_obra"], chroma_obra, manifiesto.setdefault("obra", {}), rutas["chunks_por_archivo"],
+        rutas["corpus_obra"], rutas["chunks_obra"]
+    )
+    cambios_influencias = ingerir_corpus(
+        rutas["pdfs_influencias"], chroma_influencias, manifiesto.setdefault("influencias", {}), rutas["chunks_por_archivo"],
+        rutas["corpus_influencias"], rutas["chunks_influencias"]
+    )
 
-    insertar_en_chroma(chroma_obra, chunks_obra, embeddings_obra)
-    insertar_en_chroma(chroma_influencias, chunks_influencias, embeddings_influencias)
+    guardar_json(manifiesto, rutas["manifiesto"])
 
 
 
@@ -225,6 +342,17 @@ def generar_datos_iniciales():
     # 5bis. AUTO-AFINACIÓN ESTILÍSTICA (DEEPSEEK)
     ###############################################
 
+    # Sin cambios en el corpus, el perfil existente sigue siendo válido
+    if not (cambios_obra or cambios_influencias) and os.path.exists("./estilo/perfil_estilistico_final.md"):
+        print("Corpus sin cambios: se conserva el perfil estilístico existente.")
+        with open("./estilo/perfil_estilistico_final.md", 'r', encoding='utf-8') as f:
+            perfil_estilistico_final = f.read()
+        return {
+            "perfil_estilistico": perfil_estilistico_final,
+            "contexto_obra": contexto_obra,
+            "contexto_influencias": contexto_influencias
+        }
+
     # 5bis.1 análisis de estilo de cada corpus
     perfil_obra = deepseek_analizar_estilo(contexto_obra)
     perfil_influencias = deepseek_analizar_estilo(contexto_influencias)
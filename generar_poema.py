@@ -1,12 +1,21 @@
 # agente.py
 
-import json
-
 from clasificar_intencion_poetica import clasificar_intencion_poetica
 from generar_estructura_poetica import generar_estructura_poetica
-from calcular_pesos import calcular_pesos
-from brave_search import brave_search
-from utils_llamadas import llamar_groq, llamar_google, cargar_prompt, leer_texto, cargar_json, seleccionar
+from calcular_pesos import calcular_pesos, UMBRAL_BUSQUEDA
+from busqueda import buscar
+import enrutador
+from almacen_activos import obtener_activos_pipeline
+from recuperacion import recuperar_fragmentos
+from orquestador import ejecutar_dag
+from refinamiento import refinar
+from salida_estructurada import llamar_json, SalidaInvalida, ESQUEMA_CRITICA
+from config import PIPELINE_HILOS, BUSQUEDA_ESPECULATIVA, GOOGLE_MODEL
+from contexto import construir_contexto, dividir_prefijo, REFERENCIAS
+import trazas
+from registro import obtener_logger
+
+log = obtener_logger("generar_poema")
 
 class EstructuraFlexible(dict):
     """Permite acceso por punto (para prompt) y por clave (para f-strings)"""
@@ -21,78 +30,169 @@ class EstructuraFlexible(dict):
 ###############################################################################
 
 
-def gemini_generar_poema(contexto, user, model=None):
+def gemini_generar_poema(contexto, user, model=None, prefijo=None):
     prompt = f"{contexto}\n\nTAREA:\n{user}"
-    return llamar_google(prompt, model=model)
+    return enrutador.llamar("generacion", prompt, model=model, prefijo=prefijo)
 
 def groq_evaluar_poema(poema, prompt, estilo, tema, model=None):
     full_prompt = f"{prompt}\n\nPOEMA:\n{poema}\n\nESTILO:\n{estilo}\n\nTEMA:\n{tema}"
-    resp = llamar_groq(full_prompt, system_prompt="Eres un crítico literario experto. Responde estrictamente en JSON.", model=model)
     try:
-        start = resp.find('{')
-        end = resp.rfind('}') + 1
-        if start != -1 and end != 0:
-            return json.loads(resp[start:end])
-    except:
-        pass
-    return {"ok": False, "problemas": ["Error formato JSON"], "sugerencias": []}
+        return llamar_json(
+            full_prompt, ESQUEMA_CRITICA, "evaluacion",
+            system_prompt="Eres un crítico literario experto. Responde estrictamente en JSON.",
+            model=model
+        )
+    except SalidaInvalida:
+        return {"ok": False, "problemas": ["Error formato JSON"], "sugerencias": []}
 
 def groq_reescribir_poema(poema, prompt, problemas, sugerencias, estilo, model=None):
     probs = ", ".join(problemas)
     sugs = ", ".join(sugerencias)
     full_prompt = f"{prompt}\n\nPOEMA ORIGINAL:\n{poema}\n\nPROBLEMAS:\n{probs}\n\nSUGERENCIAS:\n{sugs}\n\nESTILO:\n{estilo}"
-    return llamar_groq(full_prompt, system_prompt="Eres un editor de poesía experto.", model=model)
+    return enrutador.llamar("reescritura", full_prompt, system_prompt="Eres un editor de poesía experto.", model=model)
+
+def gemini_pulir_poema(contexto, poema, prompt, model=None, prefijo=None):
+    full_prompt = f"{contexto}\n\nPOEMA PREVIO:\n{poema}\n\nINSTRUCCIONES DE PULIDO:\n{prompt}"
+    return enrutador.llamar("pulido", full_prompt, model=model, prefijo=prefijo)
+
+def gemini_generar_poema_stream(contexto, user, model=None, prefijo=None):
+    prompt = f"{contexto}\n\nTAREA:\n{user}"
+    return enrutador.llamar_stream("generacion", prompt, model=model, prefijo=prefijo)
+
+def groq_reescribir_poema_stream(poema, prompt, problemas, sugerencias, estilo, model=None):
+    probs = ", ".join(problemas)
+    sugs = ", ".join(sugerencias)
+    full_prompt = f"{prompt}\n\nPOEMA ORIGINAL:\n{poema}\n\nPROBLEMAS:\n{probs}\n\nSUGERENCIAS:\n{sugs}\n\nESTILO:\n{estilo}"
+    return enrutador.llamar_stream("reescritura", full_prompt, system_prompt="Eres un editor de poesía experto.", model=model)
 
-def gemini_pulir_poema(contexto, poema, prompt, model=None):
+def gemini_pulir_poema_stream(contexto, poema, prompt, model=None, prefijo=None):
     full_prompt = f"{contexto}\n\nPOEMA PREVIO:\n{poema}\n\nINSTRUCCIONES DE PULIDO:\n{prompt}"
-    return llamar_google(full_prompt, model=model)
+    return enrutador.llamar_stream("pulido", full_prompt, model=model, prefijo=prefijo)
+
+def _emitir_tokens(etapa, fragmentos):
+    """Reemite cada fragmento como evento y devuelve el texto completo."""
+    partes = []
+    for texto in fragmentos:
+        partes.append(texto)
+        yield {"tipo": "token", "etapa": etapa, "texto": texto}
+    return "".join(partes)
 
 def generar_imagen(poema, model=None):
     return llamar_imagen(poema, model=model)
 
+def _etapas_preparacion(params):
+    """
+    Etapas previas a la generación como DAG {nombre: (dependencias, funcion)}.
+    Activos, fragmentos y búsqueda solo necesitan el tema, así que se ejecutan
+    en paralelo con la clasificación (la llamada a Groq).
+    """
+    tema = params.get("tema", "")
+
+    def activos(r):
+        return obtener_activos_pipeline()
+
+    def clasificacion(r):
+        return clasificar_intencion_poetica(
+            tema,
+            params.get("estilo_extra", ""),
+            params.get("tono_extra", ""),
+            params.get("restricciones", ""),
+            params.get("extension", "")
+        )
+
+    def fragmentos(r):
+        return recuperar_fragmentos(
+            tema,
+            r["activos"]["chunks_obra"],
+            r["activos"]["chunks_influencias"],
+            modo=params.get("modo_recuperacion")
+        )
+
+    def busqueda(r):
+        # Especulativa: se lanza sin esperar a γ; buscar no lanza, a lo sumo devuelve []
+        return buscar(tema)
+
+    def estructura(r):
+        perfil = r["clasificacion"]
+        estructura = generar_estructura_poetica(perfil)
+        if not isinstance(estructura, dict):
+            estructura = {}
+        perfil["estructura"] = estructura
+        return estructura
+
+    def pesos(r):
+        return calcular_pesos(r["clasificacion"])
+
+    def contexto_factual(r):
+        if r["pesos"]["γ"] <= UMBRAL_BUSQUEDA:
+            return ""
+        resultados = r["busqueda"] if BUSQUEDA_ESPECULATIVA else buscar(tema)
+        return "\n\n".join(resultados)
+
+    def con_span(nombre, funcion):
+        def envuelta(r):
+            with trazas.span(f"etapa.{nombre}"):
+                return funcion(r)
+        return envuelta
+
+    etapas = {
+        "activos": ((), activos),
+        "clasificacion": ((), clasificacion),
+        "fragmentos": (("activos",), fragmentos),
+        "estructura": (("clasificacion",), estructura),
+        "pesos": (("estructura",), pesos),
+        "contexto_factual": (("pesos",), contexto_factual),
+    }
+    if BUSQUEDA_ESPECULATIVA:
+        etapas["busqueda"] = ((), busqueda)
+        etapas["contexto_factual"] = (("pesos", "busqueda"), contexto_factual)
+    return {n: (deps, con_span(n, f)) for n, (deps, f) in etapas.items()}
+
 def ejecutar_pipeline_poetico(params):
-    base = "."
-    
-    # 0. RECUPERAR DATOS
-    perfil_estilistico = leer_texto(f"{base}/estilo/perfil_estilistico_final.md")
-    
-    chunks_obra = cargar_json(f"{base}/data/chunks/chunks_obra.json")
-    chunks_influencias = cargar_json(f"{base}/data/chunks/chunks_influencias.json")
-    
-    prompt_maestro = cargar_prompt(f"{base}/prompts/prompt_maestro.txt")
-    prompt_eval = cargar_prompt(f"{base}/prompts/prompt_evaluacion.txt")
-    prompt_rewrite = cargar_prompt(f"{base}/prompts/prompt_reescritura.txt")
-    prompt_pulido = cargar_prompt(f"{base}/prompts/prompt_pulido_final.txt")
-    
+    resultado = None
+    for evento in ejecutar_pipeline_poetico_eventos(params):
+        if evento["tipo"] == "resultado":
+            resultado = evento["resultado"]
+    return resultado
+
+def ejecutar_pipeline_poetico_eventos(params):
+    """
+    Versión generadora del pipeline. Emite diccionarios con clave "tipo":
+      - "etapa":     {"etapa", "estado": "inicio" | "fin"}
+      - "token":     {"etapa", "texto"} fragmentos de generación, reescritura y pulido
+      - "critica":   {"critica", "iteracion"}
+      - "resultado": {"resultado"} el mismo diccionario que ejecutar_pipeline_poetico,
+                     con las métricas de la traza en "metricas"
+    """
+    with trazas.iniciar_traza("pipeline_poetico", tema=params.get("tema", "")) as traza:
+        for evento in _pipeline_eventos(params):
+            if evento["tipo"] == "resultado":
+                evento["resultado"]["metricas"] = {**traza.metricas(), **evento["resultado"].get("metricas", {})}
+            yield evento
+
+def _pipeline_eventos(params):
+    # 0-3. RECUPERAR DATOS, CLASIFICAR, ESTRUCTURA, PESOS, BRAVE Y FRAGMENTOS (DAG)
+    yield {"tipo": "etapa", "etapa": "preparacion", "estado": "inicio"}
+    with trazas.span("etapa.preparacion"):
+        r = ejecutar_dag(_etapas_preparacion(params), max_workers=PIPELINE_HILOS)
+    yield {"tipo": "etapa", "etapa": "preparacion", "estado": "fin"}
+
+    activos = r["activos"]
+    perfil_estilistico = activos["perfil_estilistico"]
+    prompt_maestro = activos["prompt_maestro"]
+    prompt_eval = activos["prompt_evaluacion"]
+    prompt_rewrite = activos["prompt_reescritura"]
+    prompt_pulido = activos["prompt_pulido"]
+
     groq_model = params.get("groq_model")
     google_model = params.get("google_model")
-    crear_imagen = params.get("crear_imagen", False)
-
-    # 1. CLASIFICACIÓN DE INTENCIÓN POÉTICA
-    perfil = clasificar_intencion_poetica(
-        params.get("tema", ""),
-        params.get("estilo_extra", ""),
-        params.get("tono_extra", ""),
-        params.get("restricciones", ""),
-        params.get("extension", "")
-    )
 
-    # 2. NUEVO: GENERAR ESTRUCTURA POÉTICA
-    estructura = generar_estructura_poetica(perfil)
-    if not isinstance(estructura, dict):
-        estructura = {}
-    perfil["estructura"] = estructura
-
-    # 3. SISTEMA DE PESOS ADAPTATIVO
-    pesos = calcular_pesos(perfil)
-    
-
-    # 3.1. ACTIVAR BRAVE SEARCH SEGÚN γ
-    contexto_factual = ""
-    if pesos["γ"] > 0.15:
-        resultados = brave_search(params.get("tema", ""))
-        contexto_factual = "\n\n".join(resultados[:5])
-        
+    perfil = r["clasificacion"]
+    estructura = r["estructura"]
+    pesos = r["pesos"]
+    contexto_factual = r["contexto_factual"]
+    fragmentos_obra, fragmentos_influencias = r["fragmentos"]
+
     # 3.2. FLEXIBILIDAD ESTRUCTURAL SEGÚN INTENCIÓN
     rigidez = pesos.get("rigidez_estructural", 0.5)
 
@@ -108,89 +208,96 @@ def ejecutar_pipeline_poetico(params):
     perfil["rigidez"] = rigidez
 
     # 6. CONSTRUIR CONTEXTO LARGO (GEMINI) — VERSIÓN SEGURA
-    # Seleccionar solo los fragmentos necesarios
-    fragmentos_obra = seleccionar(chunks_obra, k=8)
-    fragmentos_influencias = seleccionar(chunks_influencias, k=5)
-
-    # Compactar los fragmentos seleccionados
-    texto_obra = "\n\n".join(fragmentos_obra)
-    texto_influencias = "\n\n".join(fragmentos_influencias)
-
-    # Formatear las instrucciones primero para evitar conflictos con llaves en los textos
+    # Las instrucciones remiten a las secciones del contexto en lugar de
+    # repetir estilo, obra e influencias (evita enviarlos dos veces)
     instrucciones_formateadas = prompt_maestro.format(
-        estilo=perfil_estilistico,
+        estilo=REFERENCIAS["estilo"],
         estructura=EstructuraFlexible(estructura),
-        mezcla=texto_obra,
-        influencias=texto_influencias,
+        mezcla=REFERENCIAS["mezcla"],
+        influencias=REFERENCIAS["influencias"],
         tema=params.get("tema", ""),
         tono_extra=params.get("tono_extra", ""),
         restricciones=params.get("restricciones", ""),
         extension=params.get("extension", "")
     )
 
+    # Contexto deduplicado y ajustado al presupuesto de tokens del modelo
+    with trazas.span("etapa.contexto") as span:
+        CONTEXTO_EXTENDIDO, informe_contexto = construir_contexto(
+            perfil_estilistico,
+            instrucciones_formateadas,
+            fragmentos_obra,
+            fragmentos_influencias,
+            contexto_factual,
+            modelo=google_model or GOOGLE_MODEL
+        )
+        span.fijar(tokens_contexto=informe_contexto["total_tokens"],
+                   fragmentos_recortados=informe_contexto["fragmentos_recortados"])
 
-    # Construir el contexto extendido compacto
-    CONTEXTO_EXTENDIDO = f"""
-    PERFIL_ESTILISTICO:
-    {perfil_estilistico}
-
-    ESTRUCTURA_POETICA:
-    Número de estrofas: {estructura['num_estrofas']}
-    Versos por estrofa: {estructura['versos_por_estrofa']}
-    Tipo de verso: {estructura['tipo_verso']}
-    Ritmo: {estructura['ritmo']}
-    Progresión: {estructura['progresion']}
-    Notas: {estructura['notas']}
-
-    CONTEXTO_OBRA:
-    {texto_obra}
-
-    CONTEXTO_INFLUENCIAS:
-    {texto_influencias}
-
-    CONTEXTO_FACTUAL (solo si γ > 0.15):
-    {contexto_factual}
-
-    INSTRUCCIONES:
-    {instrucciones_formateadas}
-    """
+    # El perfil estilístico es común a todas las peticiones: va a la caché de contexto
+    PREFIJO_ESTABLE, CONTEXTO_VARIABLE = dividir_prefijo(CONTEXTO_EXTENDIDO, perfil_estilistico)
 
     # 7. GENERACIÓN
-    POEMA_INICIAL = gemini_generar_poema(CONTEXTO_EXTENDIDO, f"Escribe un poema sobre: {params['tema']}", model=google_model)
+    yield {"tipo": "etapa", "etapa": "generacion", "estado": "inicio"}
+    with trazas.span("etapa.generacion"):
+        POEMA_INICIAL = yield from _emitir_tokens("generacion", gemini_generar_poema_stream(
+            CONTEXTO_VARIABLE, f"Escribe un poema sobre: {params['tema']}", model=google_model,
+            prefijo=PREFIJO_ESTABLE
+        ))
+    yield {"tipo": "etapa", "etapa": "generacion", "estado": "fin"}
 
     # 8. EVALUACIÓN
-    CRITICA = groq_evaluar_poema(POEMA_INICIAL, prompt_eval, perfil_estilistico, params['tema'], model=groq_model)
-
-    # 9. REESCRITURA
-    POEMA_CORREGIDO = POEMA_INICIAL
-    iteraciones = 0
-    max_iter = 3
+    with trazas.span("etapa.evaluacion"):
+        CRITICA = groq_evaluar_poema(POEMA_INICIAL, prompt_eval, perfil_estilistico, params['tema'], model=groq_model)
+    yield {"tipo": "critica", "critica": CRITICA, "iteracion": 0}
+
+    # 9. REESCRITURA: candidatos (en vivo si es uno), parada temprana y presupuesto de tiempo
+    def reescribir(poema, critica):
+        return groq_reescribir_poema(
+            poema, prompt_rewrite,
+            critica.get("problemas", []), critica.get("sugerencias", []),
+            perfil_estilistico, model=groq_model
+        )
 
-    while not CRITICA.get("ok", False) and iteraciones < max_iter:
-        POEMA_CORREGIDO = groq_reescribir_poema(
-            POEMA_CORREGIDO, prompt_rewrite, 
-            CRITICA.get("problemas", []), CRITICA.get("sugerencias", []), 
+    def reescribir_stream(poema, critica):
+        return groq_reescribir_poema_stream(
+            poema, prompt_rewrite,
+            critica.get("problemas", []), critica.get("sugerencias", []),
             perfil_estilistico, model=groq_model
         )
-        CRITICA = groq_evaluar_poema(POEMA_CORREGIDO, prompt_eval, perfil_estilistico, params['tema'], model=groq_model)
-        iteraciones += 1
+
+    def evaluar(poema):
+        return groq_evaluar_poema(poema, prompt_eval, perfil_estilistico, params['tema'], model=groq_model)
+
+    refinado = yield from refinar(POEMA_INICIAL, CRITICA, reescribir, evaluar,
+                                  reescribir_stream=reescribir_stream)
+    POEMA_CORREGIDO, CRITICA = refinado.pop("poema"), refinado.pop("critica")
 
     # 10. PULIDO FINAL
-    POEMA_FINAL = gemini_pulir_poema(CONTEXTO_EXTENDIDO, POEMA_CORREGIDO, prompt_pulido, model=google_model)
+    yield {"tipo": "etapa", "etapa": "pulido", "estado": "inicio"}
+    with trazas.span("etapa.pulido"):
+        POEMA_FINAL = yield from _emitir_tokens("pulido", gemini_pulir_poema_stream(
+            CONTEXTO_VARIABLE, POEMA_CORREGIDO, prompt_pulido, model=google_model,
+            prefijo=PREFIJO_ESTABLE
+        ))
+    yield {"tipo": "etapa", "etapa": "pulido", "estado": "fin"}
 
     # 11. GENERAR IMAGEN (Opcional)
     imagen = None
 
     if params.get("crear_imagen"):
+        yield {"tipo": "etapa", "etapa": "imagen", "estado": "inicio"}
         try:
             from utils_llamadas import generate_from_poem
-            imagen = generate_from_poem(POEMA_FINAL)
+            with trazas.span("etapa.imagen"):
+                imagen = generate_from_poem(POEMA_FINAL)
         except Exception as e:
-            print("Error generando imagen:", e)
+            log.error("error generando imagen", extra={"datos": {"error": str(e)}})
             imagen = None
+        yield {"tipo": "etapa", "etapa": "imagen", "estado": "fin"}
 
 
-    return {
+    yield {"tipo": "resultado", "resultado": {
         "poema_final": POEMA_FINAL,
         "poema_inicial": POEMA_INICIAL,
         "poema_corregido": POEMA_CORREGIDO,
@@ -198,5 +305,6 @@ def ejecutar_pipeline_poetico(params):
         "estructura": estructura,
         "pesos": pesos,
         "perfil": perfil,
-        "imagen": imagen
-    }
\ No newline at end of file
+        "imagen": imagen,
+        "metricas": {"contexto": informe_contexto, "refinamiento": refinado}
+    }}
\ No newline at end of file
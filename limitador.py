@@ -0,0 +1,256 @@
+import re
+import time
+import random
+import threading
+
+import requests
+
+import cliente_http
+from config import get_config
+from registro import obtener_logger
+
+# ============================
+#  LIMITADOR DE PETICIONES
+# ============================
+#
+# Un cubo de tokens por proveedor. Las peticiones esperan turno en orden de
+# llegada (FIFO), así que ninguna sesión de Streamlit acapara el cupo. Las
+# cabeceras Retry-After / x-ratelimit-* bloquean al proveedor entero hasta el
+# reinicio, en vez de que cada hilo duerma y reintente a la vez.
+
+LIMITES = {
+    # proveedor: (peticiones por minuto, ráfaga)
+    "groq": (30, 5),
+    "deepseek": (60, 5),
+    "brave": (60, 1),
+    "google": (60, 5),
+}
+
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = float(get_config("BACKOFF_BASE", "1.0"))
+BACKOFF_MAX = float(get_config("BACKOFF_MAX", "30.0"))
+
+log = obtener_logger("limitador")
+
+
+class LimiteExcedido(Exception):
+    pass
+
+
+def _segundos(valor):
+    """Convierte '7.66s', '2m59.56s', '1h2m' o '120ms' (o un número) a segundos."""
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    try:
+        return float(valor)
+    except ValueError:
+        pass
+    total = 0.0
+    partes = re.findall(r"([\d.]+)(ms|h|m|s)", valor)
+    if not partes:
+        return None
+    for numero, unidad in partes:
+        total += float(numero) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unidad]
+    return total
+
+
+def backoff(intento):
+    """Backoff exponencial con jitter completo."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** intento))
+
+
+class LimitadorProveedor:
+    def __init__(self, nombre, rpm, rafaga):
+        self.nombre = nombre
+        self.tasa = rpm / 60.0
+        self.capacidad = float(rafaga)
+        self.tokens = float(rafaga)
+        self.ultimo = time.monotonic()
+        self.bloqueado_hasta = 0.0
+        self._cond = threading.Condition()
+        self._siguiente_turno = 0
+        self._turno_actual = 0
+        self.estadisticas = {
+            "llamadas": 0, "reintentos": 0, "errores_429": 0,
+            "cola_s": 0.0, "red_s": 0.0, "en_cola": 0,
+        }
+
+    def _rellenar(self, ahora):
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.tasa)
+        self.ultimo = ahora
+
+    def adquirir(self):
+        """Espera turno y un token. Devuelve los segundos pasados en cola."""
+        inicio = time.monotonic()
+        with self._cond:
+            turno = self._siguiente_turno
+            self._siguiente_turno += 1
+            self.estadisticas["en_cola"] += 1
+            while True:
+                ahora = time.monotonic()
+                self._rellenar(ahora)
+                if turno != self._turno_actual:
+                    self._cond.wait()
+                    continue
+                espera = self.bloqueado_hasta - ahora
+                if espera <= 0 and self.tokens >= 1:
+                    self.tokens -= 1
+                    self._turno_actual += 1
+                    self.estadisticas["en_cola"] -= 1
+                    self._cond.notify_all()
+                    break
+                if espera <= 0:
+                    espera = (1 - self.tokens) / self.tasa
+                self._cond.wait(espera)
+        return time.monotonic() - inicio
+
+    def bloquear(self, segundos):
+        with self._cond:
+            self.bloqueado_hasta = max(self.bloqueado_hasta, time.monotonic() + segundos)
+            self._cond.notify_all()
+
+    def actualizar(self, cabeceras):
+        """Ajusta el cubo con las cabeceras de límite que devuelve el proveedor."""
+        restantes = cabeceras.get("x-ratelimit-remaining-requests")
+        reinicio = _segundos(cabeceras.get("x-ratelimit-reset-requests"))
+        if restantes is None:
+            return
+        try:
+            restantes = int(restantes)
+        except ValueError:
+            return
+        with self._cond:
+            self.tokens = min(self.tokens, float(restantes))
+            if restantes == 0 and reinicio:
+                self.bloqueado_hasta = max(self.bloqueado_hasta, time.monotonic() + reinicio)
+
+    def registrar(self, metricas):
+        with self._cond:
+            self.estadisticas["llamadas"] += 1
+            self.estadisticas["reintentos"] += metricas["reintentos"]
+            self.estadisticas["errores_429"] += metricas["errores_429"]
+            self.estadisticas["cola_s"] += metricas["cola_s"]
+            self.estadisticas["red_s"] += metricas["red_s"]
+
+
+_lock = threading.Lock()
+_limitadores = {}
+
+
+def obtener_limitador(proveedor):
+    with _lock:
+        if proveedor not in _limitadores:
+            rpm, rafaga = LIMITES.get(proveedor, (60, 1))
+            clave = proveedor.upper()
+            _limitadores[proveedor] = LimitadorProveedor(
+                proveedor,
+                float(get_config(f"LIMITE_RPM_{clave}", rpm)),
+                float(get_config(f"LIMITE_RAFAGA_{clave}", rafaga)),
+            )
+        return _limitadores[proveedor]
+
+
+def solicitar(proveedor, metodo, url, intentos=3, **kwargs):
+    """
+    Petición HTTP respetando el límite del proveedor, con reintentos ante 429,
+    5xx y timeouts. La respuesta lleva `metricas_llamada` con el tiempo en cola
+    y en red, reintentos y esperas por 429.
+    """
+    limitador = obtener_limitador(proveedor)
+    metricas = {
+        "proveedor": proveedor, "cola_s": 0.0, "red_s": 0.0,
+        "reintentos": 0, "errores_429": 0, "espera_429_s": 0.0,
+    }
+    response, error = None, None
+
+    for intento in range(intentos):
+        metricas["cola_s"] += limitador.adquirir()
+        inicio = time.monotonic()
+        try:
+            response, error = cliente_http.solicitar(proveedor, metodo, url, **kwargs), None
+        except (requests.Timeout, requests.ConnectionError) as e:
+            response, error = None, e
+        metricas["red_s"] += time.monotonic() - inicio
+
+        if response is not None:
+            limitador.actualizar(response.headers)
+            if response.status_code == 429:
+                metricas["errores_429"] += 1
+            if response.status_code not in ESTADOS_REINTENTABLES:
+                break
+
+        if intento == intentos - 1:
+            break
+
+        metricas["reintentos"] += 1
+        espera = backoff(intento)
+        if response is not None and response.status_code == 429:
+            espera = max(espera, _segundos(response.headers.get("retry-after")) or 0)
+            metricas["espera_429_s"] += espera
+            log.warning("rate limit", extra={"datos": {"proveedor": proveedor, "espera_s": round(espera, 2), "intento": intento + 1}})
+            # El bloqueo afecta a todas las peticiones en cola del proveedor
+            limitador.bloquear(espera)
+        else:
+            time.sleep(espera)
+
+    limitador.registrar(metricas)
+
+    if error is not None:
+        raise error
+    if response.status_code == 429:
+        raise LimiteExcedido(f"Demasiados intentos fallidos por rate limit (429) en {proveedor}")
+    response.metricas_llamada = metricas
+    return response
+
+
+def ejecutar(proveedor, funcion, clasificar, intentos=3, errores_red=()):
+    """
+    Llamada de un SDK (sin `requests` de por medio) con el mismo turno,
+    reintentos y métricas que `solicitar`. `clasificar(error)` devuelve
+    (estado HTTP o None, valor de Retry-After o None); se reintentan los
+    ESTADOS_REINTENTABLES y las excepciones de `errores_red`. Devuelve
+    (resultado de `funcion`, métricas de la llamada como `metricas_llamada`).
+    """
+    limitador = obtener_limitador(proveedor)
+    metricas = {
+        "proveedor": proveedor, "cola_s": 0.0, "red_s": 0.0,
+        "reintentos": 0, "errores_429": 0, "espera_429_s": 0.0,
+    }
+
+    try:
+        for intento in range(intentos):
+            metricas["cola_s"] += limitador.adquirir()
+            inicio = time.monotonic()
+            try:
+                return funcion(), metricas
+            except errores_red:
+                estado, retry_after = None, None
+                if intento == intentos - 1:
+                    raise
+            except Exception as e:
+                estado, retry_after = clasificar(e)
+                if estado == 429:
+                    metricas["errores_429"] += 1
+                if estado not in ESTADOS_REINTENTABLES or intento == intentos - 1:
+                    raise
+            finally:
+                metricas["red_s"] += time.monotonic() - inicio
+
+            metricas["reintentos"] += 1
+            espera = backoff(intento)
+            if estado == 429:
+                espera = max(espera, _segundos(retry_after) or 0)
+                metricas["espera_429_s"] += espera
+                log.warning("rate limit", extra={"datos": {"proveedor": proveedor, "espera_s": round(espera, 2), "intento": intento + 1}})
+                limitador.bloquear(espera)
+            else:
+                time.sleep(espera)
+    finally:
+        limitador.registrar(metricas)
+
+
+def estadisticas():
+    with _lock:
+        limitadores = list(_limitadores.values())
+    return {l.nombre: dict(l.estadisticas) for l in limitadores}
@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import time
+import base64
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Aseguramos que se pueda importar desde el directorio actual
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import get_config
+from generar_poema import ejecutar_pipeline_poetico
+
+LOTE_TRABAJADORES = int(get_config("LOTE_TRABAJADORES", "2"))
+
+# ============================
+#  GENERACIÓN POR LOTES
+# ============================
+#
+# Lee un JSONL de parámetros (uno por línea, con "id" opcional), ejecuta el
+# pipeline en un pool acotado de hilos y escribe cada resultado en un JSONL de
+# salida en cuanto termina. La propia salida hace de checkpoint: al relanzar,
+# los ids ya completados con éxito se saltan. Los límites de cada proveedor los
+# aplica el limitador compartido, así que el pool solo acota la concurrencia.
+
+
+def _id_de(params, linea):
+    return str(params.get("id") or hashlib.sha1(linea.encode("utf-8")).hexdigest()[:16])
+
+
+def leer_entrada(ruta):
+    with open(ruta, 'r', encoding='utf-8') as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea:
+                continue
+            params = json.loads(linea)
+            yield _id_de(params, linea), params
+
+
+def recortar_linea_parcial(ruta_salida, bloque=1 << 16):
+    """
+    Quita lo que haya tras el último salto de línea: una línea a medias de
+    una caída. Si se dejara, el primer registro nuevo se pegaría a ella y
+    ninguno de los dos se podría leer.
+    """
+    if not os.path.exists(ruta_salida):
+        return 0
+    with open(ruta_salida, 'r+b') as f:
+        tamaño = fin = f.seek(0, os.SEEK_END)
+        while fin > 0:
+            inicio = max(0, fin - bloque)
+            f.seek(inicio)
+            salto = f.read(fin - inicio).rfind(b"\n")
+            if salto >= 0:
+                fin = inicio + salto + 1
+                break
+            fin = inicio
+        if fin < tamaño:
+            f.truncate(fin)
+    return tamaño - fin
+
+
+def completados(ruta_salida):
+    hechos = set()
+    if os.path.exists(ruta_salida):
+        with open(ruta_salida, 'r', encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    registro = json.loads(linea)
+                except json.JSONDecodeError:
+                    # Línea corrupta por una caída: se regenera
+                    continue
+                if registro.get("estado") == "ok":
+                    hechos.add(registro["id"])
+    return hechos
+
+
+def _serializable(resultado):
+    resultado = dict(resultado)
+    if isinstance(resultado.get("imagen"), (bytes, bytearray)):
+        resultado["imagen"] = base64.b64encode(resultado["imagen"]).decode("ascii")
+    return resultado
+
+
+def _ejecutar_item(id_item, params):
+    inicio = time.time()
+    t0 = time.perf_counter()
+    registro = {"id": id_item, "params": params, "inicio": inicio}
+    try:
+        registro.update(_serializable(ejecutar_pipeline_poetico(params)))
+        registro["estado"] = "ok"
+    except Exception as e:
+        registro["estado"] = "error"
+        registro["error"] = f"{type(e).__name__}: {e}"
+    registro["duracion_s"] = round(time.perf_counter() - t0, 3)
+    return registro
+
+
+def ejecutar_lote(ruta_entrada, ruta_salida, trabajadores=LOTE_TRABAJADORES):
+    """
+    Ejecuta todos los parámetros de `ruta_entrada` que no estén ya completados
+    en `ruta_salida`. Devuelve un resumen con los contadores del lote.
+    """
+    recortados = recortar_linea_parcial(ruta_salida)
+    if recortados:
+        print(f"Descartados {recortados} bytes de una línea incompleta al final de {ruta_salida}")
+    hechos = completados(ruta_salida)
+    resumen = {"ok": 0, "error": 0, "saltados": 0}
+    lock = threading.Lock()
+    inicio = time.perf_counter()
+
+    os.makedirs(os.path.dirname(os.path.abspath(ruta_salida)), exist_ok=True)
+    with open(ruta_salida, 'a', encoding='utf-8') as salida, \
+            ThreadPoolExecutor(max_workers=trabajadores) as pool:
+
+        def escribir(registro):
+            with lock:
+                salida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                salida.flush()
+                os.fsync(salida.fileno())
+                resumen[registro["estado"]] += 1
+            print(f"[{registro['estado']}] {registro['id']} ({registro['duracion_s']}s)")
+
+        # Como mucho 2 tareas por trabajador en vuelo: la entrada se lee en streaming
+        en_vuelo = set()
+        for id_item, params in leer_entrada(ruta_entrada):
+            if id_item in hechos:
+                resumen["saltados"] += 1
+                continue
+            hechos.add(id_item)
+            if len(en_vuelo) >= 2 * trabajadores:
+                terminados, en_vuelo = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                for futuro in terminados:
+                    escribir(futuro.result())
+            en_vuelo.add(pool.submit(_ejecutar_item, id_item, params))
+
+        for futuro in en_vuelo:
+            escribir(futuro.result())
+
+    resumen["duracion_s"] = round(time.perf_counter() - inicio, 3)
+    return resumen
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera poemas por lotes a partir de un JSONL de parámetros.")
+    parser.add_argument("entrada", help="JSONL con un diccionario de parámetros por línea")
+    parser.add_argument("salida", help="JSONL de resultados (también sirve de checkpoint)")
+    parser.add_argument("-t", "--trabajadores", type=int, default=LOTE_TRABAJADORES)
+    args = parser.parse_args()
+
+    print(f"=== Lote: {args.entrada} -> {args.salida} ({args.trabajadores} trabajadores) ===")
+    resumen = ejecutar_lote(args.entrada, args.salida, trabajadores=args.trabajadores)
+    print(f"=== Resumen: {resumen} ===")
+
+
+if __name__ == "__main__":
+    main()
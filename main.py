@@ -4,7 +4,8 @@ import os
 # Aseguramos que se pueda importar desde el directorio actual
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from generar_poema import ejecutar_pipeline_poetico
+# Con SERVICIO_URL definida se usa el servicio residente (servicio.py)
+from cliente_servicio import ejecutar_pipeline_poetico, estadisticas
 
 def main():
     # Valores por defecto para los parámetros (similares a construir_prompt_maestro)
@@ -24,5 +25,8 @@ def main():
     print("\n=== POEMA FINAL ===")
     print(resultado["poema_final"])
 
+    print("\n=== CACHÉ DE ACTIVOS ===")
+    print(estadisticas()["activos"])
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,80 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# ============================
+#  EJECUCIÓN DE ETAPAS EN DAG
+# ============================
+
+# threading.Event del trabajo en curso (lo fija cola_trabajos). El DAG lo
+# consulta mientras espera a sus etapas y deja de lanzar nuevas si se activa.
+cancelacion = contextvars.ContextVar("cancelacion", default=None)
+
+INTERVALO_CANCELACION_S = 0.2
+
+
+class Cancelado(Exception):
+    pass
+
+
+def comprobar_cancelacion():
+    """Lanza Cancelado si se ha pedido cancelar el trabajo en curso."""
+    evento = cancelacion.get()
+    if evento is not None and evento.is_set():
+        raise Cancelado("trabajo cancelado")
+
+
+def ejecutar_dag(etapas, max_workers=4):
+    """
+    Ejecuta un grafo de etapas lo antes posible respetando sus dependencias.
+
+    `etapas` es un diccionario {nombre: (dependencias, funcion)}, donde cada
+    función recibe el diccionario de resultados ya disponibles. Las etapas
+    cuyas dependencias están resueltas se lanzan en paralelo en un pool de
+    hilos, de modo que la latencia total la marca el camino crítico.
+    Devuelve {nombre: resultado}; si una etapa falla, se propaga su excepción.
+    Si se cancela el trabajo (`cancelacion`) lanza Cancelado sin esperar a las
+    etapas en curso.
+    """
+    for nombre, (deps, _) in etapas.items():
+        faltan = [d for d in deps if d not in etapas]
+        if faltan:
+            raise ValueError(f"La etapa '{nombre}' depende de etapas inexistentes: {faltan}")
+
+    resultados = {}
+    pendientes = dict(etapas)
+    en_curso = {}
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    cancelado = False
+    try:
+        while pendientes or en_curso:
+            listas = [n for n, (deps, _) in pendientes.items() if all(d in resultados for d in deps)]
+            for nombre in listas:
+                _, funcion = pendientes.pop(nombre)
+                # Cada etapa hereda el contexto (p. ej. la traza en curso) del llamador
+                contexto = contextvars.copy_context()
+                en_curso[pool.submit(contexto.run, funcion, dict(resultados))] = nombre
+
+            if not en_curso:
+                raise ValueError(f"Dependencias cíclicas entre etapas: {list(pendientes)}")
+
+            hechas = set()
+            while not hechas:
+                comprobar_cancelacion()
+                hechas, _ = wait(en_curso, timeout=INTERVALO_CANCELACION_S, return_when=FIRST_COMPLETED)
+            for futuro in hechas:
+                nombre = en_curso.pop(futuro)
+                try:
+                    resultados[nombre] = futuro.result()
+                except Exception:
+                    for f in en_curso:
+                        f.cancel()
+                    raise
+    except Cancelado:
+        cancelado = True
+        raise
+    finally:
+        # Cancelado: las etapas en curso terminan solas, sin que nadie las espere
+        pool.shutdown(wait=not cancelado, cancel_futures=cancelado)
+
+    return resultados
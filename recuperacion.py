@@ -0,0 +1,164 @@
+import os
+import math
+import threading
+
+from config import (
+    RECUPERACION_MODO, RECUPERACION_K_OBRA, RECUPERACION_K_INFLUENCIAS,
+    RECUPERACION_MMR_LAMBDA, CHROMA_OBRA, CHROMA_INFLUENCIAS
+)
+from utils_llamadas import seleccionar
+from registro import obtener_logger
+
+MODOS = ("aleatorio", "semantico", "mmr")
+
+log = obtener_logger("recuperacion")
+
+# ============================
+#  ESTADO CALIENTE (PROCESO)
+# ============================
+
+_lock = threading.Lock()
+_clientes = {}
+_colecciones = {}
+_chromadb = None
+
+
+def _modulo_chromadb():
+    """chromadb se importa en el primer uso (tarda segundos); None si no está instalado."""
+    global _chromadb
+    if _chromadb is None:
+        try:
+            import chromadb
+            _chromadb = chromadb
+        except ImportError:
+            _chromadb = False
+    return _chromadb or None
+
+
+def _obtener_coleccion(ruta):
+    """
+    Devuelve la colección persistente de `ruta`, o None si no existe o está vacía.
+    El PersistentClient y la colección se crean una sola vez por proceso.
+    """
+    if not os.path.isdir(ruta):
+        return None
+    chromadb = _modulo_chromadb()
+    if chromadb is None:
+        return None
+
+    with _lock:
+        if ruta in _colecciones:
+            return _colecciones[ruta]
+        try:
+            if ruta not in _clientes:
+                _clientes[ruta] = chromadb.PersistentClient(path=ruta)
+            nombre = os.path.basename(os.path.normpath(ruta))
+            coleccion = _clientes[ruta].get_collection(name=nombre)
+            if coleccion.count() == 0:
+                coleccion = None
+        except Exception as e:
+            log.warning("colección Chroma no disponible", extra={"datos": {"ruta": ruta, "error": str(e)}})
+            coleccion = None
+        _colecciones[ruta] = coleccion
+        return coleccion
+
+
+def calentar():
+    """Carga clientes, colecciones y modelo de embeddings antes del primer poema."""
+    if _modulo_chromadb() is None:
+        return False
+    from embeddings import funcion_embedding
+    funcion_embedding()
+    _obtener_coleccion(CHROMA_OBRA)
+    _obtener_coleccion(CHROMA_INFLUENCIAS)
+    return True
+
+
+# ============================
+#  SELECCIÓN
+# ============================
+
+def _coseno(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    if na == 0 or nb == 0:
+        return 0.0
+    return dot / (na * nb)
+
+
+def mmr(consulta, documentos, embeddings, k, lambda_=RECUPERACION_MMR_LAMBDA):
+    """
+    Maximal Marginal Relevance: equilibra relevancia respecto a la consulta
+    y diversidad respecto a los fragmentos ya elegidos.
+    """
+    relevancia = [_coseno(consulta, e) for e in embeddings]
+    candidatos = list(range(len(documentos)))
+    elegidos = []
+
+    while candidatos and len(elegidos) < k:
+        def puntuacion(i):
+            redundancia = max((_coseno(embeddings[i], embeddings[j]) for j in elegidos), default=0.0)
+            return lambda_ * relevancia[i] - (1 - lambda_) * redundancia
+
+        mejor = max(candidatos, key=puntuacion)
+        elegidos.append(mejor)
+        candidatos.remove(mejor)
+
+    return [documentos[i] for i in elegidos]
+
+
+def buscar(ruta, tema, k, modo):
+    """
+    Devuelve hasta k fragmentos de la colección de `ruta` ordenados por relevancia,
+    o None si la búsqueda semántica no es posible.
+    """
+    coleccion = _obtener_coleccion(ruta)
+    if coleccion is None or not tema:
+        return None
+
+    try:
+        # Mismo modelo que la ingesta; la consulta no se guarda en el almacén
+        from embeddings import embeber
+        consulta = embeber([tema], persistir=False)[0].tolist()
+        n = k if modo == "semantico" else k * 4
+        resultados = coleccion.query(
+            query_embeddings=[consulta],
+            n_results=min(n, coleccion.count()),
+            include=["documents", "embeddings"] if modo == "mmr" else ["documents"]
+        )
+    except Exception as e:
+        log.error("error consultando Chroma", extra={"datos": {"ruta": ruta, "error": str(e)}})
+        return None
+
+    documentos = resultados["documents"][0] if resultados.get("documents") else []
+    if modo == "mmr" and documentos:
+        embeddings = [[float(x) for x in e] for e in resultados["embeddings"][0]]
+        return mmr(consulta, documentos, embeddings, k)
+    return documentos[:k]
+
+
+def recuperar_fragmentos(tema, chunks_obra, chunks_influencias, modo=None,
+                         k_obra=None, k_influencias=None):
+    """
+    Selecciona los fragmentos de obra e influencias que se envían como contexto.
+    Si la búsqueda semántica no está disponible, se recurre al muestreo aleatorio
+    sobre el almacén de chunks.
+    """
+    modo = modo or RECUPERACION_MODO
+    if modo not in MODOS:
+        raise ValueError(f"Modo de recuperación desconocido: {modo}")
+    k_obra = RECUPERACION_K_OBRA if k_obra is None else k_obra
+    k_influencias = RECUPERACION_K_INFLUENCIAS if k_influencias is None else k_influencias
+
+    fragmentos_obra = fragmentos_influencias = None
+    if modo != "aleatorio":
+        fragmentos_obra = buscar(CHROMA_OBRA, tema, k_obra, modo)
+        fragmentos_influencias = buscar(CHROMA_INFLUENCIAS, tema, k_influencias, modo)
+
+    if fragmentos_obra is None:
+        fragmentos_obra = seleccionar(chunks_obra, k=k_obra)
+    if fragmentos_influencias is None:
+        fragmentos_influencias = seleccionar(chunks_influencias, k=k_influencias)
+
+    return fragmentos_obra, fragmentos_influencias
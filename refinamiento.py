@@ -0,0 +1,165 @@
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import trazas
+from config import (
+    REFINAMIENTO_RONDAS, REFINAMIENTO_CANDIDATOS, REFINAMIENTO_UMBRAL,
+    REFINAMIENTO_MEJORA_MINIMA, REFINAMIENTO_PRESUPUESTO_S
+)
+from registro import obtener_logger
+
+# ============================
+#  MOTOR DE REFINAMIENTO
+# ============================
+#
+# Sustituye al bucle evaluar/reescribir en serie. En cada ronda se generan
+# REFINAMIENTO_CANDIDATOS reescrituras en paralelo; cada hilo evalúa su propio
+# candidato en cuanto lo tiene, y se queda el mejor (nunca se empeora el poema
+# vigente). Con un solo candidato (por defecto) y `reescribir_stream`, la
+# reescritura se emite en vivo, fragmento a fragmento. Se para cuando:
+#   - la crítica da ok o la puntuación alcanza REFINAMIENTO_UMBRAL
+#   - la mejora de la ronda es menor que REFINAMIENTO_MEJORA_MINIMA (meseta)
+#   - se agotan las rondas (REFINAMIENTO_RONDAS)
+#   - no queda presupuesto de tiempo (REFINAMIENTO_PRESUPUESTO_S por poema):
+#     no se empieza una ronda que, a juzgar por la anterior, no cabe, y los
+#     candidatos que no terminan a tiempo se descartan.
+
+log = obtener_logger("refinamiento")
+
+
+def puntuacion(critica):
+    """Puntuación 0-10 de una crítica; si el modelo no la da, se estima."""
+    try:
+        return max(0.0, min(10.0, float(critica["puntuacion"])))
+    except (KeyError, TypeError, ValueError):
+        if critica.get("ok"):
+            return 10.0
+        return max(0.0, 10.0 - len(critica.get("problemas", [])))
+
+
+def _aceptable(critica, umbral):
+    return bool(critica.get("ok")) or puntuacion(critica) >= umbral
+
+
+def _candidato(reescribir, evaluar, poema, critica, indice):
+    with trazas.span("refinamiento.candidato", candidato=indice) as span:
+        texto = reescribir(poema, critica)
+        evaluacion = evaluar(texto)
+        span.fijar(puntuacion=puntuacion(evaluacion))
+        return texto, evaluacion
+
+
+def _candidato_en_vivo(reescribir_stream, evaluar, poema, critica, limite):
+    """
+    Un único candidato emitido como eventos token a medida que llega.
+    Devuelve (resultados, fuera_de_plazo) como la ronda en paralelo.
+    """
+    fragmentos = reescribir_stream(poema, critica)
+    partes = []
+    try:
+        with trazas.span("refinamiento.candidato", candidato=0, stream=True) as span:
+            for fragmento in fragmentos:
+                partes.append(fragmento)
+                yield {"tipo": "token", "etapa": "reescritura", "texto": fragmento}
+                if time.perf_counter() > limite:
+                    return [], True
+            texto = "".join(partes)
+            evaluacion = evaluar(texto)
+            span.fijar(puntuacion=puntuacion(evaluacion))
+            return [(texto, evaluacion)], False
+    finally:
+        fragmentos.close()
+
+
+def refinar(poema, critica, reescribir, evaluar, candidatos=REFINAMIENTO_CANDIDATOS,
+            rondas=REFINAMIENTO_RONDAS, umbral=REFINAMIENTO_UMBRAL,
+            mejora_minima=REFINAMIENTO_MEJORA_MINIMA, presupuesto_s=REFINAMIENTO_PRESUPUESTO_S,
+            reescribir_stream=None):
+    """
+    Generador de eventos del pipeline (etapa, token, critica). `reescribir`
+    recibe (poema, critica) y devuelve el texto nuevo; `reescribir_stream`,
+    opcional, lo mismo como generador de fragmentos; `evaluar` recibe un
+    poema y devuelve su crítica. Devuelve un diccionario con el poema, la
+    crítica, las rondas hechas y el motivo de parada.
+    """
+    limite = time.perf_counter() + presupuesto_s
+    informe = {"rondas": 0, "candidatos_evaluados": 0, "puntuaciones": [puntuacion(critica)],
+               "motivo": "aceptado" if _aceptable(critica, umbral) else "rondas"}
+    duracion_ronda = 0.0
+
+    pool = ThreadPoolExecutor(max_workers=max(1, candidatos))
+    try:
+        while not _aceptable(critica, umbral) and informe["rondas"] < rondas:
+            restante = limite - time.perf_counter()
+            if restante <= 0 or restante < duracion_ronda:
+                informe["motivo"] = "presupuesto"
+                break
+
+            ronda = informe["rondas"] + 1
+            yield {"tipo": "etapa", "etapa": "reescritura", "estado": "inicio"}
+            t0 = time.perf_counter()
+            en_vivo = candidatos == 1 and reescribir_stream is not None
+            with trazas.span("etapa.reescritura", iteracion=ronda, candidatos=candidatos) as span:
+                if en_vivo:
+                    try:
+                        resultados, fuera_de_plazo = yield from _candidato_en_vivo(
+                            reescribir_stream, evaluar, poema, critica, limite)
+                    except Exception as e:
+                        log.warning("candidato descartado", extra={"datos": {
+                            "ronda": ronda, "error": f"{type(e).__name__}: {e}",
+                        }})
+                        resultados, fuera_de_plazo = [], False
+                    pendientes = [None] if fuera_de_plazo else []
+                else:
+                    futuros = [
+                        pool.submit(contextvars.copy_context().run, _candidato,
+                                    reescribir, evaluar, poema, critica, i)
+                        for i in range(candidatos)
+                    ]
+                    hechos, pendientes = wait(futuros, timeout=restante)
+                    for f in pendientes:
+                        f.cancel()
+
+                    resultados = []
+                    for f in hechos:
+                        try:
+                            resultados.append(f.result())
+                        except Exception as e:
+                            log.warning("candidato descartado", extra={"datos": {
+                                "ronda": ronda, "error": f"{type(e).__name__}: {e}",
+                            }})
+                span.fijar(completados=len(resultados), fuera_de_plazo=len(pendientes))
+            duracion_ronda = time.perf_counter() - t0
+            informe["rondas"] = ronda
+            informe["candidatos_evaluados"] += len(resultados)
+
+            if not resultados:
+                yield {"tipo": "etapa", "etapa": "reescritura", "estado": "fin"}
+                informe["motivo"] = "presupuesto" if pendientes else "errores"
+                break
+
+            texto, evaluacion = max(resultados, key=lambda r: puntuacion(r[1]))
+            mejora = puntuacion(evaluacion) - puntuacion(critica)
+            if mejora > 0 or evaluacion.get("ok"):
+                poema, critica = texto, evaluacion
+            informe["puntuaciones"].append(puntuacion(critica))
+
+            if not en_vivo:
+                yield {"tipo": "token", "etapa": "reescritura", "texto": poema}
+            yield {"tipo": "etapa", "etapa": "reescritura", "estado": "fin"}
+            yield {"tipo": "critica", "critica": critica, "iteracion": ronda}
+
+            if _aceptable(critica, umbral):
+                informe["motivo"] = "aceptado"
+                break
+            if mejora < mejora_minima:
+                informe["motivo"] = "meseta"
+                break
+    finally:
+        # Los candidatos fuera de plazo no bloquean el pipeline
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    informe["poema"] = poema
+    informe["critica"] = critica
+    return informe
@@ -0,0 +1,94 @@
+import sys
+import json
+import random
+import hashlib
+import logging
+import threading
+
+from config import get_config
+
+# ============================
+#  REGISTRO ESTRUCTURADO
+# ============================
+#
+# Loggers "gulag.<modulo>" que escriben una línea JSON por evento en stderr.
+#
+#   LOG_NIVEL      nivel global (por defecto WARNING)
+#   LOG_NIVELES    niveles por módulo, p. ej. "utils_llamadas=DEBUG,limitador=INFO"
+#   LOG_MUESTREO   fracción (0-1) de eventos DEBUG que se emiten
+#
+# Los prompts nunca se vuelcan enteros: se registra su huella (hash, longitud
+# y comienzo). Quien llama comprueba `log.isEnabledFor(...)` antes de calcular
+# nada costoso, así que con el nivel desactivado el coste es nulo.
+
+LOG_NIVEL = str(get_config("LOG_NIVEL", "WARNING")).upper()
+LOG_NIVELES = get_config("LOG_NIVELES", "")
+LOG_MUESTREO = float(get_config("LOG_MUESTREO", "1.0"))
+LONGITUD_HUELLA = 80
+
+_lock = threading.Lock()
+_configurado = False
+
+
+class FormatoJSON(logging.Formatter):
+    def format(self, record):
+        evento = {
+            "ts": round(record.created, 3),
+            "nivel": record.levelname,
+            "modulo": record.name.split(".", 1)[-1],
+            "mensaje": record.getMessage(),
+        }
+        datos = getattr(record, "datos", None)
+        if datos:
+            evento.update(datos)
+        if record.exc_info:
+            evento["excepcion"] = self.formatException(record.exc_info)
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+class FiltroMuestreo(logging.Filter):
+    """Deja pasar solo una fracción de los eventos DEBUG; el resto siempre."""
+
+    def __init__(self, fraccion):
+        super().__init__()
+        self.fraccion = fraccion
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.fraccion >= 1.0:
+            return True
+        return random.random() < self.fraccion
+
+
+def _configurar():
+    global _configurado
+    with _lock:
+        if _configurado:
+            return
+        raiz = logging.getLogger("gulag")
+        raiz.setLevel(LOG_NIVEL)
+        raiz.propagate = False
+        manejador = logging.StreamHandler(sys.stderr)
+        manejador.setFormatter(FormatoJSON())
+        manejador.addFilter(FiltroMuestreo(LOG_MUESTREO))
+        raiz.addHandler(manejador)
+
+        for par in filter(None, (p.strip() for p in LOG_NIVELES.split(","))):
+            modulo, _, nivel = par.partition("=")
+            logging.getLogger(f"gulag.{modulo.strip()}").setLevel(nivel.strip().upper())
+        _configurado = True
+
+
+def obtener_logger(modulo):
+    _configurar()
+    return logging.getLogger(f"gulag.{modulo}")
+
+
+def huella(texto):
+    """Resumen de un prompt para los logs: hash, longitud y comienzo truncado."""
+    texto = texto or ""
+    return {
+        "sha256": hashlib.sha256(texto.encode("utf-8")).hexdigest()[:16],
+        "longitud": len(texto),
+        "inicio": texto[:LONGITUD_HUELLA],
+    }
+
@@ -0,0 +1,191 @@
+import re
+import json
+import threading
+
+import requests
+
+import trazas
+import enrutador
+from registro import obtener_logger, huella
+
+# ============================
+#  SALIDA ESTRUCTURADA (JSON)
+# ============================
+#
+# Respuestas JSON del crítico y del clasificador:
+#   1. se piden en modo JSON del proveedor (response_format json_object en
+#      Groq/DeepSeek, application/json en Gemini) a través del enrutador
+#   2. se validan contra un esquema declarado (tipos y campos obligatorios),
+#      con coerciones baratas ("true" -> True, "7" -> 7.0) antes de dar nada
+#      por perdido
+#   3. si aun así no valen, se hace UNA reparación: una llamada corta, a
+#      temperatura 0, que solo recibe la respuesta defectuosa y los errores
+#   4. si la reparación también falla se lanza SalidaInvalida y quien llama
+#      aplica su valor por defecto
+# Cada fallo de formato se cuenta (estadisticas() y "fallos_formato" en las
+# métricas de la traza). Las respuestas inválidas nunca entran en la caché.
+
+log = obtener_logger("salida_estructurada")
+
+_lock = threading.Lock()
+_stats = {}
+
+
+class SalidaInvalida(Exception):
+    pass
+
+
+class Campo:
+    def __init__(self, tipo, requerido=True):
+        self.tipo = tipo
+        self.requerido = requerido
+
+
+ESQUEMA_CRITICA = {
+    "ok": Campo(bool),
+    "problemas": Campo(list),
+    "sugerencias": Campo(list),
+    "puntuacion": Campo(float, requerido=False),
+}
+
+ESQUEMA_CLASIFICACION = {
+    "categoria": Campo(str),
+    "tono_emocional": Campo(str),
+    "nivel_abstraccion": Campo(str),
+    "grado_factualidad": Campo(str),
+    "densidad_metaforica": Campo(str),
+    "intencion_poetica": Campo(str),
+}
+
+
+def _coercer(valor, tipo):
+    if isinstance(valor, tipo) and not (tipo is float and isinstance(valor, bool)):
+        return valor
+    if tipo is bool and isinstance(valor, str) and valor.strip().lower() in ("true", "false"):
+        return valor.strip().lower() == "true"
+    if tipo is float and isinstance(valor, (int, str)) and not isinstance(valor, bool):
+        return float(valor)
+    if tipo is list and isinstance(valor, str):
+        return [valor] if valor.strip() else []
+    raise ValueError(f"se esperaba {tipo.__name__}, llegó {type(valor).__name__}")
+
+
+def validar(datos, esquema):
+    """Devuelve (datos coercionados, lista de errores)."""
+    if not isinstance(datos, dict):
+        return datos, ["la respuesta no es un objeto JSON"]
+    datos = dict(datos)
+    errores = []
+    for nombre, campo in esquema.items():
+        if nombre not in datos or datos[nombre] is None:
+            if campo.requerido:
+                errores.append(f"falta el campo '{nombre}'")
+            continue
+        try:
+            datos[nombre] = _coercer(datos[nombre], campo.tipo)
+        except ValueError as e:
+            errores.append(f"campo '{nombre}': {e}")
+    return datos, errores
+
+
+def extraer_json(texto):
+    """Objeto JSON de una respuesta; tolera bloques <think> y vallas ```json."""
+    texto = re.sub(r"<think>.*?</think>", "", texto or "", flags=re.DOTALL).strip()
+    texto = re.sub(r"^```(?:json)?\s*|\s*```$", "", texto)
+    try:
+        return json.loads(texto)
+    except json.JSONDecodeError:
+        inicio, fin = texto.find("{"), texto.rfind("}") + 1
+        if inicio == -1 or fin == 0:
+            raise
+        return json.loads(texto[inicio:fin])
+
+
+def interpretar(texto, esquema):
+    try:
+        datos = extraer_json(texto)
+    except json.JSONDecodeError as e:
+        return None, [f"JSON mal formado: {e}"]
+    return validar(datos, esquema)
+
+
+def _contar(etapa, clave):
+    with _lock:
+        contadores = _stats.setdefault(etapa, {"llamadas": 0, "fallos_formato": 0,
+                                               "reparadas": 0, "fallos_definitivos": 0})
+        contadores[clave] += 1
+    if clave == "fallos_formato":
+        trazas.span_actual().sumar("fallos_formato", 1)
+
+
+def _generacion_fallida(error):
+    """Groq responde 400 json_validate_failed cuando el modelo no produce JSON."""
+    respuesta = getattr(error, "response", None)
+    if respuesta is None or respuesta.status_code != 400:
+        return None
+    try:
+        detalle = respuesta.json().get("error", {})
+    except ValueError:
+        return None
+    if detalle.get("code") != "json_validate_failed":
+        return None
+    return detalle.get("failed_generation") or ""
+
+
+def _llamar(etapa, prompt, system_prompt, model, temperature, cache, esquema):
+    try:
+        return enrutador.llamar(etapa, prompt, system_prompt=system_prompt, model=model,
+                                temperature=temperature, cache=cache, formato_json=True,
+                                validar=lambda texto: not interpretar(texto, esquema)[1])
+    except requests.HTTPError as e:
+        fallida = _generacion_fallida(e)
+        if fallida is None:
+            raise
+        return fallida
+
+
+def llamar_json(prompt, esquema, etapa, system_prompt, model=None, temperature=0.0):
+    """
+    Llama al proveedor de la etapa en modo JSON y devuelve el diccionario
+    validado contra `esquema`. Lanza SalidaInvalida si ni la respuesta ni su
+    reparación valen. Clasificar y criticar son juicios, no creación: a
+    temperatura 0 el mismo prompt da la misma respuesta y se sirve de la
+    caché de respuestas.
+    """
+    _contar(etapa, "llamadas")
+    respuesta = _llamar(etapa, prompt, system_prompt, model, temperature, etapa, esquema)
+    datos, errores = interpretar(respuesta, esquema)
+    if not errores:
+        return datos
+
+    _contar(etapa, "fallos_formato")
+    log.warning("respuesta JSON inválida, se intenta reparar", extra={"datos": {
+        "etapa": etapa, "errores": errores, "respuesta": huella(respuesta),
+    }})
+
+    campos = ", ".join(f"{n} ({c.tipo.__name__}{'' if c.requerido else ', opcional'})"
+                       for n, c in esquema.items())
+    reparacion = (
+        f"La siguiente respuesta debía ser un único objeto JSON con los campos: {campos}.\n"
+        f"Errores: {'; '.join(errores)}\n\n"
+        f"RESPUESTA:\n{respuesta}\n\n"
+        "Devuelve solo el JSON corregido, sin texto adicional."
+    )
+    respuesta = _llamar(etapa, reparacion, "Corriges JSON. Responde únicamente con JSON válido.",
+                        model, 0.0, None, esquema)
+    datos, errores = interpretar(respuesta, esquema)
+    if not errores:
+        _contar(etapa, "reparadas")
+        return datos
+
+    _contar(etapa, "fallos_formato")
+    _contar(etapa, "fallos_definitivos")
+    log.error("respuesta JSON irreparable", extra={"datos": {
+        "etapa": etapa, "errores": errores, "respuesta": huella(respuesta),
+    }})
+    raise SalidaInvalida(f"{etapa}: {'; '.join(errores)}")
+
+
+def estadisticas():
+    with _lock:
+        return {etapa: dict(c) for etapa, c in _stats.items()}
@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Aseguramos que se pueda importar desde el directorio actual
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import get_config
+import almacen_activos
+import recuperacion
+import utils_llamadas
+import cliente_servicio
+from generar_poema import ejecutar_pipeline_poetico_eventos
+from registro import obtener_logger
+
+SERVICIO_HOST = get_config("SERVICIO_HOST", "127.0.0.1")
+SERVICIO_PUERTO = int(get_config("SERVICIO_PUERTO", "8765"))
+SERVICIO_CONCURRENCIA = int(get_config("SERVICIO_CONCURRENCIA", "4"))
+SERVICIO_ESPERA_S = float(get_config("SERVICIO_ESPERA_S", "60"))
+
+# ============================
+#  SERVICIO RESIDENTE
+# ============================
+#
+# Proceso de larga duración que mantiene caliente lo que cuesta arrancar: SDKs
+# importados, clientes HTTP y de Google, activos, colecciones de Chroma, el
+# modelo de embeddings y las cachés en memoria (contexto, enrutador...).
+# app.py y main.py se conectan a él si SERVICIO_URL está definida (ver
+# cliente_servicio.py).
+#
+#   GET  /salud          estado y tiempo en marcha
+#   GET  /estadisticas   contadores de cachés, enrutador y limitador
+#   POST /poema          parámetros en JSON; responde NDJSON, un evento por
+#                        línea (etapa, token, critica, resultado, error)
+#
+# Cada petición va en su propio hilo; como mucho SERVICIO_CONCURRENCIA
+# pipelines a la vez, el resto espera turno hasta SERVICIO_ESPERA_S y luego
+# recibe 503.
+
+log = obtener_logger("servicio")
+
+_turnos = threading.BoundedSemaphore(SERVICIO_CONCURRENCIA)
+_inicio = time.time()
+
+
+def _serializable(evento):
+    if evento.get("tipo") == "resultado" and isinstance(evento["resultado"].get("imagen"), (bytes, bytearray)):
+        resultado = dict(evento["resultado"])
+        resultado["imagen"] = base64.b64encode(resultado["imagen"]).decode("ascii")
+        return {**evento, "resultado": resultado}
+    return evento
+
+
+class Manejador(BaseHTTPRequestHandler):
+    server_version = "gulag/1"
+
+    def log_message(self, formato, *args):
+        log.info(formato % args, extra={"datos": {"cliente": self.client_address[0]}})
+
+    def _json(self, codigo, datos):
+        cuerpo = json.dumps(datos, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        if self.path == "/salud":
+            self._json(200, {"ok": True, "pid": os.getpid(), "en_marcha_s": round(time.time() - _inicio, 1)})
+        elif self.path == "/estadisticas":
+            self._json(200, cliente_servicio.estadisticas_locales())
+        else:
+            self._json(404, {"error": "ruta desconocida"})
+
+    def do_POST(self):
+        if self.path != "/poema":
+            self._json(404, {"error": "ruta desconocida"})
+            return
+        try:
+            longitud = int(self.headers.get("Content-Length", 0))
+            params = json.loads(self.rfile.read(longitud) or b"{}")
+        except (ValueError, json.JSONDecodeError) as e:
+            self._json(400, {"error": f"JSON inválido: {e}"})
+            return
+        if not params.get("tema"):
+            self._json(400, {"error": "falta 'tema'"})
+            return
+
+        if not _turnos.acquire(timeout=SERVICIO_ESPERA_S):
+            self._json(503, {"error": "servicio ocupado"})
+            return
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+            self.end_headers()
+            try:
+                for evento in ejecutar_pipeline_poetico_eventos(params):
+                    self._linea(_serializable(evento))
+            except (BrokenPipeError, ConnectionResetError):
+                log.warning("cliente desconectado", extra={"datos": {"tema": params.get("tema")}})
+            except Exception as e:
+                log.error("error en el pipeline", exc_info=True)
+                self._linea({"tipo": "error", "error": f"{type(e).__name__}: {e}"})
+        finally:
+            _turnos.release()
+
+    def _linea(self, evento):
+        self.wfile.write((json.dumps(evento, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+
+def calentar():
+    """Paga una sola vez por proceso lo que antes se pagaba en cada ejecución."""
+    t0 = time.perf_counter()
+    almacen_activos.precargar()
+    recuperacion.calentar()
+    utils_llamadas.obtener_cliente_google()
+    log.info("servicio caliente", extra={"datos": {"duracion_s": round(time.perf_counter() - t0, 3)}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio residente del pipeline poético.")
+    parser.add_argument("--host", default=SERVICIO_HOST)
+    parser.add_argument("--puerto", type=int, default=SERVICIO_PUERTO)
+    args = parser.parse_args()
+
+    calentar()
+    servidor = ThreadingHTTPServer((args.host, args.puerto), Manejador)
+    servidor.daemon_threads = True
+    print(f"=== Servicio escuchando en http://{args.host}:{args.puerto} ===")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import itertools
+
+import numpy as np
+
+from calcular_pesos import UMBRAL_BUSQUEDA
+
+# ============================
+#  TABLA DE PESOS VECTORIZADA
+# ============================
+#
+# Las reglas de calcular_pesos expresadas como datos: un vector base por
+# categoría y, para cada campo del perfil, un delta por valor. Compiladas en
+# arrays de NumPy permiten puntuar miles de perfiles en una sola llamada
+# (lotes, exploración offline de cuándo γ activa Brave). calcular_pesos sigue
+# siendo la implementación de referencia; tests/test_tabla_pesos.py comprueba
+# que ambas coinciden en todas las combinaciones de valores (`rejilla`).
+
+COMPONENTES = ("α", "β", "γ", "δ", "ε")
+
+BASE = {
+    "intimo":       (0.45, 0.25, 0.05, 0.15, 0.10),
+    "conceptual":   (0.40, 0.30, 0.05, 0.15, 0.10),
+    "experimental": (0.35, 0.25, 0.05, 0.20, 0.15),
+}
+BASE_POR_DEFECTO = (0.40, 0.25, 0.10, 0.15, 0.10)
+
+# Ajustes en el mismo orden que calcular_pesos (así las sumas coinciden bit a
+# bit). (campo, {valor: {componente: delta}}) compara por igualdad;
+# (campo, subcadena, {componente: delta}) busca la subcadena en minúsculas.
+AJUSTES = (
+    ("nivel_abstraccion", {"alta": {"β": 0.05, "γ": -0.05}, "baja": {"α": 0.05}}),
+    ("grado_factualidad", {"alta": {"γ": 0.10}, "baja": {"γ": -0.05, "α": 0.05}}),
+    ("densidad_metaforica", {"alta": {"α": 0.05, "β": 0.05}, "baja": {"α": -0.05}}),
+    ("intencion_poetica", {"reflexiva": {"β": 0.05}, "disruptiva": {"α": 0.05, "β": -0.05}}),
+    ("estilo_extra", "ligero", {"α": 0.05}),
+    ("estilo_extra", "lírico", {"β": 0.05}),
+    ("restricciones", "sin tecnicismos", {"γ": -0.05}),
+    ("extension", {"corta": {"α": 0.05, "γ": -0.05}, "larga": {"β": 0.05}}),
+)
+
+_GAMMA = COMPONENTES.index("γ")
+
+
+def _vector(deltas):
+    return [deltas.get(c, 0.0) for c in COMPONENTES]
+
+
+class TablaPesos:
+    """
+    Reglas compiladas. Los campos por valor quedan como un diccionario
+    valor -> índice y una matriz (valores + 1, 5) cuya última fila (valor
+    desconocido) es cero; las categorías, igual pero con la base por defecto.
+    """
+
+    def __init__(self):
+        self.categorias = {v: i for i, v in enumerate(BASE)}
+        self.base = np.array([*BASE.values(), BASE_POR_DEFECTO], dtype=np.float64)
+
+        self.indices, self.pasos, self.campos = {}, [], ["categoria"]
+        for regla in AJUSTES:
+            if len(regla) == 2:
+                campo, valores = regla
+                self.indices[campo] = {v: i for i, v in enumerate(valores)}
+                deltas = np.array([*map(_vector, valores.values()), _vector({})], dtype=np.float64)
+                self.pasos.append((campo, None, deltas))
+            else:
+                campo, texto, deltas = regla
+                self.pasos.append((campo, texto, np.array(_vector(deltas), dtype=np.float64)))
+            if campo not in self.campos:
+                self.campos.append(campo)
+
+    def codificar(self, perfiles):
+        """Índices enteros por campo y, para los de texto, (índice, textos distintos en minúsculas)."""
+        n = len(perfiles)
+        codigos = {"categoria": np.fromiter(
+            (self.categorias.get(p.get("categoria"), len(self.categorias)) for p in perfiles),
+            dtype=np.intp, count=n,
+        )}
+        for campo, texto, _ in self.pasos:
+            if campo in codigos:
+                continue
+            if texto is None:
+                indices = self.indices[campo]
+                codigos[campo] = np.fromiter((indices.get(p.get(campo), len(indices)) for p in perfiles),
+                                             dtype=np.intp, count=n)
+            else:
+                # Los textos se repiten mucho: se pasan a minúsculas solo los distintos
+                distintos = {}
+                inversa = np.fromiter((distintos.setdefault(p.get(campo) or "", len(distintos)) for p in perfiles),
+                                      dtype=np.intp, count=n)
+                codigos[campo] = (inversa, [t.lower() for t in distintos])
+        return codigos
+
+    def puntuar(self, codigos):
+        """Matriz (n, 5) de pesos normalizados a partir de `codificar`."""
+        pesos = self.base[codigos["categoria"]]
+        for campo, texto, deltas in self.pasos:
+            if texto is None:
+                pesos = pesos + deltas[codigos[campo]]
+            else:
+                inversa, distintos = codigos[campo]
+                coincide = np.array([texto in t for t in distintos], dtype=bool)[inversa]
+                pesos = np.where(coincide[:, None], pesos + deltas, pesos)
+
+        pesos[:, _GAMMA] = np.maximum(pesos[:, _GAMMA], 0)
+        total = pesos[:, 0]
+        for i in range(1, len(COMPONENTES)):
+            total = total + pesos[:, i]
+        total = total[:, None]
+        return np.divide(pesos, total, out=pesos.copy(), where=total != 0)
+
+
+_tabla = None
+
+
+def obtener_tabla():
+    global _tabla
+    if _tabla is None:
+        _tabla = TablaPesos()
+    return _tabla
+
+
+def calcular_pesos_lote(perfiles):
+    """Pesos de muchos perfiles a la vez: matriz (n, 5) en el orden de COMPONENTES."""
+    tabla = obtener_tabla()
+    # El espacio de perfiles es pequeño: se codifican y puntúan solo los distintos
+    distintos = {}
+    inversa = np.fromiter(
+        (distintos.setdefault(tuple(map(p.get, tabla.campos)), len(distintos)) for p in perfiles),
+        dtype=np.intp, count=len(perfiles),
+    )
+    unicos = [dict(zip(tabla.campos, clave)) for clave in distintos]
+    return tabla.puntuar(tabla.codificar(unicos))[inversa]
+
+
+def como_diccionarios(matriz):
+    return [dict(zip(COMPONENTES, map(float, fila))) for fila in matriz]
+
+
+def rejilla():
+    """
+    Perfiles con todas las combinaciones de valores que distinguen las reglas:
+    cada valor conocido más uno desconocido y None; en los campos de texto,
+    vacío, uno que no activa nada, cada subcadena (tal cual y en mayúsculas) y
+    todas juntas. Se deriva de BASE y AJUSTES, así que una regla nueva entra
+    sola en la comprobación.
+    """
+    campos = {"categoria": [*BASE, "otro", None]}
+    textos = {}
+    for regla in AJUSTES:
+        if len(regla) == 2:
+            campo, valores = regla
+            campos[campo] = [*valores, "media", None]
+        else:
+            textos.setdefault(regla[0], []).append(regla[1])
+    for campo, subcadenas in textos.items():
+        campos[campo] = ["", "barroco", " y ".join(subcadenas).capitalize(),
+                         *subcadenas, *(s.upper() for s in subcadenas)]
+    nombres = list(campos)
+    for valores in itertools.product(*campos.values()):
+        yield dict(zip(nombres, valores))
+
+
+def activa_busqueda(matriz):
+    """Máscara de los perfiles cuya γ supera el umbral que lanza Brave."""
+    return matriz[:, _GAMMA] > UMBRAL_BUSQUEDA
@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import busqueda
+import limitador
+
+
+class Respuesta:
+    headers = {}
+    metricas_llamada = None
+
+    def __init__(self, estado, datos):
+        self.status_code = estado
+        self._datos = datos
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}", response=self)
+
+    def json(self):
+        return self._datos
+
+
+@pytest.fixture
+def brave(monkeypatch):
+    busqueda.invalidar()
+    respuestas = []
+    monkeypatch.setattr(limitador, "solicitar", lambda *args, **kwargs: respuestas.pop(0))
+    yield respuestas
+    busqueda.invalidar()
+
+
+def test_un_error_de_brave_no_detiene_el_poema_ni_se_cachea(brave):
+    brave.append(Respuesta(401, {"error": "clave inválida"}))
+    assert busqueda.buscar("el mar") == []
+
+    brave.append(Respuesta(200, {"web": {"results": [{"description": "El mar Mediterráneo"}]}}))
+    assert busqueda.buscar("El Mar ") == ["El mar Mediterráneo"]
+    assert brave == []
+
+
+def test_resultados_correctos_se_sirven_de_la_cache(brave):
+    brave.append(Respuesta(200, {"web": {"results": [{"description": "Olas"}]}}))
+    assert busqueda.buscar("olas") == ["Olas"]
+    assert busqueda.buscar("Olas") == ["Olas"]
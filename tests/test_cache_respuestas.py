@@ -0,0 +1,65 @@
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import enrutador
+import cache_respuestas
+import utils_llamadas
+from salida_estructurada import llamar_json, ESQUEMA_CLASIFICACION
+
+CLASIFICACION = {
+    "categoria": "intimo", "tono_emocional": "sereno", "nivel_abstraccion": "media",
+    "grado_factualidad": "baja", "densidad_metaforica": "media", "intencion_poetica": "evocativa",
+}
+
+
+class Respuesta:
+    status_code = 200
+    headers = {}
+    metricas_llamada = None
+
+    def __init__(self, contenido):
+        self._datos = {"choices": [{"message": {"content": contenido}}], "usage": {}}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._datos
+
+
+@pytest.fixture
+def peticiones(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache_respuestas, "CACHE_LLM_RUTA", str(tmp_path / "respuestas.sqlite3"))
+    monkeypatch.setattr(cache_respuestas, "CACHE_LLM_ACTIVA", True)
+    monkeypatch.setattr(cache_respuestas, "_conexion", None)
+    monkeypatch.setattr(enrutador, "enrutador", enrutador.Enrutador(
+        claves={"groq": "clave", "google": None, "deepseek": None}, cobertura=False))
+
+    enviadas = []
+
+    def solicitar(proveedor, metodo, url, **kwargs):
+        enviadas.append(kwargs["json"])
+        return Respuesta(json.dumps(CLASIFICACION))
+
+    monkeypatch.setattr(utils_llamadas.limitador, "solicitar", solicitar)
+    return enviadas
+
+
+def test_segunda_llamada_identica_sale_de_la_cache(peticiones):
+    primera = llamar_json("Tema: el mar", ESQUEMA_CLASIFICACION, "clasificacion", system_prompt="Analista")
+    segunda = llamar_json("Tema: el mar", ESQUEMA_CLASIFICACION, "clasificacion", system_prompt="Analista")
+    assert primera == segunda == CLASIFICACION
+    assert len(peticiones) == 1
+    assert peticiones[0]["temperature"] == 0
+
+
+def test_con_muestreo_no_se_cachea(peticiones):
+    for _ in range(2):
+        llamar_json("Tema: el mar", ESQUEMA_CLASIFICACION, "clasificacion", system_prompt="Analista",
+                    temperature=0.9)
+    assert len(peticiones) == 2
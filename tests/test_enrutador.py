@@ -0,0 +1,34 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import enrutador
+
+
+@pytest.fixture
+def router(monkeypatch):
+    def texto_stream(proveedor, prompt, system_prompt=None, **kwargs):
+        for fragmento in ("uno ", "dos ", "tres"):
+            yield fragmento
+
+    monkeypatch.setattr(enrutador, "texto_stream", texto_stream)
+    return enrutador.Enrutador(claves={"groq": "clave", "google": None, "deepseek": None}, cobertura=False)
+
+
+def test_cerrar_un_stream_libera_la_sonda(router):
+    circuito = router._circuitos["groq"]
+    circuito.estado = "abierto"
+    circuito.abierto_hasta = time.monotonic() - 1
+
+    fragmentos = router.llamar_stream("reescritura", "prompt")
+    assert next(fragmentos) == "uno "
+    assert circuito.sonda_en_curso
+    fragmentos.close()
+
+    assert not circuito.sonda_en_curso
+    assert circuito.estado == "cerrado"
+    assert router.candidatos("reescritura") == ["groq"]
@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import limitador
+from limitador import LimitadorProveedor
+
+
+class ErrorProveedor(Exception):
+    def __init__(self, code, retry_after=None):
+        super().__init__(f"{code}")
+        self.code = code
+        self.retry_after = retry_after
+
+
+def clasificar(error):
+    return error.code, error.retry_after
+
+
+@pytest.fixture
+def proveedor(monkeypatch):
+    monkeypatch.setattr(limitador, "backoff", lambda intento: 0.0)
+    monkeypatch.setitem(limitador._limitadores, "prueba", LimitadorProveedor("prueba", rpm=6000, rafaga=10))
+    return limitador._limitadores["prueba"]
+
+
+def test_turnos_en_orden_de_llegada():
+    cubo = LimitadorProveedor("prueba", rpm=600, rafaga=1)   # un token cada 0,1 s
+    cubo.adquirir()
+    orden, hilos = [], []
+    for i in range(5):
+        hilo = threading.Thread(target=lambda i=i: (cubo.adquirir(), orden.append(i)))
+        hilo.start()
+        hilos.append(hilo)
+        # Cada hilo se pone a la cola antes de lanzar el siguiente
+        while cubo.estadisticas["en_cola"] < i + 1:
+            time.sleep(0.001)
+    for hilo in hilos:
+        hilo.join(timeout=5)
+    assert orden == [0, 1, 2, 3, 4]
+
+
+def test_rafaga_sin_espera_y_despues_al_ritmo_del_cubo():
+    cubo = LimitadorProveedor("prueba", rpm=600, rafaga=3)
+    esperas = [cubo.adquirir() for _ in range(4)]
+    assert max(esperas[:3]) < 0.02
+    assert 0.05 < esperas[3] < 0.3
+
+
+def test_bloquear_retiene_a_toda_la_cola():
+    cubo = LimitadorProveedor("prueba", rpm=6000, rafaga=10)
+    cubo.bloquear(0.3)
+    esperas = []
+    hilos = [threading.Thread(target=lambda: esperas.append(cubo.adquirir())) for _ in range(3)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(timeout=5)
+    assert len(esperas) == 3
+    assert min(esperas) >= 0.25
+
+
+def test_retry_after_de_un_429_bloquea_al_proveedor(proveedor):
+    respuestas = [ErrorProveedor(429, "0.3s"), "ok"]
+
+    def funcion():
+        respuesta = respuestas.pop(0)
+        if isinstance(respuesta, Exception):
+            raise respuesta
+        return respuesta
+
+    inicio = time.monotonic()
+    resultado, metricas = limitador.ejecutar("prueba", funcion, clasificar)
+    assert resultado == "ok"
+    assert time.monotonic() - inicio >= 0.25
+    assert metricas["reintentos"] == 1 and metricas["errores_429"] == 1
+    assert metricas["espera_429_s"] >= 0.3
+    # Otra petición del mismo proveedor también queda bloqueada hasta el plazo
+    assert proveedor.bloqueado_hasta > inicio
+    assert proveedor.estadisticas["errores_429"] == 1
+    assert proveedor.estadisticas["reintentos"] == 1
+
+
+def test_no_reintenta_errores_del_cliente(proveedor):
+    llamadas = []
+
+    def funcion():
+        llamadas.append(1)
+        raise ErrorProveedor(400)
+
+    with pytest.raises(ErrorProveedor):
+        limitador.ejecutar("prueba", funcion, clasificar)
+    assert len(llamadas) == 1
+
+
+def test_reintenta_5xx_y_errores_de_red_hasta_agotar_intentos(proveedor):
+    errores = [ErrorProveedor(503), TimeoutError(), ErrorProveedor(502)]
+
+    def funcion():
+        raise errores.pop(0)
+
+    with pytest.raises(ErrorProveedor):
+        limitador.ejecutar("prueba", funcion, clasificar, intentos=3, errores_red=(TimeoutError,))
+    assert errores == []
+    assert proveedor.estadisticas["reintentos"] == 2
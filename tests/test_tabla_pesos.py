@@ -0,0 +1,26 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calcular_pesos import calcular_pesos
+from tabla_pesos import COMPONENTES, calcular_pesos_lote, rejilla
+
+
+def test_lote_coincide_con_la_referencia_en_toda_la_rejilla():
+    perfiles = list(rejilla())
+    matriz = calcular_pesos_lote(perfiles)
+    referencia = np.array([[calcular_pesos(p)[c] for c in COMPONENTES] for p in perfiles])
+    diferencia = np.abs(matriz - referencia).max(axis=1)
+    peor = int(diferencia.argmax())
+    assert diferencia[peor] <= 1e-12, f"diferencia {diferencia[peor]:.3g} en {perfiles[peor]}"
+
+
+def test_la_rejilla_cubre_cada_regla():
+    perfiles = list(rejilla())
+    assert any("ligero" in (p["estilo_extra"] or "").lower() and "lírico" in p["estilo_extra"].lower()
+               for p in perfiles)
+    assert {"alta", "baja", "media", None} <= {p["grado_factualidad"] for p in perfiles}
+    np.testing.assert_allclose(calcular_pesos_lote(perfiles[:100]).sum(axis=1), 1.0)
@@ -0,0 +1,211 @@
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from config import get_config
+from registro import obtener_logger
+
+# ============================
+#  TRAZAS Y MÉTRICAS
+# ============================
+#
+# Spans anidados (contextvars) con tiempo de pared y atributos. Cada ejecución
+# del pipeline abre una traza; las etapas y las llamadas a LLM abren spans
+# hijos. Fuera de una traza, span() no registra nada.
+# Si TRAZAS_RUTA está definida, cada traza se añade a ese archivo como una
+# línea JSON en formato OTLP (compatible con OpenTelemetry).
+
+TRAZAS_RUTA = get_config("TRAZAS_RUTA")
+SERVICIO = "gulag_generator_2"
+
+log = obtener_logger("trazas")
+
+_traza_actual = contextvars.ContextVar("traza_actual", default=None)
+_span_actual = contextvars.ContextVar("span_actual", default=None)
+_lock_exportar = threading.Lock()
+
+
+class Span:
+    def __init__(self, nombre, traza_id, padre_id, atributos):
+        self.nombre = nombre
+        self.traza_id = traza_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.padre_id = padre_id
+        self.atributos = {}
+        self.fijar(**atributos)
+        self.inicio_ns = time.time_ns()
+        self.fin_ns = None
+        self._t0 = time.perf_counter()
+        self.duracion_s = None
+
+    def fijar(self, **atributos):
+        self.atributos.update({k: v for k, v in atributos.items() if v is not None})
+
+    def sumar(self, clave, valor):
+        self.atributos[clave] = self.atributos.get(clave, 0) + valor
+
+    def cerrar(self):
+        self.fin_ns = time.time_ns()
+        self.duracion_s = time.perf_counter() - self._t0
+
+
+class _SpanNulo:
+    def fijar(self, **atributos):
+        pass
+
+    def sumar(self, clave, valor):
+        pass
+
+
+SPAN_NULO = _SpanNulo()
+
+
+class Traza:
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.traza_id = uuid.uuid4().hex
+        self.raiz = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def añadir(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def metricas(self):
+        """Resumen por etapa y por llamada, listo para adjuntar al resultado."""
+        with self._lock:
+            spans = list(self.spans)
+        por_id = {s.span_id: s for s in spans}
+
+        def etapa_de(span):
+            padre = por_id.get(span.padre_id)
+            while padre is not None:
+                if padre.nombre.startswith("etapa."):
+                    return padre.nombre[len("etapa."):]
+                padre = por_id.get(padre.padre_id)
+            return None
+
+        etapas = {}
+        llamadas = []
+        for s in spans:
+            if s.nombre.startswith("etapa."):
+                nombre = s.nombre[len("etapa."):]
+                etapas[nombre] = round(etapas.get(nombre, 0.0) + s.duracion_s, 3)
+            elif s.nombre.startswith("llm.") or s.nombre.startswith("http."):
+                llamadas.append({"nombre": s.nombre, "etapa": etapa_de(s),
+                                 "duracion_s": round(s.duracion_s, 3), **s.atributos})
+
+        total = time.perf_counter() - self.raiz._t0 if self.raiz else None
+        return {
+            "traza_id": self.traza_id,
+            "duracion_total_s": round(total, 3) if total is not None else None,
+            "etapas": etapas,
+            "llamadas": llamadas,
+            "tokens_entrada": sum(l.get("tokens_entrada", 0) for l in llamadas),
+            "tokens_salida": sum(l.get("tokens_salida", 0) for l in llamadas),
+            "reintentos": sum(l.get("reintentos", 0) for l in llamadas),
+            "espera_429_s": round(sum(l.get("espera_429_s", 0.0) for l in llamadas), 3),
+            "fallos_formato": sum(s.atributos.get("fallos_formato", 0) for s in spans),
+        }
+
+    def a_otlp(self):
+        def valor(v):
+            if isinstance(v, bool):
+                return {"boolValue": v}
+            if isinstance(v, int):
+                return {"intValue": str(v)}
+            if isinstance(v, float):
+                return {"doubleValue": v}
+            return {"stringValue": str(v)}
+
+        with self._lock:
+            spans = list(self.spans)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICIO}}]},
+            "scopeSpans": [{
+                "scope": {"name": "trazas"},
+                "spans": [{
+                    "traceId": self.traza_id,
+                    "spanId": s.span_id,
+                    "parentSpanId": s.padre_id or "",
+                    "name": s.nombre,
+                    "startTimeUnixNano": str(s.inicio_ns),
+                    "endTimeUnixNano": str(s.fin_ns),
+                    "attributes": [{"key": k, "value": valor(v)} for k, v in s.atributos.items()],
+                } for s in spans],
+            }],
+        }]}
+
+    def exportar(self, ruta):
+        linea = json.dumps(self.a_otlp(), ensure_ascii=False)
+        with _lock_exportar:
+            with open(ruta, "a", encoding="utf-8") as f:
+                f.write(linea + "\n")
+
+
+def _restaurar(var, token, valor_previo):
+    try:
+        var.reset(token)
+    except (ValueError, RuntimeError):
+        # Generador cerrado desde otro contexto: basta con reponer el valor previo
+        var.set(valor_previo)
+
+
+@contextmanager
+def iniciar_traza(nombre, **atributos):
+    traza = Traza(nombre)
+    previa = _traza_actual.get()
+    token = _traza_actual.set(traza)
+    try:
+        with span(nombre, **atributos) as raiz:
+            traza.raiz = raiz
+            yield traza
+    finally:
+        _restaurar(_traza_actual, token, previa)
+        if TRAZAS_RUTA:
+            try:
+                traza.exportar(TRAZAS_RUTA)
+            except OSError as e:
+                log.error("no se pudo exportar la traza", extra={"datos": {"ruta": TRAZAS_RUTA, "error": str(e)}})
+
+
+@contextmanager
+def span(nombre, **atributos):
+    traza = _traza_actual.get()
+    if traza is None:
+        yield SPAN_NULO
+        return
+
+    padre = _span_actual.get()
+    s = Span(nombre, traza.traza_id, padre.span_id if padre else None, atributos)
+    token = _span_actual.set(s)
+    try:
+        yield s
+    except GeneratorExit:
+        raise
+    except BaseException as e:
+        s.fijar(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _restaurar(_span_actual, token, padre)
+        s.cerrar()
+        traza.añadir(s)
+
+
+def span_actual():
+    return _span_actual.get() or SPAN_NULO
+
+
+def registrar_http(span, metricas_llamada):
+    """
+    Suma al span las métricas que el limitador adjunta a la respuesta (varias
+    llamadas en el mismo span, p. ej. un reenvío sin caché, se acumulan).
+    """
+    if metricas_llamada:
+        for clave, valor in metricas_llamada.items():
+            if clave != "proveedor":
+                span.sumar(clave, valor)
@@ -1,25 +1,48 @@
 from config import (
     GROQ_API_KEY, GROQ_MODEL, REWORK_RETRIES,
-    GOOGLE_MODEL, GOOGLE_API_KEY
+    GOOGLE_MODEL, GOOGLE_API_KEY, GOOGLE_BASE_URL,
+    DEEPSEEK_API_KEY, DEEPSEEK_MODEL,
+    GROQ_BASE_URL, DEEPSEEK_BASE_URL
 )
 
-import requests
+import limitador
+import cache_respuestas
+import cache_contexto
+import trazas
+import logging
+from registro import obtener_logger, huella
 import base64
-import google.genai as genai
+import threading
 
 import unicodedata
+import itertools
 import random
 import json
 import os
 
 
+log = obtener_logger("utils_llamadas")
+
+
 # ============================
 #  CLIENTE GOOGLE (SDK NUEVO)
 # ============================
 
-google_client = None
-if GOOGLE_API_KEY:
-    google_client = genai.Client(api_key=GOOGLE_API_KEY)
+# google.genai tarda ~0,7 s en importarse: el SDK y el cliente se crean en la
+# primera llamada a Google, no al importar este módulo.
+_cliente_google = None
+_lock_cliente = threading.Lock()
+
+
+def obtener_cliente_google():
+    global _cliente_google
+    if _cliente_google is None and GOOGLE_API_KEY:
+        with _lock_cliente:
+            if _cliente_google is None:
+                import google.genai as genai
+                opciones = {"base_url": GOOGLE_BASE_URL} if GOOGLE_BASE_URL else None
+                _cliente_google = genai.Client(api_key=GOOGLE_API_KEY, http_options=opciones)
+    return _cliente_google
 
 
 
@@ -34,50 +57,163 @@ def limpiar_prompt(texto):
 
 
 # ============================
-#  LLAMADA A GROQ
+#  API DE CHAT ESTILO OPENAI (GROQ, DEEPSEEK)
 # ============================
 
-def llamar_groq(prompt, system_prompt="Eres un asistente experto en poesía generativa.", model=None):
-    url = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_URL = f"{GROQ_BASE_URL}/chat/completions"
+DEEPSEEK_URL = f"{DEEPSEEK_BASE_URL}/chat/completions"
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {GROQ_API_KEY}"
-    }
 
+def _payload_chat(modelo, prompt, system_prompt, temperature, formato_json=False, stream=False):
+    mensajes = [{"role": "user", "content": prompt}]
+    if system_prompt:
+        mensajes.insert(0, {"role": "system", "content": system_prompt})
     payload = {
-        "model": model or GROQ_MODEL,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.9,
+        "model": modelo,
+        "messages": mensajes,
+        "temperature": temperature,
         "max_tokens": 1600
     }
+    if formato_json:
+        payload["response_format"] = {"type": "json_object"}
+    if stream:
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+    return payload
 
-    print("=== DEBUG (GROQ) ===")
-    print("MODEL:", payload["model"])
-    print("API KEY:", "OK" if GROQ_API_KEY else "MISSING")
-    print(f"--- SYSTEM PROMPT ---\n{system_prompt}\n---------------------")
-    print(f"--- USER PROMPT ---\n{prompt}\n-------------------")
-    print("PAYLOAD:", payload)
 
-    import time
-    max_retries = REWORK_RETRIES
+def _chat(proveedor, url, api_key, payload, system_prompt, prompt, cache=None, validar=None):
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(f"llamada {proveedor}", extra={"datos": {
+            "modelo": payload["model"], "api_key": bool(api_key), "temperatura": payload["temperature"],
+            "system_prompt": huella(system_prompt), "prompt": huella(prompt),
+        }})
+
+    with trazas.span(f"llm.{proveedor}", proveedor=proveedor, modelo=payload["model"]) as span:
+        clave_cache = None
+        if cache_respuestas.habilitada(cache, payload["temperature"]):
+            # El modo JSON cambia la respuesta: va en su propio espacio de claves
+            espacio = f"{proveedor}-json" if "response_format" in payload else proveedor
+            clave_cache = cache_respuestas.clave(espacio, payload["model"], system_prompt, prompt,
+                                                 payload["temperature"])
+            cacheada = cache_respuestas.obtener(clave_cache)
+            if cacheada is not None:
+                span.fijar(cache=True)
+                return cacheada
+
+        # Cola, backoff y reintentos (429, 5xx, timeouts) los gestiona el limitador
+        response = limitador.solicitar(proveedor, "POST", url, intentos=REWORK_RETRIES, headers=headers, json=payload)
+        trazas.registrar_http(span, getattr(response, "metricas_llamada", None))
+        response.raise_for_status()
+        data = response.json()
+        contenido = data["choices"][0]["message"]["content"]
+
+        uso = data.get("usage") or {}
+        span.fijar(tokens_entrada=uso.get("prompt_tokens"), tokens_salida=uso.get("completion_tokens"))
+
+        if clave_cache and (validar is None or validar(contenido)):
+            cache_respuestas.guardar(clave_cache, contenido)
+        return contenido
 
-    for intento in range(max_retries):
-        response = requests.post(url, headers=headers, json=payload)
 
-        if response.status_code == 429:
-            print("Rate limit alcanzado. Esperando 10 segundos antes de reintentar...")
-            time.sleep(10)
-            continue
+def _chat_stream(proveedor, url, api_key, payload, system_prompt, prompt):
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
 
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(f"llamada {proveedor} (stream)", extra={"datos": {
+            "modelo": payload["model"], "api_key": bool(api_key), "temperatura": payload["temperature"],
+            "system_prompt": huella(system_prompt), "prompt": huella(prompt),
+        }})
+
+    with trazas.span(f"llm.{proveedor}", proveedor=proveedor, modelo=payload["model"], stream=True) as span:
+        response = limitador.solicitar(proveedor, "POST", url, intentos=REWORK_RETRIES, headers=headers, json=payload, stream=True)
+        trazas.registrar_http(span, getattr(response, "metricas_llamada", None))
         response.raise_for_status()
-        data = response.json()
-        return data["choices"][0]["message"]["content"]
 
-    raise Exception("Demasiados intentos fallidos por rate limit (429)")
+        try:
+            for linea in response.iter_lines():
+                # El SSE llega en UTF-8 aunque la cabecera no declare charset
+                linea = linea.decode("utf-8").strip()
+                if not linea.startswith("data:"):
+                    continue
+                datos = linea[len("data:"):].strip()
+                if datos == "[DONE]":
+                    break
+                evento = json.loads(datos)
+                # El uso llega en el último evento (usage, o x_groq.usage en Groq)
+                uso = evento.get("usage") or evento.get("x_groq", {}).get("usage")
+                if uso:
+                    span.fijar(tokens_entrada=uso.get("prompt_tokens"), tokens_salida=uso.get("completion_tokens"))
+                if not evento.get("choices"):
+                    continue
+                delta = evento["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+        finally:
+            response.close()
+
+
+
+# ============================
+#  LLAMADA A GROQ
+# ============================
+
+def llamar_groq(prompt, system_prompt="Eres un asistente experto en poesía generativa.", model=None,
+                temperature=0.9, cache=None, formato_json=False, validar=None):
+    """
+    `cache` es el nombre de la etapa que llama; si se indica, la etapa no es
+    creativa y la temperatura es 0, la respuesta se guarda/lee de la caché en
+    disco (solo si `validar(contenido)` es cierto, cuando se indica). `formato_json` activa
+    el modo JSON del proveedor.
+    """
+    payload = _payload_chat(model or GROQ_MODEL, prompt, system_prompt, temperature, formato_json)
+    return _chat("groq", GROQ_URL, GROQ_API_KEY, payload, system_prompt, prompt, cache, validar)
+
+
+
+def llamar_groq_stream(prompt, system_prompt="Eres un asistente experto en poesía generativa.", model=None,
+                       temperature=0.9):
+    """
+    Variante en streaming (SSE estilo OpenAI): genera los fragmentos de texto
+    a medida que llegan.
+    """
+    payload = _payload_chat(model or GROQ_MODEL, prompt, system_prompt, temperature, stream=True)
+    return _chat_stream("groq", GROQ_URL, GROQ_API_KEY, payload, system_prompt, prompt)
+
+
+
+# ============================
+#  LLAMADA A DEEPSEEK
+# ============================
+
+def _clave_deepseek():
+    # generar_datos_iniciales carga config/claves.env después de importar config
+    return DEEPSEEK_API_KEY or os.getenv("DEEPSEEK_API_KEY")
+
+
+def llamar_deepseek(prompt, system_prompt=None, model=None, temperature=0.7, cache=None,
+                    formato_json=False, validar=None):
+    api_key = _clave_deepseek()
+    if not api_key:
+        raise Exception("DeepSeek API Key no configurada")
+    payload = _payload_chat(model or DEEPSEEK_MODEL, prompt, system_prompt, temperature, formato_json)
+    return _chat("deepseek", DEEPSEEK_URL, api_key, payload, system_prompt, prompt, cache, validar)
+
+
+def llamar_deepseek_stream(prompt, system_prompt=None, model=None, temperature=0.7):
+    api_key = _clave_deepseek()
+    if not api_key:
+        raise Exception("DeepSeek API Key no configurada")
+    payload = _payload_chat(model or DEEPSEEK_MODEL, prompt, system_prompt, temperature, stream=True)
+    return _chat_stream("deepseek", DEEPSEEK_URL, api_key, payload, system_prompt, prompt)
 
 
 
@@ -85,32 +221,205 @@ def llamar_groq(prompt, system_prompt="Eres un asistente experto en poesía gene
 #  LLAMADA A GOOGLE (TEXTO)
 # ============================
 
-def llamar_google(prompt, system_prompt=None, model=None):
+def registrar_uso_google(span, response):
+    uso = getattr(response, "usage_metadata", None)
+    if uso is not None:
+        span.fijar(tokens_entrada=uso.prompt_token_count, tokens_salida=uso.candidates_token_count,
+                   tokens_cacheados=getattr(uso, "cached_content_token_count", None))
+
+
+def _config_google(**opciones):
+    opciones = {k: v for k, v in opciones.items() if v is not None}
+    if not opciones:
+        return None
+    from google.genai import types
+    return types.GenerateContentConfig(**opciones)
+
+
+def _cache_caducada(error):
+    """
+    True si el SDK indica que la caché de contexto ya no existe o expiró. Los
+    429, timeouts y 5xx no cuentan: reenviar el prefijo completo solo
+    duplicaría llamadas con el proveedor saturado.
+    """
+    from google.genai import errors
+    if not isinstance(error, errors.ClientError):
+        return False
+    if error.code == 404:
+        return True
+    mensaje = str(error.message or error).lower()
+    return error.code in (400, 403) and "cache" in mensaje and (
+        "expire" in mensaje or "not found" in mensaje or "not exist" in mensaje
+    )
+
+
+def _estado_google(error):
+    """(estado HTTP, Retry-After) de un error del SDK de Google, para el limitador."""
+    codigo = getattr(error, "code", None)
+    if not isinstance(codigo, int):
+        return None, None
+    cabeceras = getattr(getattr(error, "response", None), "headers", None)
+    retry_after = cabeceras.get("retry-after") if cabeceras is not None else None
+    # Sin cabecera, el 429 de Gemini trae el plazo en google.rpc.RetryInfo
+    detalles = error.details.get("error", {}).get("details", []) if isinstance(error.details, dict) else []
+    for detalle in detalles:
+        if retry_after is None and isinstance(detalle, dict) and "retryDelay" in detalle:
+            retry_after = detalle["retryDelay"]
+    return codigo, retry_after
+
+
+def _llamada_google(span, funcion):
+    """
+    Pasa una llamada del SDK de Google por la cola, backoff y reintentos del
+    limitador y deja sus métricas en `span`, como las de Groq y Brave.
+    """
+    import httpx
+    resultado, metricas = limitador.ejecutar("google", funcion, _estado_google, intentos=REWORK_RETRIES,
+                                             errores_red=(httpx.TimeoutException, httpx.NetworkError))
+    trazas.registrar_http(span, metricas)
+    return resultado
+
+
+def _generar_google(google_client, span, **kwargs):
+    return _llamada_google(span, lambda: google_client.models.generate_content(**kwargs))
+
+
+def _stream_google(google_client, span, **kwargs):
+    """
+    Abre generate_content_stream bajo el limitador. Se espera al primer chunk
+    dentro del reintento (ahí llegan los 429); los errores a mitad del stream
+    se propagan sin reintentar.
+    """
+    def abrir():
+        chunks = iter(google_client.models.generate_content_stream(**kwargs))
+        primero = next(chunks, None)
+        return chunks if primero is None else itertools.chain([primero], chunks)
+    return _llamada_google(span, abrir)
+
+
+def _preparar_google(prompt, system_prompt, prefijo, modelo, usar_cache=True, **opciones):
+    """
+    Devuelve (contents, config, nombre_cache). Si hay `prefijo` y existe una
+    caché de contexto para él, solo se envía la parte variable; si no, el
+    prefijo va delante del prompt como siempre. `opciones` se pasan a
+    GenerateContentConfig (temperatura, tipo MIME de la respuesta...).
+    """
+    final_prompt = prompt
+    if system_prompt:
+        final_prompt = f"INSTRUCCIONES DEL SISTEMA:\n{system_prompt}\n\n---\n\n{prompt}"
+
+    if not prefijo:
+        return final_prompt, _config_google(**opciones), None
+
+    registro = cache_contexto.obtener_registro(obtener_cliente_google()) if usar_cache else None
+    nombre = registro.obtener(prefijo, modelo) if registro else None
+    if nombre and not cache_contexto.es_local(nombre):
+        return final_prompt, _config_google(cached_content=nombre, **opciones), nombre
+    return f"{prefijo}\n\n{final_prompt}", _config_google(**opciones), nombre
+
+
+def llamar_google(prompt, system_prompt=None, model=None, cache=None, prefijo=None,
+                  temperature=None, formato_json=False, validar=None):
+    """
+    `prefijo` es la parte estable del contexto (el perfil estilístico); se
+    sirve desde la caché de contexto de Gemini cuando es posible. `cache`,
+    `formato_json` y `validar` funcionan como en llamar_groq.
+    """
     if not GOOGLE_API_KEY:
         raise Exception("Google API Key no configurada")
 
+    google_client = obtener_cliente_google()
     if google_client is None:
         raise Exception("Cliente de Google no inicializado")
 
-    print("=== DEBUG (GOOGLE AI STUDIO) ===")
-    print("MODEL:", model or GOOGLE_MODEL)
 
+    modelo = model or GOOGLE_MODEL
+    opciones = {"temperature": temperature,
+                "response_mime_type": "application/json" if formato_json else None}
     try:
-        final_prompt = prompt
-        if system_prompt:
-            final_prompt = f"INSTRUCCIONES DEL SISTEMA:\n{system_prompt}\n\n---\n\n{prompt}"
+        contents, config, nombre_cache = _preparar_google(prompt, system_prompt, prefijo, modelo, **opciones)
+        en_cache = bool(nombre_cache) and not cache_contexto.es_local(nombre_cache)
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("llamada google", extra={"datos": {
+                "modelo": modelo, "prompt": huella(contents), "cache_contexto": nombre_cache,
+            }})
+
+        with trazas.span("llm.google", proveedor="google", modelo=modelo, cache_contexto=nombre_cache) as span:
+            clave_cache = None
+            if cache_respuestas.habilitada(cache, temperature):
+                espacio = "google-json" if formato_json else "google"
+                clave_cache = cache_respuestas.clave(espacio, modelo, system_prompt, f"{prefijo or ''}{prompt}", temperature)
+                cacheada = cache_respuestas.obtener(clave_cache)
+                if cacheada is not None:
+                    span.fijar(cache=True)
+                    return cacheada
+
+            try:
+                response = _generar_google(google_client, span, model=modelo, contents=contents, config=config)
+            except Exception as e:
+                if not en_cache or not _cache_caducada(e):
+                    raise
+                # La caché pudo expirar en el servidor: se olvida y se reenvía el prefijo
+                cache_contexto.obtener_registro(google_client).invalidar(prefijo, modelo)
+                contents, config, _ = _preparar_google(prompt, system_prompt, prefijo, modelo, usar_cache=False, **opciones)
+                span.fijar(cache_contexto_invalidada=True)
+                response = _generar_google(google_client, span, model=modelo, contents=contents, config=config)
+            registrar_uso_google(span, response)
+
+            if clave_cache and response.text and (validar is None or validar(response.text)):
+                cache_respuestas.guardar(clave_cache, response.text)
+            return response.text
+
+    except Exception as e:
+        raise Exception(f"Error llamando a Google AI Studio: {e}") from e
+
+
+
+def llamar_google_stream(prompt, system_prompt=None, model=None, prefijo=None, temperature=None):
+    """Variante en streaming con generate_content_stream."""
+    if not GOOGLE_API_KEY:
+        raise Exception("Google API Key no configurada")
 
-        print(f"--- FULL PROMPT (GOOGLE) ---\n{final_prompt}\n----------------------------")
+    google_client = obtener_cliente_google()
+    if google_client is None:
+        raise Exception("Cliente de Google no inicializado")
 
-        response = google_client.models.generate_content(
-            model=model or GOOGLE_MODEL,
-            contents=final_prompt
-        )
+    modelo = model or GOOGLE_MODEL
+    contents, config, nombre_cache = _preparar_google(prompt, system_prompt, prefijo, modelo, temperature=temperature)
+    en_cache = bool(nombre_cache) and not cache_contexto.es_local(nombre_cache)
 
-        return response.text
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("llamada google (stream)", extra={"datos": {
+            "modelo": modelo, "prompt": huella(contents), "cache_contexto": nombre_cache,
+        }})
+
+    try:
+        with trazas.span("llm.google", proveedor="google", modelo=modelo, stream=True,
+                         cache_contexto=nombre_cache) as span:
+            emitidos = 0
+            try:
+                for chunk in _stream_google(google_client, span, model=modelo, contents=contents, config=config):
+                    # Cada chunk trae el uso acumulado; el último es el total
+                    registrar_uso_google(span, chunk)
+                    if chunk.text:
+                        emitidos += 1
+                        yield chunk.text
+            except Exception as e:
+                if not en_cache or emitidos or not _cache_caducada(e):
+                    raise
+                # La caché pudo expirar en el servidor: se olvida y se reenvía el prefijo
+                cache_contexto.obtener_registro(google_client).invalidar(prefijo, modelo)
+                contents, config, _ = _preparar_google(prompt, system_prompt, prefijo, modelo, usar_cache=False,
+                                                       temperature=temperature)
+                span.fijar(cache_contexto_invalidada=True)
+                for chunk in _stream_google(google_client, span, model=modelo, contents=contents, config=config):
+                    registrar_uso_google(span, chunk)
+                    if chunk.text:
+                        yield chunk.text
 
     except Exception as e:
-        raise Exception(f"Error llamando a Google AI Studio: {e}")
+        raise Exception(f"Error llamando a Google AI Studio: {e}") from e
 
 
 
@@ -129,10 +438,13 @@ def generate_from_poem(poem_text):
         prompt = f'Create a highly artistic, atmospheric, and detailed visual representation inspired by this poem: "{poem_text}". Focus on the emotional resonance and symbolism.'
 
         # 4. Generate Content
-        response = google_client.models.generate_content(
-            model='gemini-2.5-flash-image',
-            contents=prompt
-        )
+        with trazas.span("llm.google", proveedor="google", modelo="gemini-2.5-flash-image") as span:
+            response = _generar_google(
+                obtener_cliente_google(), span,
+                model='gemini-2.5-flash-image',
+                contents=prompt
+            )
+            registrar_uso_google(span, response)
         # 5. Extract and display the image
         for part in response.candidates[0].content.parts:
             if part.inline_data:
@@ -141,7 +453,7 @@ def generate_from_poem(poem_text):
         return None
 
     except Exception as e:
-        raise Exception(f"Error llamando a Google Image API (REST): {e}")
+        raise Exception(f"Error llamando a Google Image API (REST): {e}") from e
 
 def guardar_imagen(base64_data, ruta="imagen.png"):
     with open(ruta, "wb") as f: